@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Timing of ELIME's image conversion and eye detection.
+
+  python Benchmarks.py [-r REPEAT] photo.jpg [photo.jpg ...]
+  python Benchmarks.py [-r REPEAT] --dbRows 1000000
+
+Prints per image times (median of REPEAT runs) for the procedure ELIME used 
+before the move to cv2 ("before") and the current one ("after"). The "before" 
+variants reproduce the old steps with cv2: a tobytes() copy plus a separate 
+colour conversion, and detection with the same control flow but loading the 
+cascade and converting to grayscale again for every single pass.
+
+With --dbRows a database of that many photos gets fetched completely, once 
+with parsed TIMESTAMP dates ("before") and once as integer capture times 
+("after"), both followed by the per day grouping render's fill mode does.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy
+
+# ELIME Project
+import DatabaseFunctions
+import HelperFunctions
+import ImageFunctions
+import OpenCvFunctions
+
+
+def timeIt(function, repeat):
+  """Returns median wall clock seconds of repeat calls of function"""
+  times = []
+  for i in range(repeat):
+    start = time.time()
+    function()
+    times.append(time.time() - start)
+  return sorted(times)[len(times) / 2]
+
+
+def convertPIL2CVBefore(pilImage):
+  """Conversion as done before: copy to string, wrap it, convert colour
+  
+  cv.CvtColor converted the wrapped string in place, cv2 cannot write into 
+  the read-only string and writes a new array instead."""
+  (width, height) = pilImage.size
+  cvImage = numpy.frombuffer(pilImage.tobytes(), dtype=numpy.uint8).reshape((height, width, 3))
+  return cv2.cvtColor(cvImage, cv2.COLOR_RGB2BGR)
+
+
+class LegacyDetectionImage(object):
+  """Stands in for DetectionPyramid: no levels, grayscale conversion on every pass"""
+  
+  def __init__(self, cvImage):
+    self.cvImage = cvImage
+  
+  def level(self, index):
+    return cv2.cvtColor(self.cvImage, cv2.COLOR_BGR2GRAY)
+  
+  def levelIndexForMinSize(self, min_size):
+    return 0
+
+
+def detectEyesBefore(cvImage):
+  """Same control flow as eyeRectsInImage, but cascades loaded and image converted per pass"""
+  savedPyramid = OpenCvFunctions.DetectionPyramid
+  savedLoadCascade = OpenCvFunctions.loadCascade
+  
+  OpenCvFunctions.DetectionPyramid = LegacyDetectionImage
+  OpenCvFunctions.loadCascade = cv2.CascadeClassifier
+  try:
+    return OpenCvFunctions.eyeRectsInImage(cvImage)
+  finally:
+    OpenCvFunctions.DetectionPyramid = savedPyramid
+    OpenCvFunctions.loadCascade = savedLoadCascade
+
+
+def scaledImage(cvImage, maxDimension):
+  """Returns cvImage scaled down like ELIME's add command does"""
+  (width, height) = HelperFunctions.imageSize(cvImage)
+  scale = max(1.0, max(width, height) / float(maxDimension))
+  return cv2.resize(cvImage, (int(width / scale), int(height / scale)))
+
+
+def benchmarkFetch(rows, repeat):
+  """Print times fetching all of rows photos from a database with and without TIMESTAMP parsing"""
+  folder = tempfile.mkdtemp()
+  try:
+    dbPath = os.path.join(folder, 'benchmark.db')
+    DatabaseFunctions.prepareDataBaseTable(dbPath)
+    
+    start = datetime(2014, 1, 1, 8, 0, 0)
+    with DatabaseFunctions.writeTransaction(dbPath) as c:
+      for i in range(rows):
+        # five photos a day
+        DatabaseFunctions.insertPhoto(c, 'photo%07d.jpg' % i, start + timedelta(hours=i * 24 / 5), (500, 400), (600, 400))
+    
+    def fetchBefore():
+      conn = sqlite3.connect(dbPath, detect_types=sqlite3.PARSE_DECLTYPES)
+      photos = conn.execute('''SELECT photoId, photoFileName, date, lEyeX, lEyeY, rEyeX, rEyeY FROM eyesInPhotos ORDER BY date''').fetchall()
+      days = set(photo[2].date() for photo in photos)
+      conn.close()
+    
+    def fetchAfter():
+      with DatabaseFunctions.readTransaction(dbPath) as c:
+        photos = DatabaseFunctions.photosInDB(c)
+      days = set(photo.captureDay for photo in photos)
+    
+    print "{0:30} {1:>12} {2:>12}".format('rows', 'fetch before', 'fetch after')
+    print "{0:30} {1:10.1f}ms {2:10.1f}ms".format(str(rows), timeIt(fetchBefore, repeat) * 1000, timeIt(fetchAfter, repeat) * 1000)
+  finally:
+    DatabaseFunctions.closeConnection(dbPath)
+    shutil.rmtree(folder)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Time ELIME's conversion and detection per image")
+  parser.add_argument('-r', '--repeat', type=int, default=5, help='Runs per measurement')
+  parser.add_argument('-mS', '--maxSize', type=int, default=1024, help='Image size detection runs on')
+  parser.add_argument('--dbRows', type=int, default=0, help='Time fetching a database with this many photos')
+  parser.add_argument('photos', nargs='*', help='Photo files to time')
+  args = parser.parse_args()
+  
+  if args.dbRows:
+    benchmarkFetch(args.dbRows, args.repeat)
+  
+  if len(args.photos) == 0:
+    return
+  
+  print "{0:30} {1:>12} {2:>12} {3:>12} {4:>12}".format('photo', 'conv before', 'conv after', 'det before', 'det after')
+  
+  for path in args.photos:
+    pilImage = ImageFunctions.loadAndTransposePILImage(path)
+    pilImage.load()
+    
+    convertBefore = timeIt(lambda: convertPIL2CVBefore(pilImage), args.repeat)
+    convertAfter = timeIt(lambda: ImageFunctions.convertPIL2CV(pilImage), args.repeat)
+    
+    cvImage = scaledImage(ImageFunctions.convertPIL2CV(pilImage), args.maxSize)
+    
+    detectBefore = timeIt(lambda: detectEyesBefore(cvImage), args.repeat)
+    detectAfter = timeIt(lambda: OpenCvFunctions.eyeRectsInImage(cvImage), args.repeat)
+    
+    print "{0:30} {1:10.1f}ms {2:10.1f}ms {3:10.1f}ms {4:10.1f}ms".format(os.path.basename(path)[:30], 
+      convertBefore * 1000, convertAfter * 1000, detectBefore * 1000, detectAfter * 1000)
+
+
+if __name__ == "__main__":
+  main()
@@ -29,30 +29,470 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import atexit
+import calendar
 import sqlite3
+import logging
+import threading
+import time
+import Queue
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
+import HelperFunctions
+import ImageFunctions
 
-def prepareDataBaseTable(dbPath):
-  """Creates empty database table in path dbPath if not exists already"""
-  conn = sqlite3.connect(dbPath, detect_types=sqlite3.PARSE_DECLTYPES)
+# store a content hash of every photo in the catalog (reads each new file once completely)
+CATALOGHASHES = False
+
+SECONDSPERDAY = 24 * 60 * 60
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def dateTimeToEpoch(dateTime):
+  """Returns whole seconds from 1970-01-01 to (naive, wall clock) dateTime"""
+  return calendar.timegm(dateTime.timetuple())
+
+
+def epochToDateTime(epoch):
+  """Returns naive datetime epoch seconds after 1970-01-01"""
+  return EPOCH + timedelta(seconds=epoch)
+
+
+class EyePhoto(namedtuple('EyePhoto', ['photoId', 'photoFileName', 'captureEpoch', 'captureDay', 
+                                       'lEyeX', 'lEyeY', 'rEyeX', 'rEyeY'])):
+  """One row of table eyesInPhotos, capture time as integers (epoch seconds, days since 1970)"""
+  __slots__ = ()
+  
+  @property
+  def date(self):
+    """Capture datetime, only created when asked for"""
+    return epochToDateTime(self.captureEpoch)
+  
+  def onDay(self, captureDay):
+    """Returns copy of this photo dated at midnight of day number captureDay"""
+    return self._replace(captureEpoch=captureDay * SECONDSPERDAY, captureDay=captureDay)
+
+
+# one row of table photoCatalog, contentHash and sourceSize are those of the 
+# file pre got, sourceSize only if pre stored it upright (re-encoded)
+CatalogPhoto = namedtuple('CatalogPhoto', ['photoFileName', 'fileSize', 'mtime', 'width', 'height', 
+                                           'orientation', 'captureDate', 'contentHash', 'sourceSize'])
+
+
+# Schema migrations, MIGRATIONS[n] brings a database from version n 
+# (PRAGMA user_version) to n + 1. Only ever append here, never change 
+# migrations already released. Databases created before versioning have 
+# version 0 and table eyesInPhotos, hence the IF NOT EXISTS.
+MIGRATIONS = [
+  # 1: eye positions and photo catalog
+  ['''CREATE TABLE IF NOT EXISTS eyesInPhotos (photoId INTEGER PRIMARY KEY,
+                                              photoFileName TEXT NOT NULL, 
+                                              date TIMESTAMP NOT NULL, 
+                                              lEyeX INTEGER DEFAULT NULL, 
+                                              lEyeY INTEGER DEFAULT NULL, 
+                                              rEyeX INTEGER DEFAULT NULL, 
+                                              rEyeY INTEGER DEFAULT NULL, 
+                                              UNIQUE(photoFileName, date) ON CONFLICT FAIL)''',
+   # what is known about the files in photo folder, captureDate is the exif date if any
+   '''CREATE TABLE IF NOT EXISTS photoCatalog (photoFileName TEXT PRIMARY KEY, 
+                                              fileSize INTEGER NOT NULL, 
+                                              mtime REAL NOT NULL, 
+                                              width INTEGER, 
+                                              height INTEGER, 
+                                              orientation INTEGER, 
+                                              captureDate TIMESTAMP DEFAULT NULL, 
+                                              contentHash TEXT DEFAULT NULL, 
+                                              sourceSize INTEGER DEFAULT NULL)'''],
+  # 2: ordering by date, lookups by file name already use the index of 
+  #    UNIQUE(photoFileName, date)
+  ['''CREATE INDEX IF NOT EXISTS eyesInPhotosDate ON eyesInPhotos (date)'''],
+  # 3: capture time as integers, no TIMESTAMP parsing when reading eye positions
+  ['''ALTER TABLE eyesInPhotos ADD COLUMN captureEpoch INTEGER''',
+   '''ALTER TABLE eyesInPhotos ADD COLUMN captureDay INTEGER''',
+   '''UPDATE eyesInPhotos SET captureEpoch = CAST(strftime('%s', date) AS INTEGER), 
+                            captureDay = CAST(strftime('%s', date(date)) AS INTEGER) / 86400''',
+   '''CREATE INDEX IF NOT EXISTS eyesInPhotosCaptureDay ON eyesInPhotos (captureDay, captureEpoch)'''],
+  # 4: eye positions detected ahead of add (watch --detect), full size 
+  #    coordinates, confidence NULL if not refined
+  ['''CREATE TABLE IF NOT EXISTS eyeCandidates (photoFileName TEXT NOT NULL, 
+                                               mtime REAL NOT NULL, 
+                                               eyeIndex INTEGER NOT NULL, 
+                                               x REAL NOT NULL, 
+                                               y REAL NOT NULL, 
+                                               confidence REAL DEFAULT NULL, 
+                                               PRIMARY KEY (photoFileName, eyeIndex))'''],
+  # 5: how sure the detector was about an eye candidate (0 to 1), NULL if 
+  #    the detector cannot tell
+  ['''ALTER TABLE eyeCandidates ADD COLUMN support REAL DEFAULT NULL'''],
+]
+
+# ELIME before schema version 3 still inserts rows without capture time into 
+# newer databases, prepareDataBaseTable fills it in from date
+FILLCAPTURETIMES = '''UPDATE eyesInPhotos SET captureEpoch = CAST(strftime('%s', date) AS INTEGER), 
+                                           captureDay = CAST(strftime('%s', date(date)) AS INTEGER) / 86400 
+                                       WHERE captureEpoch IS NULL OR captureDay IS NULL'''
+
+# write ahead log lets render and others read while add or check write
+WALMODE = True
+
+
+# seconds a writer waits for another one to finish
+BUSYTIMEOUT = 30.0
+
+# WriteBehindQueue commits after this many writes or this many seconds after 
+# the first write not committed yet, whatever comes first
+WRITEBEHINDCOUNT = 20
+WRITEBEHINDSECONDS = 5.0
+
+# All SQL in one place, sqlite3 keeps the compiled statements of each 
+# connection in its statement cache, as long as the very same strings are used.
+SQLCOUNTPHOTOS = '''SELECT COUNT(*) FROM eyesInPhotos'''
+# eyesInPhotos.date is still written for older ELIMEs, but not read anymore
+SQLSELECTPHOTOS = '''SELECT photoId, photoFileName, captureEpoch, captureDay, lEyeX, lEyeY, rEyeX, rEyeY FROM eyesInPhotos 
+                     ORDER BY captureDay, captureEpoch'''
+SQLSELECTPHOTOSWITHEYES = '''SELECT photoId, photoFileName, captureEpoch, captureDay, lEyeX, lEyeY, rEyeX, rEyeY FROM eyesInPhotos 
+                             WHERE lEyeX IS NOT NULL AND lEyeY IS NOT NULL AND rEyeX IS NOT NULL AND rEyeY IS NOT NULL 
+                             ORDER BY captureDay, captureEpoch'''
+SQLSELECTPHOTOSBYNAME = '''SELECT photoId, photoFileName, captureEpoch, captureDay, lEyeX, lEyeY, rEyeX, rEyeY FROM eyesInPhotos 
+                           WHERE photoFileName=?'''
+SQLSELECTPHOTOFILENAMES = '''SELECT photoFileName FROM eyesInPhotos ORDER BY captureDay, captureEpoch'''
+SQLINSERTPHOTO = '''INSERT INTO eyesInPhotos (photoFileName, date, captureEpoch, captureDay, lEyeX, lEyeY, rEyeX, rEyeY) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+SQLUPDATEEYES = '''UPDATE eyesInPhotos SET lEyeX=?, lEyeY=?, rEyeX=?, rEyeY=? WHERE photoFileName=?'''
+SQLDELETEPHOTO = '''DELETE FROM eyesInPhotos WHERE photoFileName=?'''
+SQLSELECTCATALOG = '''SELECT photoFileName, fileSize, mtime, width, height, orientation, captureDate, contentHash, sourceSize FROM photoCatalog'''
+SQLSTORECATALOGPHOTO = '''INSERT OR REPLACE INTO photoCatalog (photoFileName, fileSize, mtime, width, height, orientation, captureDate, contentHash, sourceSize) 
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+SQLDELETECATALOGPHOTO = '''DELETE FROM photoCatalog WHERE photoFileName=?'''
+SQLSELECTEYECANDIDATES = '''SELECT photoFileName, mtime, x, y, confidence, support FROM eyeCandidates ORDER BY photoFileName, eyeIndex'''
+SQLINSERTEYECANDIDATE = '''INSERT INTO eyeCandidates (photoFileName, mtime, eyeIndex, x, y, confidence, support) VALUES (?, ?, ?, ?, ?, ?, ?)'''
+SQLDELETEEYECANDIDATES = '''DELETE FROM eyeCandidates WHERE photoFileName=?'''
+
+# open connections by database path, one dict per thread as a sqlite3 
+# connection must only be used by the thread that opened it
+_connections = threading.local()
+
+
+def connection(dbPath):
+  """Returns this thread's connection to database at dbPath, opened on first use.
+  
+  Connections are in autocommit mode, use readTransaction and writeTransaction."""
+  connections = getattr(_connections, 'byPath', None)
+  if connections is None:
+    connections = _connections.byPath = {}
+  
+  conn = connections.get(dbPath)
+  if conn is None:
+    conn = sqlite3.connect(dbPath, timeout=BUSYTIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES, 
+                           isolation_level=None, cached_statements=len(MIGRATIONS) + 32)
+    connections[dbPath] = conn
+  
+  return conn
+
+
+def closeConnection(dbPath):
+  """Close this thread's connection to database at dbPath, if open"""
+  connections = getattr(_connections, 'byPath', {})
+  conn = connections.pop(dbPath, None)
+  if conn is not None:
+    conn.close()
+
+
+@contextmanager
+def readTransaction(dbPath):
+  """Context giving a cursor that sees one consistent state of database at dbPath"""
+  conn = connection(dbPath)
   c = conn.cursor()
-  c.execute('''CREATE TABLE IF NOT EXISTS eyesInPhotos (photoId INTEGER PRIMARY KEY,
-                                                        photoFileName TEXT NOT NULL, 
-                                                        date TIMESTAMP NOT NULL, 
-                                                        lEyeX INTEGER DEFAULT NULL, 
-                                                        lEyeY INTEGER DEFAULT NULL, 
-                                                        rEyeX INTEGER DEFAULT NULL, 
-                                                        rEyeY INTEGER DEFAULT NULL, 
-                                                        UNIQUE(photoFileName, date) ON CONFLICT FAIL)''')
+  c.execute('''BEGIN''')
+  try:
+    yield c
+  finally:
+    # nothing to keep, ending the transaction either way
+    c.execute('''ROLLBACK''')
+
+
+@contextmanager
+def writeTransaction(dbPath):
+  """Context giving a cursor whose changes get committed together, or rolled back on exceptions"""
+  conn = connection(dbPath)
+  c = conn.cursor()
+  # take the write lock at once, so no other writer can sneak in after our reads
+  c.execute('''BEGIN IMMEDIATE''')
+  try:
+    yield c
+  except:
+    c.execute('''ROLLBACK''')
+    raise
+  else:
+    c.execute('''COMMIT''')
+
+
+def prepareDataBaseTable(dbPath):
+  """Creates database in path dbPath if not exists already, brings its schema up to date"""
+  logger = logging.getLogger('ELIME.prepareDataBaseTable')
+  
+  c = connection(dbPath).cursor()
+  
+  c.execute('''PRAGMA journal_mode=%s''' % ('WAL' if WALMODE else 'DELETE'))
+  
+  (version,) = c.execute('''PRAGMA user_version''').fetchone()
+  
+  if version > len(MIGRATIONS):
+    logger.warning("Database %s has schema version %d, this ELIME only knows up to %d", dbPath, version, len(MIGRATIONS))
+  
+  for newVersion in range(version + 1, len(MIGRATIONS) + 1):
+    logger.info("Migrating database %s to schema version %d", dbPath, newVersion)
+    
+    with writeTransaction(dbPath) as c:
+      for statement in MIGRATIONS[newVersion - 1]:
+        c.execute(statement)
+      c.execute('''PRAGMA user_version=%d''' % newVersion)
   
-  conn.commit()
-  conn.close()
+  with readTransaction(dbPath) as c:
+    missing = c.execute('''SELECT COUNT(*) FROM eyesInPhotos WHERE captureEpoch IS NULL OR captureDay IS NULL''').fetchone()[0]
+  if missing:
+    logger.info("Filling in capture time of %d photos in database %s", missing, dbPath)
+    with writeTransaction(dbPath) as c:
+      c.execute(FILLCAPTURETIMES)
+
+
+class WriteBehindQueue(object):
+  """Runs writes on a background thread, batched into one transaction per WRITEBEHINDCOUNT writes or WRITEBEHINDSECONDS.
+  
+  A write is a tuple (function, arguments...) called as function(dbCursor, 
+  arguments...), writes put together get committed together. add and check 
+  put eye positions here, so the windows never wait for the disk. Queued 
+  writes get committed on flush, close and when ELIME exits (sys.exit on 
+  'q' as well). A write that failed raises its exception on the next put, 
+  flush or close."""
+  
+  def __init__(self, dbPath, count=None, seconds=None):
+    self.dbPath = dbPath
+    self.count = WRITEBEHINDCOUNT if count is None else count
+    self.seconds = WRITEBEHINDSECONDS if seconds is None else seconds
+    self.queue = Queue.Queue()
+    self.error = None
+    self.closed = False
+    
+    # daemon, so exiting does not wait for it before atexit had it flush
+    self.thread = threading.Thread(target=self.run, name='WriteBehindQueue')
+    self.thread.daemon = True
+    self.thread.start()
+    
+    atexit.register(self.close)
+  
+  def run(self):
+    logger = logging.getLogger('ELIME.WriteBehindQueue')
+    
+    pending = []
+    flushed = []
+    deadline = None
+    
+    while True:
+      try:
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        item = self.queue.get(timeout=timeout)
+      except Queue.Empty:
+        item = None
+      
+      # None: time is up, an Event: flush asked for, else writes
+      if isinstance(item, tuple):
+        pending.append(item)
+        if deadline is None:
+          deadline = time.time() + self.seconds
+      elif item is not None:
+        flushed.append(item)
+      
+      if pending and (item is None or flushed or len(pending) >= self.count or time.time() >= deadline):
+        try:
+          self.commit(pending)
+          logger.debug("Committed %d writes", len(pending))
+        except Exception:
+          # one bad write must not take the others with it
+          for writes in pending:
+            try:
+              self.commit([writes])
+            except Exception as e:
+              logger.exception("Writing to database %s failed", self.dbPath)
+              self.error = e
+        pending = []
+        deadline = None
+      
+      for event in flushed:
+        event.set()
+      flushed = []
+      
+      if self.closed and not pending and self.queue.empty():
+        return
+  
+  def commit(self, pending):
+    with writeTransaction(self.dbPath) as c:
+      for writes in pending:
+        for write in writes:
+          write[0](c, *write[1:])
+  
+  def check(self):
+    if self.error is not None:
+      (error, self.error) = (self.error, None)
+      raise error
+  
+  def put(self, *writes):
+    """Queue writes (function, arguments...) to be committed together later on"""
+    self.check()
+    self.queue.put(writes)
+  
+  def flush(self):
+    """Returns once all writes put so far are committed"""
+    if self.thread.is_alive():
+      event = threading.Event()
+      self.queue.put(event)
+      # waiting with a timeout keeps ctrl-c working
+      while not event.wait(1.0):
+        pass
+    self.check()
+  
+  def close(self):
+    """Commit what is queued and stop, the queue must not be used afterwards"""
+    if not self.closed:
+      self.closed = True
+      self.flush()
 
 
 def numberOfPhotosInDB(dbCursor):
   """Returns the number of all photos in database pointed to by dbCursor"""
-  dbCursor.execute('''SELECT * FROM eyesInPhotos''')
-  allDBPhotos = dbCursor.fetchall()
+  dbCursor.execute(SQLCOUNTPHOTOS)
+  (count,) = dbCursor.fetchone()
+  
+  return count
+
+
+def photosInDB(dbCursor, withEyesOnly=False):
+  """Returns EyePhotos of all photos (or only those with all eye coordinates) ordered by date"""
+  dbCursor.execute(SQLSELECTPHOTOSWITHEYES if withEyesOnly else SQLSELECTPHOTOS)
+  return map(EyePhoto._make, dbCursor.fetchall())
+
+
+def photosNamed(dbCursor, photoFileName):
+  """Returns list of EyePhotos with file name photoFileName, more than one means trouble"""
+  dbCursor.execute(SQLSELECTPHOTOSBYNAME, (photoFileName,))
+  return map(EyePhoto._make, dbCursor.fetchall())
+
+
+def photoFileNamesInDB(dbCursor):
+  """Returns file names of all photos ordered by date"""
+  dbCursor.execute(SQLSELECTPHOTOFILENAMES)
+  return [name for (name,) in dbCursor.fetchall()]
+
+
+def insertPhoto(dbCursor, photoFileName, date, leftEye, rightEye):
+  """Add photo taken at datetime date with eye positions leftEye, rightEye (x, y)"""
+  captureEpoch = dateTimeToEpoch(date)
+  dbCursor.execute(SQLINSERTPHOTO, (photoFileName, date, captureEpoch, captureEpoch // SECONDSPERDAY) + tuple(leftEye) + tuple(rightEye))
+
+
+def updateEyes(dbCursor, photoFileName, leftEye, rightEye):
+  """Set eye positions leftEye, rightEye (x, y) of photo"""
+  dbCursor.execute(SQLUPDATEEYES, tuple(leftEye) + tuple(rightEye) + (photoFileName,))
+
+
+def deletePhotos(dbCursor, photoFileNames):
+  """Delete all photos with given file names, returns number of deleted photos"""
+  dbCursor.executemany(SQLDELETEPHOTO, [(name,) for name in photoFileNames])
+  return dbCursor.rowcount
+
+
+def eyeCandidates(dbCursor):
+  """Returns dict photo file name -> (mtime, list of ((x, y), confidence, support)) of eyes detected ahead"""
+  dbCursor.execute(SQLSELECTEYECANDIDATES)
+  candidates = {}
+  for (photoFileName, mtime, x, y, confidence, support) in dbCursor.fetchall():
+    candidates.setdefault(photoFileName, (mtime, []))[1].append(((x, y), confidence, support))
+  return candidates
+
+
+def storeEyeCandidates(dbCursor, photoFileName, mtime, eyes):
+  """Replace eyes detected ahead for photo (file of mtime) by list of ((x, y), confidence, support)"""
+  dbCursor.execute(SQLDELETEEYECANDIDATES, (photoFileName,))
+  dbCursor.executemany(SQLINSERTEYECANDIDATE, [(photoFileName, mtime, eyeIndex, x, y, confidence, support) 
+                                               for eyeIndex, ((x, y), confidence, support) in enumerate(eyes)])
+
+
+def deleteEyeCandidates(dbCursor, photoFileName):
+  """Forget eyes detected ahead for photo, once its eye positions are stored"""
+  dbCursor.execute(SQLDELETEEYECANDIDATES, (photoFileName,))
+
+
+def catalogPhotos(dbCursor):
+  """Returns CatalogPhotos of all photos in table photoCatalog"""
+  dbCursor.execute(SQLSELECTCATALOG)
+  return map(CatalogPhoto._make, dbCursor.fetchall())
+
+
+def refreshPhotoCatalog(dbPath, srcPath, photoFileNames=None, contentHashes=None, sourceSizes=None):
+  """Bring table photoCatalog up to date with the photos in srcPath and return its rows by file name.
+  
+  Files are only stat'ed, just new or changed ones (size or mtime) get their 
+  header read. Rows of files gone from srcPath are removed. With 
+  photoFileNames given only those photos get looked at (and returned). 
+  contentHashes has hashes (by file name) already computed, e.g. while copying, 
+  they also get stored for cataloged photos without one. sourceSizes has the 
+  sizes the new photos had before pre stored them."""
+  logger = logging.getLogger('ELIME.refreshPhotoCatalog')
+  
+  if contentHashes is None:
+    contentHashes = {}
+  if sourceSizes is None:
+    sourceSizes = {}
+  
+  with readTransaction(dbPath) as c:
+    catalog = dict((photo.photoFileName, photo) for photo in catalogPhotos(c))
+  
+  photos = {}
+  changedPhotos = []
+  
+  if photoFileNames is None:
+    folderPhotos = HelperFunctions.scanPhotoFolder(srcPath)
+  else:
+    folderPhotos = []
+    for photoFileName in photoFileNames:
+      try:
+        fileStat = os.stat(os.path.join(srcPath, photoFileName))
+      except OSError:
+        continue
+      folderPhotos.append((photoFileName, fileStat.st_size, fileStat.st_mtime))
+  
+  for (photoFileName, fileSize, mtime) in folderPhotos:
+    photo = catalog.get(photoFileName)
+    
+    if (photo is None or photo.fileSize != fileSize or photo.mtime != mtime 
+        or (photo.contentHash is None and (CATALOGHASHES or contentHashes.get(photoFileName) is not None))):
+      logger.debug("Reading header of new or changed photo %s", photoFileName)
+      path = os.path.join(srcPath, photoFileName)
+      (width, height, orientation, captureDate) = ImageFunctions.readPhotoMetadata(path)
+      contentHash = contentHashes.get(photoFileName)
+      if contentHash is None and CATALOGHASHES:
+        contentHash = HelperFunctions.hashFile(path)
+      sourceSize = sourceSizes.get(photoFileName)
+      if sourceSize is None and photo is not None and photo.fileSize == fileSize and photo.mtime == mtime:
+        sourceSize = photo.sourceSize
+      photo = CatalogPhoto(photoFileName, fileSize, mtime, width, height, orientation, 
+                           captureDate, contentHash, sourceSize if sourceSize != fileSize else None)
+      changedPhotos.append(photo)
+    
+    photos[photoFileName] = photo
+  
+  removedPhotos = []
+  if photoFileNames is None:
+    removedPhotos = [(name,) for name in catalog if name not in photos]
+  
+  if changedPhotos or removedPhotos:
+    with writeTransaction(dbPath) as c:
+      c.executemany(SQLSTORECATALOGPHOTO, changedPhotos)
+      c.executemany(SQLDELETECATALOGPHOTO, removedPhotos)
   
-  return len(allDBPhotos)
+  logger.info("Photo catalog: %d photos, %d new or changed, %d removed", len(photos), len(changedPhotos), len(removedPhotos))
   
+  return photos
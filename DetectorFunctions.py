@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import abc
+import cv2
+import logging
+import os
+import sys
+import threading
+
+# ELIME Project
+import HelperFunctions
+import OpenCvFunctions
+import UiFunctions
+
+
+PATHTOLBPCASCADES = '/usr/local/opt/opencv/share/OpenCV/lbpcascades/'
+LBPFACECASCADE = 'lbpcascade_frontalface_improved.xml'
+
+# local model file for the dnn detector: a YuNet face/landmark .onnx model or a 
+# res10 SSD face .caffemodel (which needs DNNCONFIGFILE, its .prototxt, as well)
+DNNMODELFILE = None
+DNNCONFIGFILE = None
+DNNMINCONFIDENCE = 0.6
+
+# eye rects built from dnn landmarks are this fraction of the face width wide
+DNNEYERECTFRACTION = 0.25
+
+DEFAULTDETECTOR = 'haar'
+
+# an eye the cascade found with this many neighbors gets support 0.5
+SUPPORTNEIGHBORS = 10
+
+
+def missingFiles(paths):
+  """Returns those of paths that are no existing files"""
+  return [path for path in paths if not os.path.isfile(os.path.expanduser(path))]
+
+
+def eyeCascadePaths():
+  return [os.path.join(OpenCvFunctions.PATHTOCASCADES, cascade) for cascade in OpenCvFunctions.EYECASCADES]
+
+
+def neighborSupport(neighbors):
+  """Returns support (0 to 1) of an eye rect the cascade found with neighbors overlapping detections"""
+  return neighbors / float(neighbors + SUPPORTNEIGHBORS)
+
+
+class EyeDetector(object):
+  """Abstract base of the eye detector backends, they implement eyesInImage. 
+  
+  eyesInImage takes a BGR image and returns (eye rect, support) of the eyes 
+  found, sorted from left to right. Support tells how sure the backend is 
+  about an eye, from 0 to 1. eyeRectsInImage returns the rects only, just 
+  like OpenCvFunctions.eyeRectsInImage does."""
+  
+  __metaclass__ = abc.ABCMeta
+  
+  name = None
+  
+  def unavailableReason(self):
+    """Returns why this backend can not run with the current settings, None if it can"""
+    return None
+  
+  @abc.abstractmethod
+  def eyesInImage(self, cvImage, fileName='', detectionDebug=False):
+    """Returns list of (eye rect, support) of the eyes in cvImage, from left to right"""
+  
+  def eyeRectsInImage(self, cvImage, fileName='', detectionDebug=False):
+    return [eyeRect for (eyeRect, support) in self.eyesInImage(cvImage, fileName, detectionDebug)]
+
+
+class HaarEyeDetector(EyeDetector):
+  """Haar cascades for faces and eyes - ELIME's original pipeline"""
+  
+  name = 'haar'
+  
+  def unavailableReason(self):
+    missing = missingFiles([os.path.join(OpenCvFunctions.PATHTOCASCADES, OpenCvFunctions.FACECASCADE)] + eyeCascadePaths())
+    if missing:
+      return "cascade files not found: %s" % ', '.join(missing)
+    return None
+  
+  def eyesInImage(self, cvImage, fileName='', detectionDebug=False):
+    return [(eyeRect, neighborSupport(n)) for (eyeRect, n) in OpenCvFunctions.eyesInImage(cvImage, fileName, detectionDebug)]
+
+
+class LbpEyeDetector(EyeDetector):
+  """LBP cascade for faces, Haar cascades for eyes (openCV ships no LBP eye cascade)"""
+  
+  name = 'lbp'
+  
+  def unavailableReason(self):
+    missing = missingFiles([os.path.join(PATHTOLBPCASCADES, LBPFACECASCADE)] + eyeCascadePaths())
+    if missing:
+      return "cascade files not found: %s" % ', '.join(missing)
+    return None
+  
+  def eyesInImage(self, cvImage, fileName='', detectionDebug=False):
+    cascadePath = os.path.join(PATHTOLBPCASCADES, LBPFACECASCADE)
+    return [(eyeRect, neighborSupport(n)) for (eyeRect, n) in OpenCvFunctions.eyesInImage(cvImage, fileName, detectionDebug, cascadePath)]
+
+
+class DnnEyeDetector(EyeDetector):
+  """Face (and landmark) network from a local model file, run by cv2.dnn.
+  
+  YuNet models deliver eye landmarks directly. Face only SSD models get their 
+  eyes searched in the best face with the Haar eye cascades."""
+  
+  name = 'dnn'
+  
+  def __init__(self):
+    # networks are not shareable between threads
+    self.local = threading.local()
+  
+  def isLandmarkModel(self):
+    return DNNMODELFILE is not None and DNNMODELFILE.lower().endswith('.onnx')
+  
+  def unavailableReason(self):
+    modelPath = HelperFunctions.checkFile(DNNMODELFILE)
+    if modelPath is None or not os.path.isfile(modelPath):
+      return "dnn model file (dnnModelFile) not found: %s" % DNNMODELFILE
+    
+    if self.isLandmarkModel():
+      if not hasattr(cv2, 'FaceDetectorYN'):
+        return "openCV %s is too old for YuNet models, 4.5.4 or newer needed" % cv2.__version__
+    else:
+      # eyes get searched in the faces with the haar eye cascades
+      missing = missingFiles(eyeCascadePaths())
+      if missing:
+        return "cascade files not found: %s" % ', '.join(missing)
+    
+    return None
+  
+  def network(self):
+    """Returns this thread's network, loaded from DNNMODELFILE on first use"""
+    logger = logging.getLogger('ELIME.DetectorFunctions.DnnEyeDetector')
+    
+    if not hasattr(self.local, 'net'):
+      reason = self.unavailableReason()
+      if reason is not None:
+        logger.critical(reason)
+        sys.exit(1)
+      
+      modelPath = HelperFunctions.checkFile(DNNMODELFILE)
+      if self.isLandmarkModel():
+        self.local.net = cv2.FaceDetectorYN.create(modelPath, '', (320, 320), DNNMINCONFIDENCE)
+      else:
+        if DNNCONFIGFILE is None:
+          self.local.net = cv2.dnn.readNet(modelPath)
+        else:
+          self.local.net = cv2.dnn.readNet(modelPath, os.path.expanduser(DNNCONFIGFILE))
+    
+    return self.local.net
+  
+  def eyesInImage(self, cvImage, fileName='', detectionDebug=False):
+    logger = logging.getLogger('ELIME.DetectorFunctions.DnnEyeDetector')
+    
+    if not self.isLandmarkModel():
+      faces = self.facesInImage(cvImage)
+      logger.debug("dnn found faces %s", faces)
+      return [(eyeRect, neighborSupport(n)) for (eyeRect, n) in OpenCvFunctions.eyesInFaces(cvImage, faces, fileName, detectionDebug)]
+    
+    (width, height) = HelperFunctions.imageSize(cvImage)
+    net = self.network()
+    net.setInputSize((width, height))
+    retval, detections = net.detect(cvImage)
+    
+    if detections is None or len(detections) == 0:
+      logger.info("dnn found no face")
+      return []
+    
+    # row: face x, y, w, h, right eye x, y, left eye x, y, ..., score
+    best = max(detections, key=lambda row: row[-1])
+    side = max(1, int(best[2] * DNNEYERECTFRACTION))
+    
+    eyeRects = []
+    for (ex, ey) in [(best[4], best[5]), (best[6], best[7])]:
+      eyeRects.append((int(round(ex)) - side / 2, int(round(ey)) - side / 2, side, side))
+    eyeRects = sorted(eyeRects, key=lambda rect: HelperFunctions.middleOfRect(rect)[0])
+    
+    if detectionDebug:
+      faceRect = tuple(int(v) for v in best[0:4])
+      rectsAndColor = [(faceRect, UiFunctions.RGB(0, 0, 255))]
+      rectsAndColor.extend([(eye, UiFunctions.RGB(255, 255, 0)) for eye in eyeRects])
+      UiFunctions.displayColoredRects(cvImage, "dnn face and eyes in {0}".format(fileName), rectsAndColor)
+    
+    logger.debug("Returning Eyes: %s", eyeRects)
+    # landmarks are as sure as the face they belong to
+    return [(eyeRect, float(best[-1])) for eyeRect in eyeRects]
+  
+  def facesInImage(self, cvImage):
+    """Run a SSD face network, returns set of face rects above DNNMINCONFIDENCE"""
+    (width, height) = HelperFunctions.imageSize(cvImage)
+    net = self.network()
+    
+    blob = cv2.dnn.blobFromImage(cv2.resize(cvImage, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+    net.setInput(blob)
+    detections = net.forward()
+    
+    faces = set()
+    for detection in detections[0, 0]:
+      if detection[2] < DNNMINCONFIDENCE:
+        continue
+      x1 = max(0, int(detection[3] * width))
+      y1 = max(0, int(detection[4] * height))
+      x2 = min(width, int(detection[5] * width))
+      y2 = min(height, int(detection[6] * height))
+      if x2 > x1 and y2 > y1:
+        faces.add((x1, y1, x2 - x1, y2 - y1))
+    
+    return faces
+
+
+DETECTORS = dict((detector.name, detector) for detector in [HaarEyeDetector, LbpEyeDetector, DnnEyeDetector])
+
+_detectors = {}
+
+
+def getDetector(name=None):
+  """Returns (shared) instance of the detector backend called name"""
+  logger = logging.getLogger('ELIME.DetectorFunctions.getDetector')
+  
+  if name is None:
+    name = DEFAULTDETECTOR
+  
+  if name not in DETECTORS:
+    logger.critical("Unknown detector %s, choose one of %s", name, ', '.join(sorted(DETECTORS)))
+    sys.exit(1)
+  
+  if name not in _detectors:
+    _detectors[name] = DETECTORS[name]()
+  
+  return _detectors[name]
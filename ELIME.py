@@ -43,6 +43,7 @@ around them. There are only a few steps necessary:
           pre automatically for you.
   - add - Detect eyes in your photos, manually adjust and save their positions
           to database
+          (add --autoAccept stores confidently detected eyes without asking)
   - render - Based on eye positions, create JPGs from your pictures, scaled, 
              rotated and moved to perfect position
 
@@ -50,6 +51,9 @@ You can also do:
   - tidy - After you chose to delete a photo from your project's working directory, tidy 
            the database.
   - check - Use 'check' to go over eye positions of all or certain photos. 
+           check --suspicious N only shows the N photos with the most unlikely 
+           eye positions, worst first (--detect also compares with detected eyes).
+           check --sheet shows many eyes at once, click the bad ones to correct them.
 
 """
 # python standard
@@ -58,24 +62,37 @@ import argparse
 import ConfigParser
 import os
 import sys
-import sqlite3
+import math
 from datetime import datetime, timedelta, date
 import shutil
 import locale
 import logging, logging.handlers
+import random
+import bisect
+import time
+import threading
+import Queue
 
 #Pillow
 from PIL import Image, ImageDraw, ImageFont, ExifTags
 
 #OpenCV
-import cv
+import cv2
 
 # ELIME Project
 import DatabaseFunctions
+import DetectorFunctions
+import ExportFunctions
+import IngestFunctions
 import ImageFunctions
 import OpenCvFunctions
+import PrefetchFunctions
+import ProxyFunctions
+import ReviewFunctions
 import UiFunctions
 import HelperFunctions
+import TuneFunctions
+import WatchFunctions
 
 
 def setupLogging(logLevel=logging.DEBUG, logLevelConsole=logging.DEBUG, logLevelFile=logging.DEBUG, 
@@ -111,6 +128,30 @@ def setupLogging(logLevel=logging.DEBUG, logLevelConsole=logging.DEBUG, logLevel
     logger.debug('No logging to logfile - no path specified!')
 
 
+def setupDetection(args):
+  """Hands detection related settings over to the detection modules"""
+  args.openCVHaarcascadesFolder = HelperFunctions.checkFolder(args.openCVHaarcascadesFolder)
+  if args.openCVHaarcascadesFolder is not None:
+    OpenCvFunctions.PATHTOCASCADES = args.openCVHaarcascadesFolder
+  
+  args.openCVLbpcascadesFolder = HelperFunctions.checkFolder(args.openCVLbpcascadesFolder)
+  if args.openCVLbpcascadesFolder is not None:
+    DetectorFunctions.PATHTOLBPCASCADES = args.openCVLbpcascadesFolder
+  
+  # parameters found by the tune command replace the built in parameter tables
+  if args.eyeCascade is not None:
+    OpenCvFunctions.EYECASCADES = [args.eyeCascade]
+  
+  if not None in [args.eyeScaleFactor, args.eyeMinNeighbors, args.eyeMinSize]:
+    OpenCvFunctions.EYEDETECTIONARGUMENTS = [(args.eyeScaleFactor, args.eyeMinNeighbors, 0, (args.eyeMinSize, args.eyeMinSize))]
+  
+  DetectorFunctions.DNNMODELFILE = args.dnnModelFile
+  DetectorFunctions.DNNCONFIGFILE = args.dnnConfigFile
+  DetectorFunctions.DEFAULTDETECTOR = args.detector
+  
+  OpenCvFunctions.DETECTIONTHREADS = args.detectionThreads
+  
+
 #
 #
 # The program's main functions
@@ -118,68 +159,390 @@ def setupLogging(logLevel=logging.DEBUG, logLevelConsole=logging.DEBUG, logLevel
 #
 
 
-def preProcessImageFiles(sourcePath, destinationPath=None, prefix=None, delete=False, customDateFormat=''):
-  """Move image files from sourcePath to DestinationPath (permanent photo storage), renaming them with creation date"""
+def catalogContentHash(photoFolder, catalogPhoto):
+  """Returns content hash of catalogPhoto in photoFolder, the cataloged one if the file did not change since, None if gone"""
+  path = os.path.join(photoFolder, catalogPhoto.photoFileName)
+  
+  try:
+    fileStat = os.stat(path)
+  except OSError:
+    return None
+  
+  if (catalogPhoto.contentHash is not None and catalogPhoto.fileSize == fileStat.st_size 
+      and catalogPhoto.mtime == fileStat.st_mtime):
+    return catalogPhoto.contentHash
+  
+  return HelperFunctions.hashFile(path)
+
+
+def isCollisionDuplicate(path, size, destPath, catalogPhotosByName, contentHashes, sourceSizes):
+  """Returns True if file at path (of size bytes) has the content of destPath, a photo with the same capture time.
+  
+  Files of different size than destPath had when it arrived (this run's 
+  sourceSizes or the catalog) are no duplicates and get not read at all. The 
+  content hash of destPath comes from this run's contentHashes or the catalog 
+  (if the file did not change since), the file only gets read without either."""
+  try:
+    destStat = os.stat(destPath)
+  except OSError:
+    return False
+  
+  destName = os.path.basename(destPath)
+  catalogPhoto = catalogPhotosByName.get(destName)
+  
+  # photos stored upright differ in size from what pre got
+  destSize = sourceSizes.get(destName)
+  if (destSize is None and catalogPhoto is not None and catalogPhoto.sourceSize is not None 
+      and catalogPhoto.fileSize == destStat.st_size and catalogPhoto.mtime == destStat.st_mtime):
+    destSize = catalogPhoto.sourceSize
+  
+  if size is None or (destSize or destStat.st_size) != size or not os.path.isfile(path):
+    return False
+  
+  destHash = contentHashes.get(destName)
+  
+  if destHash is None and catalogPhoto is not None:
+    destHash = catalogContentHash(os.path.dirname(destPath), catalogPhoto)
+  
+  if destHash is None:
+    destHash = HelperFunctions.hashFile(destPath)
+  
+  return HelperFunctions.hashFile(path) == destHash
+
+
+def preProcessImageFiles(sourcePath, destinationPath=None, prefix=None, delete=False, customDateFormat='', 
+                         normalizeOrientation=False, dbPath=None, sourcePhotos=None):
+  """Move image files from sourcePath to DestinationPath (permanent photo storage), renaming them with creation date.
+  
+  With normalizeOrientation rotated photos get stored upright, so loading them never needs a transpose.
+  Byte identical duplicates (of photos in dbPath's catalog or each other) are not kept, but deleted 
+  from sourcePath like transferred photos.
+  Only the photos named in sourcePhotos get looked at, if given. Returns the new file names in destinationPath."""
   logger = logging.getLogger('ELIME.pre')
 
   if not sourcePath:
     logger.error('sourcePath not valid')
-    return
+    return []
     
   if destinationPath is None:
     #copy and rename in place
     logger.warning('No destination path given. Using source path %s', sourcePath)
     destinationPath = sourcePath
     
-  sourceFiles = []
-  
-  # get all files in sourcepath
-  if os.path.isdir(sourcePath):
-    sourceFiles = [ f for f in os.listdir(sourcePath) if os.path.isfile(os.path.join(sourcePath,f)) ]
-  
-  # filter only wanted files (jpgs)
-  sourcePhotos = filter(HelperFunctions.filefilter, sourceFiles)
+  # get all photos (jpgs) in sourcepath
+  if sourcePhotos is not None:
+    sourcePhotos = [name for name in sourcePhotos if os.path.isfile(os.path.join(sourcePath, name))]
+  elif os.path.isdir(sourcePath):
+    sourcePhotos = [name for (name, size, mtime) in HelperFunctions.scanPhotoFolder(sourcePath)]
+  else:
+    sourcePhotos = []
   
   count = len(sourcePhotos)
   if count:
     logger.info('Preprocessing %d photos from source %s to destination %s', count, sourcePath, destinationPath)
   else:
     logger.info('No photos to preprocess at %s', sourcePath)
-    
-  # rename files - as copy
-  for photo in sourcePhotos:
-    completeSourcePath = os.path.join(sourcePath, photo)
-    
-    photoDateTime = ImageFunctions.getCreationDateTimeOfPicture(completeSourcePath, customDateFormat)
+  
+  # read creation dates and orientations in parallel
+  sourcePaths = [os.path.join(sourcePath, photo) for photo in sourcePhotos]
+  ingestInfos = IngestFunctions.photoIngestInfos(sourcePaths, customDateFormat)
+  
+  # byte identical duplicates of cataloged photos must have the very same size (as pre got them)
+  catalogPhotosBySize = {}
+  catalogPhotosByName = {}
+  if dbPath is not None and count:
+    DatabaseFunctions.prepareDataBaseTable(dbPath)
+    with DatabaseFunctions.readTransaction(dbPath) as c:
+      for catalogPhoto in DatabaseFunctions.catalogPhotos(c):
+        catalogPhotosBySize.setdefault(catalogPhoto.sourceSize or catalogPhoto.fileSize, []).append(catalogPhoto)
+        catalogPhotosByName[catalogPhoto.photoFileName] = catalogPhoto
+  
+  transfers = []
+  # destination file name -> size of its source
+  sourceSizes = {}
+  destPaths = set()
+  # (source, destination, source size) of photos with the capture time of another one
+  collisions = []
+  
+  for completeSourcePath, (photoDateTime, orientation, size) in zip(sourcePaths, ingestInfos):
     timestr = photoDateTime.strftime("%Y-%m-%d_%H-%M-%S")
     
     # create destination filename
+    extension = os.path.splitext(completeSourcePath)[1]
     if prefix is None:
-      destPath = os.path.join(destinationPath, timestr + os.path.splitext(photo)[1])
+      destPath = os.path.join(destinationPath, timestr + extension)
     else:
-      destPath = os.path.join(destinationPath, prefix + '_' + timestr + os.path.splitext(photo)[1])
+      destPath = os.path.join(destinationPath, prefix + '_' + timestr + extension)
     
-    logger.info("Copying: %s -> %s", completeSourcePath, destPath)
-    
-    # copy the file to destination
-    if not os.path.isfile(destPath):
-      shutil.copy2(completeSourcePath, destPath)
-    else:
-      logger.warning("File %s is already existing. Did not copy!", destPath)
+    if os.path.isfile(destPath) or destPath in destPaths:
+      collisions.append((completeSourcePath, destPath, size))
       continue
     
-    # delete source file if wanted (e.g. move and not copy)  
-    if delete:
-      logger.info("Deleting source file %s", completeSourcePath)
-      os.remove(completeSourcePath)
+    destPaths.add(destPath)
+    sourceSizes[os.path.basename(destPath)] = size
+    
+    if not normalizeOrientation:
+      orientation = 1
+    
+    transfers.append((completeSourcePath, destPath, orientation))
+  
+  # new photos can only be duplicates of cataloged photos of their size, 
+  # these only get read if the catalog has no (current) hash of them
+  knownHashes = {}
+  catalogHashes = {}
+  for size in set(sourceSizes.values()):
+    for catalogPhoto in catalogPhotosBySize.get(size, []):
+      contentHash = catalogContentHash(destinationPath, catalogPhoto)
+      if contentHash is None:
+        continue
+      knownHashes[contentHash] = catalogPhoto.photoFileName
+      if contentHash != catalogPhoto.contentHash:
+        catalogHashes[catalogPhoto.photoFileName] = contentHash
+  
+  # rename, link or copy, and delete source file if wanted (e.g. move and not copy), 
+  # the hashes of the transfers find duplicates of cataloged and other new photos
+  (methods, numBytes, seconds, contentHashes) = IngestFunctions.ingestPhotos(transfers, move=delete, knownHashes=knownHashes, 
+                                                                             knownSizes=set(catalogPhotosBySize))
+  
+  for (completeSourcePath, destPath, size) in collisions:
+    if isCollisionDuplicate(completeSourcePath, size, destPath, catalogPhotosByName, contentHashes, sourceSizes):
+      logger.info("File %s is a duplicate of %s. Did not copy it!", completeSourcePath, destPath)
+      if delete:
+        os.remove(completeSourcePath)
+    else:
+      logger.warning("File %s is already existing. Did not copy %s!", destPath, completeSourcePath)
   
   if count:      
     logger.info('Done preprocessing %d photos from source %s to destination %s!', count, sourcePath, destinationPath)
+    logger.info('%s, %.1f MB in %.2f s (%.1f MB/s)', 
+                ', '.join('%d %s' % (number, method) for method, number in sorted(methods.items())) or 'Nothing transferred', 
+                numBytes / 1e6, seconds, numBytes / 1e6 / max(seconds, 1e-6))
+    
+  newPhotos = sorted(contentHashes)
+  
+  # record the new photos, their orientation and content hash right away, 
+  # and the hashes of cataloged photos read for comparison
+  if dbPath is not None and (newPhotos or catalogHashes):
+    catalogHashes.update(contentHashes)
+    DatabaseFunctions.refreshPhotoCatalog(dbPath, destinationPath, sorted(catalogHashes), catalogHashes, sourceSizes)
+  
+  return newPhotos
+
+
+def detectEyes(cvImage, scaledImage, scale, photoName, detector=None, detectionMaxDimension=None, 
+               maxDimension=1024, refineEyes=True, detectionDebug=False):
+  """Returns list of ((x, y), confidence, support) of eyes found in full size cvImage (scaledImage is it scaled by 1/scale).
+  
+  The confidence is None for eyes not refined onto the pupil center, support 
+  (how sure the detector is) None if the detector cannot tell."""
+  logger = logging.getLogger('ELIME.detectEyes')
+  
+  # find eye coordinates in scaled picture automatically
+  if detectionMaxDimension is None or detectionMaxDimension == maxDimension:
+    scaledEyes = DetectorFunctions.getDetector(detector).eyesInImage(scaledImage, photoName, detectionDebug)
+  else:
+    # tuned detection runs on its own image size
+    (detectionImage, detectionScale) = ImageFunctions.scaleCVImage(cvImage, detectionMaxDimension)
+    detectedEyes = DetectorFunctions.getDetector(detector).eyesInImage(detectionImage, photoName, detectionDebug)
+    scaledEyes = [(HelperFunctions.scaleRect(rect, detectionScale / scale), support) for (rect, support) in detectedEyes]
+  logger.debug("Scaled eye rectangles detected %s", scaledEyes)
+  
+  eyes = []
+  for (scaledEyeRect, support) in scaledEyes:
+    if refineEyes:
+      ((rx, ry), confidence) = OpenCvFunctions.refineEyeCenter(cvImage, HelperFunctions.scaleRect(scaledEyeRect, scale))
+      logger.debug("Refined eye center %s with confidence %f", (rx, ry), confidence)
+      eyes.append(((rx, ry), confidence, support))
+    else:
+      (sx, sy) = HelperFunctions.middleOfRect(scaledEyeRect)
+      eyes.append(((sx * scale, sy * scale), None, support))
+  
+  return eyes
+
+
+def detectEyesAhead(srcPath, dbPath, photoName, maxDimension=1024, detector=None, detectionMaxDimension=None, refineEyes=True):
+  """Detect eyes of photo in srcPath without any window and store them as candidates add starts with"""
+  logger = logging.getLogger('ELIME.detectEyesAhead')
+  
+  catalogPhoto = DatabaseFunctions.refreshPhotoCatalog(dbPath, srcPath, [photoName]).get(photoName)
+  if catalogPhoto is None:
+    logger.warning("Photo %s is gone, no eyes detected", photoName)
+    return
+  
+  # the proxy add shows comes for free here
+  (scaledImage, scale, cvImage) = ProxyFunctions.ProxyCache(srcPath, maxDimension).createProxy(catalogPhoto)
+  
+  eyes = detectEyes(cvImage, scaledImage, scale, photoName, detector, detectionMaxDimension, maxDimension, refineEyes)
+  
+  with DatabaseFunctions.writeTransaction(dbPath) as c:
+    DatabaseFunctions.storeEyeCandidates(c, photoName, catalogPhoto.mtime, eyes)
+  
+  logger.info("Detected %d eyes in photo %s ahead of add", len(eyes), photoName)
+
 
+def watchSourceFolder(sourcePath, destinationPath=None, prefix=None, delete=False, customDateFormat='', 
+                      normalizeOrientation=False, dbPath=None, detect=False, maxDimension=1024, 
+                      detector=None, detectionMaxDimension=None, refineEyes=True):
+  """Preprocess photos as soon as they are completely written to sourcePath, until interrupted.
+  
+  With detect their eyes get detected in the background, add then starts with those."""
+  logger = logging.getLogger('ELIME.watch')
   
+  if not sourcePath:
+    logger.error('sourcePath not valid')
+    return
   
-def addMissingEyeData(srcPath, dbPath, maxDimension=1024, detectionDebug=False, zoomSize=640, customDateFormat=''):
-  """Add eye postions of photos not yet in database to database"""
+  if not WatchFunctions.inotifyAvailable():
+    logger.error('Watching folders needs inotify (Linux). Call pre from a folder action or cron instead.')
+    return
+  
+  if detect and dbPath is None:
+    logger.error('Detecting eyes ahead needs a valid dbPath')
+    return
+  
+  if dbPath is not None:
+    DatabaseFunctions.prepareDataBaseTable(dbPath)
+  
+  detectionQueue = Queue.Queue()
+  
+  def detectQueuedPhotos():
+    while True:
+      photoName = detectionQueue.get()
+      if photoName is None:
+        return
+      try:
+        detectEyesAhead(destinationPath or sourcePath, dbPath, photoName, maxDimension, detector, 
+                        detectionMaxDimension, refineEyes)
+      except Exception:
+        logger.exception("Detecting eyes of photo %s failed", photoName)
+  
+  if detect:
+    detectionThread = threading.Thread(target=detectQueuedPhotos, name='ELIME detection')
+    detectionThread.start()
+  
+  try:
+    with WatchFunctions.FolderWatcher(sourcePath) as watcher:
+      logger.info("Watching %s for new photos, stop with ctrl-c", sourcePath)
+      
+      # photos dropped while nobody watched
+      photoNames = [name for (name, size, mtime) in HelperFunctions.scanPhotoFolder(sourcePath)]
+      
+      while True:
+        if photoNames:
+          newPhotos = preProcessImageFiles(sourcePath, destinationPath, prefix, delete, customDateFormat, 
+                                           normalizeOrientation, dbPath, sourcePhotos=photoNames)
+          if detect:
+            for photoName in newPhotos:
+              detectionQueue.put(photoName)
+        
+        photoNames = watcher.waitForPhotos()
+  except KeyboardInterrupt:
+    logger.info("Stopped watching %s", sourcePath)
+  finally:
+    if detect:
+      logger.info("Finishing eye detection of %d queued photos", detectionQueue.qsize())
+      detectionQueue.put(None)
+      detectionThread.join()
+
+
+def autoAcceptEyes(srcPath, dbPath, catalog, photoFileNames, dbPhotosByName, eyeCandidates, proxies, maxDimension=1024, 
+                   detectionDebug=False, customDateFormat='', detector=None, detectionMaxDimension=None, refineEyes=True, 
+                   autoAcceptScore=None):
+  """Detect eyes of photos and store those scoring at least autoAcceptScore in one transaction, returns their names.
+  
+  The eyes of the others are kept in eyeCandidates (and the database), so 
+  adjusting them by hand afterwards starts with them. autoAcceptScore 
+  defaults to ReviewFunctions.AUTOACCEPTSCORE."""
+  logger = logging.getLogger('ELIME.autoAcceptEyes')
+  
+  if autoAcceptScore is None:
+    autoAcceptScore = ReviewFunctions.AUTOACCEPTSCORE
+  
+  # relative eyes of the photos with eyes by capture time, the temporal prior
+  history = []
+  for photos in dbPhotosByName.values():
+    for photo in photos:
+      catalogPhoto = catalog.get(photo.photoFileName)
+      if None in (photo.lEyeX, photo.lEyeY, photo.rEyeX, photo.rEyeY) or catalogPhoto is None or catalogPhoto.width is None:
+        continue
+      width = ReviewFunctions.uprightSize(catalogPhoto)[0]
+      history.append((photo.captureEpoch, ReviewFunctions.relativeEyes((photo.lEyeX, photo.lEyeY), (photo.rEyeX, photo.rEyeY), width)))
+  history.sort(key=lambda (epoch, eyes): epoch)
+  historyEpochs = [epoch for (epoch, eyes) in history]
+  historyEyes = [eyes for (epoch, eyes) in history]
+  
+  def detectPhoto(photoFileName):
+    """Returns (eyes, width of upright photo) of photo, eyes detected ahead if it did not change since"""
+    catalogPhoto = catalog[photoFileName]
+    candidates = eyeCandidates.get(photoFileName)
+    if candidates is not None and candidates[0] == catalogPhoto.mtime and catalogPhoto.width is not None:
+      return (candidates[1], ReviewFunctions.uprightSize(catalogPhoto)[0])
+    
+    (scaledImage, scale, fullImage) = proxies.load(catalogPhoto)
+    eyes = detectEyes(fullImage.get() if refineEyes or detectionMaxDimension is not None else None, scaledImage, scale, 
+                      photoFileName, detector, detectionMaxDimension, maxDimension, refineEyes, detectionDebug)
+    return (eyes, scaledImage.shape[1] * scale)
+  
+  # detection runs ahead, while the photos before get scored
+  prefetcher = PrefetchFunctions.Prefetcher(detectPhoto, photoFileNames, 0 if detectionDebug else None)
+  
+  accepted = []
+  rejected = []
+  
+  for photoFileName in photoFileNames:
+    catalogPhoto = catalog[photoFileName]
+    (eyes, width) = prefetcher.get(photoFileName)
+    
+    photoDateTime = ImageFunctions.creationDateTime(os.path.join(srcPath, photoFileName), catalogPhoto.captureDate, 
+                                                    customDateFormat, catalogPhoto.mtime)
+    captureEpoch = DatabaseFunctions.dateTimeToEpoch(photoDateTime)
+    position = bisect.bisect_left(historyEpochs, captureEpoch)
+    prior = ReviewFunctions.temporalPrior(historyEyes[max(0, position - ReviewFunctions.PRIORPHOTOS):position])
+    
+    (score, parts) = ReviewFunctions.acceptanceScore(eyes, width, prior)
+    partsString = ', '.join('%s %.2f' % (name, parts[name]) for name in sorted(parts))
+    
+    if score < autoAcceptScore:
+      logger.info("Eyes of photo %s score %.2f (%s), left for manual adjustment", photoFileName, score, partsString)
+      rejected.append((photoFileName, catalogPhoto.mtime, eyes))
+      continue
+    
+    logger.info("Eyes of photo %s score %.2f (%s), accepted", photoFileName, score, partsString)
+    
+    # eyes left to right, like manual adjustment sorts them
+    (leftEye, rightEye) = [(int(round(x)), int(round(y))) for ((x, y), confidence, support) in sorted(eyes, key=lambda eye: eye[0][0])]
+    accepted.append((photoFileName, photoDateTime, leftEye, rightEye))
+    
+    # photos accepted now are the prior of the ones taken after them
+    historyEpochs.insert(position, captureEpoch)
+    historyEyes.insert(position, ReviewFunctions.relativeEyes(leftEye, rightEye, width))
+  
+  prefetcher.close()
+  
+  with DatabaseFunctions.writeTransaction(dbPath) as c:
+    for (photoFileName, photoDateTime, leftEye, rightEye) in accepted:
+      if photoFileName in dbPhotosByName:
+        DatabaseFunctions.updateEyes(c, photoFileName, leftEye, rightEye)
+      else:
+        DatabaseFunctions.insertPhoto(c, photoFileName, photoDateTime, leftEye, rightEye)
+      DatabaseFunctions.deleteEyeCandidates(c, photoFileName)
+    
+    for (photoFileName, mtime, eyes) in rejected:
+      DatabaseFunctions.storeEyeCandidates(c, photoFileName, mtime, eyes)
+      eyeCandidates[photoFileName] = (mtime, eyes)
+  
+  logger.info("Accepted eyes of %d photos automatically, %d left for manual adjustment", len(accepted), len(rejected))
+  
+  return set(photoFileName for (photoFileName, photoDateTime, leftEye, rightEye) in accepted)
+
+
+def addMissingEyeData(srcPath, dbPath, maxDimension=1024, detectionDebug=False, zoomSize=640, customDateFormat='', 
+                      detector=None, detectionMaxDimension=None, refineEyes=True, skipDetailConfidence=0.5, 
+                      autoAccept=False, autoAcceptScore=None):
+  """Add eye postions of photos not yet in database to database.
+  
+  With autoAccept eyes of all photos get detected first, the ones scoring at 
+  least autoAcceptScore get stored right away, only the others are shown."""
   logger = logging.getLogger('ELIME.addToDB')
    
   if dbPath is None:
@@ -198,84 +561,119 @@ def addMissingEyeData(srcPath, dbPath, maxDimension=1024, detectionDebug=False,
   # create database if it does not exist yet
   DatabaseFunctions.prepareDataBaseTable(dbPath)
   
-  # connect to database file
-  conn = sqlite3.connect(dbPath, detect_types=sqlite3.PARSE_DECLTYPES)
-  c = conn.cursor()
-  
-  # get all jpgs in source directory
-  srcFiles = [ f for f in os.listdir(srcPath) if os.path.isfile(os.path.join(srcPath,f)) ]
-  srcPhotos = filter(HelperFunctions.filefilter, srcFiles)
+  # get all jpgs in source directory, only new or changed ones get opened
+  catalog = DatabaseFunctions.refreshPhotoCatalog(dbPath, srcPath)
+  srcPhotos = sorted(catalog)
   
   numPhotos = len(srcPhotos)
   if numPhotos == 0:
-    logger.warning("No photos found in source path %s", srcpath)
+    logger.warning("No photos found in source path %s", srcPath)
     return
 
-  # get the number of pictures already in the database
-  numAllDBPhotos = DatabaseFunctions.numberOfPhotosInDB(c)
+  # get the number of pictures already in the database and all of them at once, 
+  # instead of querying once per photo
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    numAllDBPhotos = DatabaseFunctions.numberOfPhotosInDB(c)
+    allDBPhotos = DatabaseFunctions.photosInDB(c)
+    eyeCandidates = DatabaseFunctions.eyeCandidates(c)
   
   # simple consistency check on database: are there at least as many pictures in db as in
   # source path?
   if numPhotos < numAllDBPhotos:
-    logger.warning("There are just %d photos in source path %s, but %d photos in database %s", numPhotos, srcPAth, numAllDBPhotos, dbPath)
+    logger.warning("There are just %d photos in source path %s, but %d photos in database %s", numPhotos, srcPath, numAllDBPhotos, dbPath)
     logger.warning("Please run a database tidy before, if you know what you are doing!")
     return
   
+  dbPhotosByName = {}
+  for dbPhoto in allDBPhotos:
+    dbPhotosByName.setdefault(dbPhoto.photoFileName, []).append(dbPhoto)
+  
+  photosToAdd = [name for name in srcPhotos 
+                 if not any(None not in (p.lEyeX, p.lEyeY, p.rEyeX, p.rEyeY) for p in dbPhotosByName.get(name, []))]
+  
+  # downscaled photos get created ahead for all photos still needing eyes
+  proxies = ProxyFunctions.ProxyCache(srcPath, maxDimension)
+  proxies.prefetch([catalog[name] for name in photosToAdd])
+  
+  autoAccepted = set()
+  if autoAccept:
+    autoAccepted = autoAcceptEyes(srcPath, dbPath, catalog, [name for name in photosToAdd if len(dbPhotosByName.get(name, [])) <= 1], 
+                                  dbPhotosByName, eyeCandidates, proxies, maxDimension, detectionDebug, customDateFormat, 
+                                  detector, detectionMaxDimension, refineEyes, autoAcceptScore)
+    photosToAdd = [name for name in photosToAdd if name not in autoAccepted]
+  
+  def preparePhoto(photoFileName):
+    """Returns (scaled image, scale, FullSizeImage, eyes) of photo, all decoded and detected"""
+    catalogPhoto = catalog[photoFileName]
+    (scaledImage, scale, fullImage) = proxies.load(catalogPhoto)
+    
+    # take the eyes watch detected ahead, if the photo did not change since
+    candidates = eyeCandidates.get(photoFileName)
+    if candidates is not None and candidates[0] == catalogPhoto.mtime:
+      logger.debug("Using eyes detected ahead %s", candidates[1])
+      eyes = candidates[1]
+    else:
+      eyes = detectEyes(fullImage.get(), scaledImage, scale, photoFileName, detector, detectionMaxDimension, 
+                        maxDimension, refineEyes, detectionDebug)
+    
+    # the detail view might need it
+    fullImage.get()
+    
+    return (scaledImage, scale, fullImage, eyes)
+  
+  # the next photos get prepared while you adjust eyes, detection debug windows 
+  # need the main thread though
+  prefetcher = PrefetchFunctions.Prefetcher(preparePhoto, photosToAdd, 0 if detectionDebug else None, 
+                                            itemBytes=lambda name: ProxyFunctions.decodedBytes(catalog[name], maxDimension))
+  
+  # eye positions get committed in batches in the background
+  writes = DatabaseFunctions.WriteBehindQueue(dbPath)
+  
   # step through all pictures in sourcepath  
   for inputImageFileName in srcPhotos:
+    
+    if inputImageFileName in autoAccepted:
+      continue
       
     logger.debug("Image name: %s", inputImageFileName)
     
     inputImageFilePath = os.path.join(srcPath, inputImageFileName)
     
     # get picture's creation date and time
-    photoDateTime = ImageFunctions.getCreationDateTimeOfPicture(inputImageFilePath, customDateFormat)
+    catalogPhoto = catalog[inputImageFileName]
+    photoDateTime = ImageFunctions.creationDateTime(inputImageFilePath, catalogPhoto.captureDate, customDateFormat, catalogPhoto.mtime)
     
     # check if photo is already and database
-    c.execute('''SELECT * FROM eyesInPhotos WHERE photoFileName=?''',(inputImageFileName,))
-    dbPhotos = c.fetchall()
+    dbPhotos = dbPhotosByName.get(inputImageFileName, [])
 
     numDBPhotos = len(dbPhotos)
 
-    if numDBPhotos == 0 or (numDBPhotos == 1 and ((dbPhotos[0][3] is None) or (dbPhotos[0][4] is None) or (dbPhotos[0][5] is None) or (dbPhotos[0][6] is None))):
+    if numDBPhotos == 0 or (numDBPhotos == 1 and None in (dbPhotos[0].lEyeX, dbPhotos[0].lEyeY, dbPhotos[0].rEyeX, dbPhotos[0].rEyeY)):
       if numDBPhotos == 0:
         # the picture with this filename is not in database yet
         logger.info("Photo %s not in database yet", inputImageFileName)
       if numDBPhotos == 1:
         # there is one picture with the filename but data is incomplete
-        logger.info("Eye info for photo %s in db incomplete (%d,%d), (%d,%d)", inputImageFileName, dbPhotos[0][3], dbPhotos[0][4], dbPhotos[0][5], dbPhotos[0][6])
+        logger.info("Eye info for photo %s in db incomplete (%s,%s), (%s,%s)", inputImageFileName, dbPhotos[0].lEyeX, dbPhotos[0].lEyeY, dbPhotos[0].rEyeX, dbPhotos[0].rEyeY)
       
       # find eye positions and add everything to database
       
-      # create a opencv image from PIL image
-      pilImage = ImageFunctions.loadAndTransposePILImage(inputImageFilePath)
-      cvImage = ImageFunctions.convertPIL2CV(pilImage)
-
-      # get the image size
-      size = cv.GetSize(cvImage)
-  
-      # create scaling factor for too large images
-      maxDimension = float(maxDimension)
-      
-      scale = 1.0
-      if size[0] > maxDimension or size[1] > maxDimension:
-        scale = max(size[0]/maxDimension, size[1]/maxDimension)
-
+      # a scaled down version of the original picture, the original and 
+      # the eyes found in it, prepared while the photo before was on screen
+      (scaledImage, scale, fullImage, eyes) = prefetcher.get(inputImageFileName)
       logger.debug("Image scale factor is %f", scale)
       
-      newSize = ( int(size[0] / scale), int (size[1] / scale) )
-
-      # create a scaled down version of the original picture 
-      scaledImage = cv.CreateImage(newSize, cvImage.depth, cvImage.nChannels)
-      cv.Resize(cvImage, scaledImage)
-      
-      # find eye coordinates in scaled picture automatically
-      scaledEyeRects = OpenCvFunctions.eyeRectsInImage(scaledImage, inputImageFileName, detectionDebug)
-      logger.debug("Scaled eye rectangles detected %s", scaledEyeRects)
+      # refined full size eye centers and their confidence by proposed scaled position
+      refinedEyes = {}
       
       scaledEyeCoordinates = []
-      for scaledEyeRect in scaledEyeRects:
-        scaledEyeCoordinates.append(HelperFunctions.middleOfRect(scaledEyeRect))
+      for ((x, y), confidence, support) in eyes:
+        if confidence is None:
+          scaledEyePos = (int(round(x / scale)), int(round(y / scale)))
+        else:
+          scaledEyePos = (int(x / scale), int(y / scale))
+          refinedEyes[scaledEyePos] = ((int(round(x)), int(round(y))), confidence)
+        scaledEyeCoordinates.append(scaledEyePos)
       
       logger.debug("Scaled eye positions detected %s", scaledEyeCoordinates)
 
@@ -287,10 +685,19 @@ def addMissingEyeData(srcPath, dbPath, maxDimension=1024, detectionDebug=False,
       
       # scale back eye position to original sized image
       for eyeIndex, scaledEyePos in enumerate(scaledEyeCoordinates):
-        (sx, sy) = scaledEyePos
-        (eyecenterX, eyecenterY) = (int(sx * scale), int(sy * scale))
+        if scaledEyePos in refinedEyes:
+          # eye not moved by hand, take the refined full size position
+          ((eyecenterX, eyecenterY), confidence) = refinedEyes[scaledEyePos]
+          
+          if confidence >= skipDetailConfidence:
+            logger.info("Eye %d refined to %s with confidence %f. No detail adjustment needed.", eyeIndex, (eyecenterX, eyecenterY), confidence)
+            eyeCoordinates.append((eyecenterX, eyecenterY))
+            continue
+        else:
+          (sx, sy) = scaledEyePos
+          (eyecenterX, eyecenterY) = (int(sx * scale), int(sy * scale))
         logger.debug("True eye position of eye %d before manual correction %s", eyeIndex, (eyecenterX, eyecenterY))
-        (x, y) = UiFunctions.manuallyDetailAdjustEyePosition(inputImageFileName, eyeIndex, cvImage, eyecenterX, eyecenterY, zoomSize)
+        (x, y) = UiFunctions.manuallyDetailAdjustEyePosition(inputImageFileName, eyeIndex, fullImage.get(), eyecenterX, eyecenterY, zoomSize)
         logger.debug("True eye position of eye %d after manual correction %s", eyeIndex, (x, y))
         eyeCoordinates.append((x, y))
         
@@ -308,13 +715,8 @@ def addMissingEyeData(srcPath, dbPath, maxDimension=1024, detectionDebug=False,
           middleRightEye[0], 
           middleRightEye[1])
           
-        c.execute('INSERT INTO eyesInPhotos (photoFileName, date, lEyeX, lEyeY, rEyeX, rEyeY) VALUES (?, ?, ?, ?, ?, ?)', 
-          (inputImageFileName, 
-          photoDateTime, 
-          middleLeftEye[0], 
-          middleLeftEye[1], 
-          middleRightEye[0], 
-          middleRightEye[1]))
+        writes.put((DatabaseFunctions.insertPhoto, inputImageFileName, photoDateTime, middleLeftEye, middleRightEye), 
+                   (DatabaseFunctions.deleteEyeCandidates, inputImageFileName))
           
       else:
         # update entry in database			
@@ -323,34 +725,143 @@ def addMissingEyeData(srcPath, dbPath, maxDimension=1024, detectionDebug=False,
           middleLeftEye[1], 
           middleRightEye[0], 
           middleRightEye[1],
-          inputImageFileNam)
+          inputImageFileName)
         
-        c.execute('UPDATE eyesInPhotos SET lEyeX=?, lEyeY=?, rEyeX=?, rEyeY=? WHERE photoFileName=?', 
-          (middleLeftEye[0], 
-          middleLeftEye[1], 
-          middleRightEye[0], 
-          middleRightEye[1],
-          inputImageFileName))  
-      
-      conn.commit()
+        writes.put((DatabaseFunctions.updateEyes, inputImageFileName, middleLeftEye, middleRightEye), 
+                   (DatabaseFunctions.deleteEyeCandidates, inputImageFileName))
     
     # we found the image in the database with complete data or there are more than 1 image
     else:
       if numDBPhotos > 1:
         logger.critical("Database in bad shape. Found %d occurences of photo named %s", numDBPhotos, inputImageFileName)
-        conn.close() 
         sys.exit(1)
       else:
         logger.info("Photo %s already in db", inputImageFileName)
+  
+  writes.close()
+  prefetcher.close()
+  proxies.close()
         
-  newNumAllDBPhotos = DatabaseFunctions.numberOfPhotosInDB(c)
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    newNumAllDBPhotos = DatabaseFunctions.numberOfPhotosInDB(c)
         
-  logger.info("Added %d photos with eyeinfo to database %s",  newNumAllDBPhotos - numAllDBPhotos, dbPath)
-  conn.close()    
+  logger.info("Added %d photos with eyeinfo to database %s",  newNumAllDBPhotos - numAllDBPhotos, dbPath)    
+
+
+def rankSuspiciousPhotos(srcPath, dbPath, catalog, photoFileNames, number, proxies, maxDimension=1024, 
+                         detect=False, detector=None, detectionMaxDimension=None):
+  """Returns names of the number photos out of photoFileNames with the most suspicious eye positions, worst first"""
+  logger = logging.getLogger('ELIME.rankSuspiciousPhotos')
+  
+  # all photos take part, a photo's neighbours in time are its reference
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    photos = [photo for photo in DatabaseFunctions.photosInDB(c, withEyesOnly=True) if photo.photoFileName in catalog]
+    eyeCandidates = DatabaseFunctions.eyeCandidates(c)
+  
+  # detections of unchanged photos, watch --detect or an earlier check --detect made them
+  detectedEyes = {}
+  for photo in photos:
+    candidates = eyeCandidates.get(photo.photoFileName)
+    if candidates is not None and candidates[0] == catalog[photo.photoFileName].mtime:
+      detectedEyes[photo.photoFileName] = [eye for (eye, confidence, support) in candidates[1]]
+  
+  if detect:
+    missing = [photo.photoFileName for photo in photos if photo.photoFileName not in detectedEyes]
+    logger.info("Detecting eyes in %d photos without cached detection", len(missing))
+    writes = DatabaseFunctions.WriteBehindQueue(dbPath)
+    
+    for count, photoFileName in enumerate(missing):
+      catalogPhoto = catalog[photoFileName]
+      (scaledImage, scale, fullImage) = proxies.load(catalogPhoto)
+      
+      # the proxy is enough, unless detection is tuned to another size
+      cvImage = None
+      if detectionMaxDimension is not None and detectionMaxDimension != maxDimension:
+        cvImage = fullImage.get()
+      eyes = detectEyes(cvImage, scaledImage, scale, photoFileName, detector, detectionMaxDimension, 
+                        maxDimension, refineEyes=False)
+      
+      writes.put((DatabaseFunctions.storeEyeCandidates, photoFileName, catalogPhoto.mtime, eyes))
+      detectedEyes[photoFileName] = [eye for (eye, confidence, support) in eyes]
+      
+      if (count + 1) % 100 == 0:
+        logger.info("Detected eyes in %d of %d photos", count + 1, len(missing))
+    
+    writes.close()
+  
+  wanted = set(photoFileNames)
+  suspects = ReviewFunctions.suspiciousPhotos([photo for photo in photos if photo.photoFileName in wanted], 
+                                              number, detectedEyes)
+  
+  for rank, (photo, score, scores) in enumerate(suspects):
+    logger.info("Suspect %d: %s score %.1f (%s)", rank + 1, photo.photoFileName, score, 
+                ', '.join('%s %.1f' % (signal, scores[signal]) for signal in ReviewFunctions.SIGNALS))
+  
+  return [photo.photoFileName for (photo, score, scores) in suspects]
 
 
-def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=640, detailOnly=True):
-  """Check and correct eye positions in database on all or selected image files"""
+def reviewContactSheet(srcPath, dbPath, catalog, photoFileNames, proxies, zoomSize=640):
+  """Show eyes of photos as pages of aligned tiles, clicked tiles open in the detail view for correction"""
+  logger = logging.getLogger('ELIME.reviewContactSheet')
+  
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    photosByName = dict((photo.photoFileName, photo) for photo in DatabaseFunctions.photosInDB(c, withEyesOnly=True))
+  photoFileNames = [name for name in photoFileNames if name in photosByName]
+  
+  perPage = ReviewFunctions.SHEETCOLUMNS * ReviewFunctions.SHEETROWS
+  pages = [photoFileNames[start:start + perPage] for start in range(0, len(photoFileNames), perPage)]
+  
+  tiles = ReviewFunctions.TileCache(proxies, catalog)
+  writes = DatabaseFunctions.WriteBehindQueue(dbPath)
+  windowName = 'ELIME check'
+  page = 0
+  
+  while page < len(pages):
+    logger.info("Page %d of %d, click photos to correct", page + 1, len(pages))
+    
+    # tiles of the pages before and after stay, the next page gets made while you look
+    tiles.retain([photosByName[name] for name in sum(pages[max(0, page - 1):page + 2], [])])
+    if page + 1 < len(pages):
+      tiles.prefetch([photosByName[name] for name in pages[page + 1]])
+    
+    pagePhotos = [photosByName[name] for name in pages[page]]
+    (action, index) = UiFunctions.chooseContactSheetTile(windowName, tiles.get(pagePhotos), 
+                                                         ReviewFunctions.TILESIZE, ReviewFunctions.SHEETCOLUMNS)
+    
+    if action == 'next':
+      page += 1
+    elif action == 'previous':
+      page = max(0, page - 1)
+    elif action == 'open':
+      photo = pagePhotos[index]
+      fullImage = ProxyFunctions.FullSizeImage(os.path.join(srcPath, photo.photoFileName), 
+                                               catalog[photo.photoFileName].orientation).get()
+      
+      (middleLeftEye, middleRightEye) = [UiFunctions.manuallyDetailAdjustEyePosition(photo.photoFileName, eyeIndex, fullImage, x, y, zoomSize) 
+                                         for eyeIndex, (x, y) in enumerate([(photo.lEyeX, photo.lEyeY), (photo.rEyeX, photo.rEyeY)])]
+      
+      logger.info("Executing: 'UPDATE eyesInPhotos SET lEyeX=%d, lEyeY=%d, rEyeX=%d, rEyeY=%d WHERE photoFileName=%s'",
+        middleLeftEye[0], middleLeftEye[1], middleRightEye[0], middleRightEye[1], photo.photoFileName)
+      
+      writes.put((DatabaseFunctions.updateEyes, photo.photoFileName, middleLeftEye, middleRightEye), 
+                 (DatabaseFunctions.deleteEyeCandidates, photo.photoFileName))
+      
+      photosByName[photo.photoFileName] = photo._replace(lEyeX=middleLeftEye[0], lEyeY=middleLeftEye[1], 
+                                                         rEyeX=middleRightEye[0], rEyeY=middleRightEye[1])
+  
+  writes.close()
+  cv2.destroyWindow(windowName)
+  tiles.close()
+
+
+def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=640, detailOnly=True, 
+                 suspicious=0, detect=False, detector=None, detectionMaxDimension=None, sheet=False):
+  """Check and correct eye positions in database on all or selected image files.
+  
+  With suspicious > 0 only that many photos get checked, the ones whose eye 
+  positions look most unlikely first. detect detects eyes (on the proxies) of 
+  photos without cached detection to compare the stored positions with. 
+  sheet shows many photos at once as contact sheet instead of one by one."""
   logger = logging.getLogger('ELIME.checkEyeDataOfPhotos')
   
   logger.info("Checking eyepositions stored in db")
@@ -363,9 +874,8 @@ def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=64
     logger.error("srcPath is invalid")
     return
   
-  # connect to databse
-  conn = sqlite3.connect(dbPath, detect_types=sqlite3.PARSE_DECLTYPES)
-  c = conn.cursor() 
+  # make sure all tables exist
+  DatabaseFunctions.prepareDataBaseTable(dbPath)
   
   # get list of files to check eye positions
   # assume we get it alphabetically ordered
@@ -374,7 +884,8 @@ def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=64
   
   processing = True
   
-  filenames = [ f for f in os.listdir(srcPath) if os.path.isfile(os.path.join(srcPath,f)) ]
+  catalog = DatabaseFunctions.refreshPhotoCatalog(dbPath, srcPath)
+  filenames = sorted(catalog)
   
   if len(beginWith) == 0:
     logger.debug("No filename to begin with specified. Will check all.")
@@ -382,8 +893,47 @@ def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=64
     logger.debug("Starting with photo named %s", beginWith[0])
     processing = False
   
-  # filter for jpgs   
-  filenames = filter(HelperFunctions.filefilter, filenames)
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    dbPhotoFileNames = set(DatabaseFunctions.photoFileNamesInDB(c))
+  photosToCheck = [name for name in filenames if (processing or name >= beginWith[0]) and name in dbPhotoFileNames]
+  
+  # the overview window shows downscaled photos, create them ahead
+  proxies = ProxyFunctions.ProxyCache(srcPath, maxDimension)
+  
+  if suspicious > 0:
+    photosToCheck = rankSuspiciousPhotos(srcPath, dbPath, catalog, photosToCheck, suspicious, proxies, 
+                                         maxDimension, detect, detector, detectionMaxDimension)
+    # check them in ranked order, no matter where they are in the folder
+    filenames = photosToCheck
+    processing = True
+  
+  if sheet:
+    # tiles get made from proxies
+    proxies.prefetch([catalog[name] for name in photosToCheck])
+    reviewContactSheet(srcPath, dbPath, catalog, photosToCheck, proxies, zoomSize)
+    proxies.close()
+    logger.info("Checking Eyepositions finished.")
+    return
+  
+  if not detailOnly:
+    proxies.prefetch([catalog[name] for name in photosToCheck])
+  
+  def preparePhoto(photoFileName):
+    """Returns (scaled image, scale, FullSizeImage) of photo, scaled image None with detailOnly"""
+    if detailOnly:
+      fullImage = ProxyFunctions.FullSizeImage(os.path.join(srcPath, photoFileName), catalog[photoFileName].orientation)
+      (scaledImage, scale) = (None, None)
+    else:
+      (scaledImage, scale, fullImage) = proxies.load(catalog[photoFileName])
+    fullImage.get()
+    return (scaledImage, scale, fullImage)
+  
+  # the next photos get decoded while you check
+  prefetcher = PrefetchFunctions.Prefetcher(preparePhoto, photosToCheck, 
+                                            itemBytes=lambda name: ProxyFunctions.decodedBytes(catalog[name], maxDimension))
+  
+  # corrections get committed in batches in the background
+  writes = DatabaseFunctions.WriteBehindQueue(dbPath)
   
   for filename in filenames:
     # start processing with given filename, if any
@@ -398,8 +948,8 @@ def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=64
     inputImageFilePath = os.path.join(srcPath, filename)
     
     # get pictures stored info from database
-    c.execute('''SELECT * FROM eyesInPhotos WHERE photoFileName=?''',(filename,))
-    dbPhotos = c.fetchall()
+    with DatabaseFunctions.readTransaction(dbPath) as c:
+      dbPhotos = DatabaseFunctions.photosNamed(c, filename)
 
     numDBPhotos = len(dbPhotos)
 
@@ -408,39 +958,24 @@ def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=64
       continue
       
     if numDBPhotos == 1:
-      lEyeX = int(dbPhotos[0][3])
-      lEyeY = int(dbPhotos[0][4])
-      rEyeX = int(dbPhotos[0][5])
-      rEyeY = int(dbPhotos[0][6])
+      lEyeX = int(dbPhotos[0].lEyeX)
+      lEyeY = int(dbPhotos[0].lEyeY)
+      rEyeX = int(dbPhotos[0].rEyeX)
+      rEyeY = int(dbPhotos[0].rEyeY)
       
       logger.debug("Eye position in db: lEyeX=%d, lEyeY=%d, rEyeX=%d, rEyeY=%d", lEyeX, lEyeY, rEyeX, rEyeY) 
       
-      # load image to opencv image
-      pilImage = ImageFunctions.loadAndTransposePILImage(inputImageFilePath)
-      cvImage = ImageFunctions.convertPIL2CV(pilImage)
-
-      # scale it down
-      size = cv.GetSize(cvImage)
-      
-      maxDimension = float(maxDimension)
-      
-      scale = 1.0
-      if size[0] > maxDimension or size[1] > maxDimension:
-        scale = max(size[0]/maxDimension, size[1]/maxDimension)
-
-      newSize = ( int(size[0] / scale), int (size[1] / scale) )
-
-      scaledImage = cv.CreateImage(newSize, cvImage.depth, cvImage.nChannels)
-      cv.Resize(cvImage, scaledImage)
-      
-      # calculate scaled eye coordinates      
-      scaledEyeCoordinates = [(int(lEyeX / scale), int(lEyeY / scale)),
-                              (int(rEyeX / scale), int(rEyeY / scale))]
+      # images prepared while the photo before was on screen
+      (scaledImage, scale, fullImage) = prefetcher.get(filename)
       
       eyeCoordinates = [(lEyeX, lEyeY), (rEyeX, rEyeY)]
       
       # if we show not only show the zoomed detail one eye view but the whole picture
       if not detailOnly:
+        # scaled down eye coordinates
+        scaledEyeCoordinates = [(int(lEyeX / scale), int(lEyeY / scale)),
+                                (int(rEyeX / scale), int(rEyeY / scale))]
+        
         # coarse eye positions in total face/image view
         newScaledEyeCoordinates = UiFunctions.manuallyAdjustEyePositions(scaledImage, filename, scaledEyeCoordinates)  
       
@@ -459,7 +994,7 @@ def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=64
       for eyeIndex, eyeCoordinate in enumerate(eyeCoordinates):
         logger.debug("Eye position of eye %d before manual correction %s", eyeIndex, (eyeCoordinate[0], eyeCoordinate[1]))
         
-        (x, y) = UiFunctions.manuallyDetailAdjustEyePosition(filename, eyeIndex, cvImage, eyeCoordinate[0], eyeCoordinate[1], zoomSize)
+        (x, y) = UiFunctions.manuallyDetailAdjustEyePosition(filename, eyeIndex, fullImage.get(), eyeCoordinate[0], eyeCoordinate[1], zoomSize)
         
         logger.debug("True eye position of eye %d after manual correction %s", eyeIndex, (x, y))
         newEyeCoordinates.append((x, y))
@@ -475,22 +1010,18 @@ def checkEyeData(srcPath, dbPath, beginWith=[], maxDimension = 1024, zoomSize=64
         middleRightEye[1],
         filename)
       
-      c.execute('UPDATE eyesInPhotos SET lEyeX=?, lEyeY=?, rEyeX=?, rEyeY=? WHERE photoFileName=?', 
-        (middleLeftEye[0], 
-        middleLeftEye[1], 
-        middleRightEye[0], 
-        middleRightEye[1],
-        filename))  
-    
-      conn.commit()
+      writes.put((DatabaseFunctions.updateEyes, filename, middleLeftEye, middleRightEye), 
+                 (DatabaseFunctions.deleteEyeCandidates, filename))
 
     if numDBPhotos > 1:
       logger.critical("Database in bad shape. Found %d occurences of photo named %s", numDBPhotos, filename)
-      conn.close() 
       sys.exit(1)
   
-  logger.info("Checking Eyepositions finished.")   
-  conn.close() 
+  writes.close()
+  prefetcher.close()
+  proxies.close()
+  
+  logger.info("Checking Eyepositions finished.")
 
 
 def tidyDB(srcPath, dbPath):
@@ -505,12 +1036,18 @@ def tidyDB(srcPath, dbPath):
     logger.error("srcPath is invalid")
     return
   
-  # connect to the database  
-  conn = sqlite3.connect(dbPath, detect_types=sqlite3.PARSE_DECLTYPES)
-  c = conn.cursor() 
+  # make sure all tables exist
+  DatabaseFunctions.prepareDataBaseTable(dbPath)
   
+  catalog = DatabaseFunctions.refreshPhotoCatalog(dbPath, srcPath)
   
-  numDBPhotos = DatabaseFunctions.numberOfPhotosInDB(c)
+  numProxies = ProxyFunctions.removeStaleProxies(catalog)
+  if numProxies:
+    logger.info("Removed %d proxies of deleted or changed photos", numProxies)
+  
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    numDBPhotos = DatabaseFunctions.numberOfPhotosInDB(c)
+    dbPhotoFileNames = DatabaseFunctions.photoFileNamesInDB(c)
   
   if numDBPhotos == 0:
     logger.error("The Database at %s is empty already", dbPath)
@@ -519,18 +1056,8 @@ def tidyDB(srcPath, dbPath):
   logger.info("Start tidying database %s. There are %d photos in DB before tidying.", dbPath, numDBPhotos)
   
   # now find all db photos that cannot be found on disk aka srcPath anymore 
-  c.execute('''SELECT * FROM eyesInPhotos ORDER BY date''')
-  dbPhotos = c.fetchall()
-  
-  photosToDelete = []
-  
-  for photo in dbPhotos:
-    path = os.path.join(srcPath, photo[1])
-    if os.path.exists(path):
-      logger.debug("Photo %s found on disk", photo[1])
-    else:
-      logger.debug("Photo %s not found on disk. Add to delete list.", photo[1])
-      photosToDelete.append(photo[1])
+  photosToDelete = [name for name in dbPhotoFileNames if name not in catalog]
+  logger.debug("Photos not found on disk: %s", photosToDelete)
 
   numDelete = len(photosToDelete)
   
@@ -541,21 +1068,20 @@ def tidyDB(srcPath, dbPath):
     
     decision = raw_input('Do you want to remove these photos from database? [delete/no]:')
     if decision == 'delete':
-      for name in photosToDelete:
-        c.execute('''DELETE FROM eyesInPhotos WHERE photoFileName=?''', (name,))
-        logger.debug("Executing: 'DELETE FROM eyesInPhotos WHERE photoFileName=%s'", name)
-        conn.commit()
+      # all deletions in one transaction
+      with DatabaseFunctions.writeTransaction(dbPath) as c:
+        numDeleted = DatabaseFunctions.deletePhotos(c, photosToDelete)
+      logger.debug("Deleted %d photos from database", numDeleted)
     else:
       print "Deletion aborted."
       
   else:
     print "All photos in DB", dbPath ,"were found in srcPath", srcPath
       
-  numDBPhotos = DatabaseFunctions.numberOfPhotosInDB(c)    
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    numDBPhotos = DatabaseFunctions.numberOfPhotosInDB(c)    
   logger.info("Finished tidying database %s. There are %d photos in DB now.", dbPath, numDBPhotos)
   
-  conn.close()
-  
   
 def renderPhotos(srcPath, dstPath, dbPath, mode='fill', offset_pct=(0.43,0.425),
                  dest_sz=(1920,1080), ttfontpath="./HelveticaNeueLight.ttf", 
@@ -597,91 +1123,282 @@ def renderPhotos(srcPath, dstPath, dbPath, mode='fill', offset_pct=(0.43,0.425),
       logger.error("Fontpath %s is not a file", ttfontpath)
       return None
       
-  # connect to database
-  conn = sqlite3.connect(dbPath, detect_types=sqlite3.PARSE_DECLTYPES)
-  c = conn.cursor() 
+  # make sure all tables exist
+  DatabaseFunctions.prepareDataBaseTable(dbPath)
+  
+  catalog = DatabaseFunctions.refreshPhotoCatalog(dbPath, srcPath)
   
   # get photos ordered by date
-  c.execute('''SELECT * FROM eyesInPhotos ORDER BY date''')
-  dbPhotos = c.fetchall()
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    dbPhotos = DatabaseFunctions.photosInDB(c)
   
   for photo in dbPhotos:
-    if not os.path.exists(os.path.join(srcPath, photo[1])):
-      logger.error("Photo %s does not exist in srcPath %s! Check path, do tidydb, then try again!", photo[1], srcPath)
+    if photo.photoFileName not in catalog:
+      logger.error("Photo %s does not exist in srcPath %s! Check path, do tidydb, then try again!", photo.photoFileName, srcPath)
       sys.exit(1)
   
   # get time span of pictures in database      
-  firstDatetime = dbPhotos[0][2].date()
-  lastDatetime = dbPhotos[-1][2].date()
+  firstDay = dbPhotos[0].captureDay
+  lastDay = dbPhotos[-1].captureDay
   
-  logger.info("First photo %s in database taken on %s", dbPhotos[0][1], firstDatetime)
-  logger.info("Last photo %s in database taken on %s", dbPhotos[-1][1], lastDatetime)
+  logger.info("First photo %s in database taken on %s", dbPhotos[0].photoFileName, dbPhotos[0].date.date())
+  logger.info("Last photo %s in database taken on %s", dbPhotos[-1].photoFileName, dbPhotos[-1].date.date())
 
   # in fill mode, there will be created a frame for every day in the time span interval
   # if there is a picture in the database for each day or not
   # it is assumed that there is only one picture per date.
   if mode == 'fill':
     
-    numdays = (lastDatetime - firstDatetime).days
+    numdays = lastDay - firstDay
     logger.info("Will generate %d frames", numdays)
     
-    dates = [firstDatetime + timedelta(days=i) for i in range(0, numdays + 1)]
+    # first photo of every day, photos come ordered by capture time
+    photosByDay = {}
+    for photo in dbPhotos:
+      photosByDay.setdefault(photo.captureDay, photo)
   
     brightness = 1.0
     
     lastPhoto = None
-    for aDate in dates:
-      for photo in dbPhotos:
-        if photo[2].date() == aDate:
-          lastPhoto = photo
-          brightness = 1.0
-          break
+    for day in range(firstDay, lastDay + 1):
+      if day in photosByDay:
+        lastPhoto = photosByDay[day]
+        brightness = 1.0
       else:
-        logger.debug("No photo for date %s in database", aDate)
         brightness *= 0.90
-        lastPhoto = (lastPhoto[0], lastPhoto[1], datetime(aDate.year, aDate.month, aDate.day), lastPhoto[3], lastPhoto[4], lastPhoto[5], lastPhoto[6])
+        lastPhoto = lastPhoto.onDay(day)
+        logger.debug("No photo for date %s in database", lastPhoto.date.date())
+      
+      aDate = lastPhoto.date
 
-      logger.info("Rendering Image %s, date %s", lastPhoto[1], lastPhoto[2].strftime(format))
+      logger.info("Rendering Image %s, date %s", lastPhoto.photoFileName, lastPhoto.date.strftime(format))
       
-      pilImage = ImageFunctions.renderPhoto(srcPath, lastPhoto, ttfont, format, offset_pct, dest_sz, brightness, posDebug)
+      pilImage = ImageFunctions.renderPhoto(srcPath, lastPhoto, ttfont, format, offset_pct, dest_sz, brightness, posDebug, 
+                                            catalog[lastPhoto.photoFileName].orientation)
       
       if show:
         cvImage = ImageFunctions.convertPIL2CV(pilImage)
-        cv.NamedWindow(lastPhoto[1]+ " " + aDate.strftime(format), cv.CV_WINDOW_AUTOSIZE)
-        cv.ShowImage(lastPhoto[1]+ " " + aDate.strftime(format), cvImage) 
-        key = cv.WaitKey()
+        cv2.namedWindow(lastPhoto.photoFileName+ " " + aDate.strftime(format), cv2.WINDOW_AUTOSIZE)
+        cv2.imshow(lastPhoto.photoFileName+ " " + aDate.strftime(format), cvImage) 
+        key = cv2.waitKey(0)
         
         if key == 113: # 'q' quit
           sys.exit(0)  
         
-        cv.DestroyWindow(lastPhoto[1]+ " " + aDate.strftime(format))
+        cv2.destroyWindow(lastPhoto.photoFileName+ " " + aDate.strftime(format))
       
-      pilImage.save(os.path.join(dstPath, 'rendered_' + lastPhoto[2].strftime("%Y_%m_%d") + '.jpg'), quality=95)
+      pilImage.save(os.path.join(dstPath, 'rendered_' + lastPhoto.date.strftime("%Y_%m_%d") + '.jpg'), quality=95)
   
   # in all mode render every picture in database, skip dates with no pics
   if mode == 'all':
     for photo in dbPhotos:
-      logger.info("Rendering Image %s, date %s", photo[1], photo[2].strftime(format))
+      logger.info("Rendering Image %s, date %s", photo.photoFileName, photo.date.strftime(format))
     
-      pilImage = ImageFunctions.renderPhoto(srcPath, photo, ttfont, format, offset_pct, dest_sz, 1.0, posDebug)      
+      pilImage = ImageFunctions.renderPhoto(srcPath, photo, ttfont, format, offset_pct, dest_sz, 1.0, posDebug, 
+                                            catalog[photo.photoFileName].orientation)
       
       if show:
         cvImage = ImageFunctions.convertPIL2CV(pilImage)
-        cv.NamedWindow(photo[1]+ " " + photo[2].strftime(format), cv.CV_WINDOW_AUTOSIZE)
-        cv.ShowImage(photo[1]+ " " + photo[2].strftime(format), cvImage) 
-        key = cv.WaitKey()
+        cv2.namedWindow(photo.photoFileName+ " " + photo.date.strftime(format), cv2.WINDOW_AUTOSIZE)
+        cv2.imshow(photo.photoFileName+ " " + photo.date.strftime(format), cvImage) 
+        key = cv2.waitKey(0)
         
         if key == 113: # 'q' quit
           sys.exit(0)  
         
-        cv.DestroyWindow(photo[1]+ " " + photo[2].strftime(format))
+        cv2.destroyWindow(photo.photoFileName+ " " + photo.date.strftime(format))
           
-      pilImage.save(os.path.join(dstPath, 'rendered_' + photo[2].strftime("%Y_%m_%d") + '.jpg'), quality=95)
-    
-  conn.close()       
+      pilImage.save(os.path.join(dstPath, 'rendered_' + photo.date.strftime("%Y_%m_%d") + '.jpg'), quality=95)
       
   # ffmpeg -f image2 -r 5 -pattern_type glob -i 'render*.jpg' -c:v libx264 -r 30 out.mp4    
   
+
+def benchmarkDetectors(srcPath, dbPath, detectorNames, maxDimension=1024, sampleSize=0):
+  """Run detector backends on photos with stored eye positions, report latency and pixel error.
+  
+  No detectorNames means all backends that can run with the current settings."""
+  logger = logging.getLogger('ELIME.benchmarkDetectors')
+  
+  if dbPath is None:
+    logger.error("dbPath is not valid")
+    return
+    
+  if srcPath is None:
+    logger.error("srcPath is not valid")
+    return
+  
+  # make sure all tables exist
+  DatabaseFunctions.prepareDataBaseTable(dbPath)
+  
+  # eye positions confirmed by hand are the ground truth
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    dbPhotos = DatabaseFunctions.photosInDB(c, withEyesOnly=True)
+  
+  if sampleSize and sampleSize < len(dbPhotos):
+    dbPhotos = random.sample(dbPhotos, sampleSize)
+  
+  if len(dbPhotos) == 0:
+    logger.error("No photos with eye positions in database %s", dbPath)
+    return
+  
+  if len(detectorNames) == 0:
+    # one backend not set up must not stop the others
+    detectorNames = []
+    for name in sorted(DetectorFunctions.DETECTORS):
+      reason = DetectorFunctions.getDetector(name).unavailableReason()
+      if reason is None:
+        detectorNames.append(name)
+      else:
+        logger.warning("Skipping detector %s: %s", name, reason)
+  else:
+    for name in detectorNames:
+      reason = DetectorFunctions.getDetector(name).unavailableReason()
+      if reason is not None:
+        logger.critical("Detector %s can not run: %s", name, reason)
+        sys.exit(1)
+  
+  if len(detectorNames) == 0:
+    logger.error("No detector can run, check the cascade folders and dnnModelFile")
+    return
+  
+  logger.info("Benchmarking detectors %s on %d photos", ', '.join(detectorNames), len(dbPhotos))
+  
+  detectors = [DetectorFunctions.getDetector(name) for name in detectorNames]
+  latencies = dict((name, []) for name in detectorNames)
+  errors = dict((name, []) for name in detectorNames)
+  
+  for photo in dbPhotos:
+    inputImageFilePath = os.path.join(srcPath, photo.photoFileName)
+    if not os.path.exists(inputImageFilePath):
+      logger.warning("Photo %s does not exist in srcPath %s, skipped", photo.photoFileName, srcPath)
+      continue
+    
+    pilImage = ImageFunctions.loadAndTransposePILImage(inputImageFilePath)
+    cvImage = ImageFunctions.convertPIL2CV(pilImage)
+    (scaledImage, scale) = ImageFunctions.scaleCVImage(cvImage, maxDimension)
+    
+    for name, detector in zip(detectorNames, detectors):
+      start = time.time()
+      eyeRects = detector.eyeRectsInImage(scaledImage, photo.photoFileName)
+      latencies[name].append(time.time() - start)
+      
+      if len(eyeRects) != 2:
+        logger.debug("%s found %d eyes in %s", name, len(eyeRects), photo.photoFileName)
+        continue
+      
+      (lx, ly) = HelperFunctions.middleOfRect(eyeRects[0])
+      (rx, ry) = HelperFunctions.middleOfRect(eyeRects[1])
+      
+      error = (math.hypot(lx * scale - photo.lEyeX, ly * scale - photo.lEyeY) + 
+               math.hypot(rx * scale - photo.rEyeX, ry * scale - photo.rEyeY)) / 2.0
+      errors[name].append(error)
+      logger.debug("%s mean eye error in %s: %.1f px", name, photo.photoFileName, error)
+  
+  print "{0:8} {1:>7} {2:>8} {3:>9} {4:>9} {5:>9} {6:>11} {7:>11}".format('detector', 'photos', 'found 2', 
+    'p50 ms', 'p90 ms', 'p99 ms', 'p50 err px', 'p90 err px')
+  
+  for name in detectorNames:
+    times = sorted(latencies[name])
+    if len(times) == 0:
+      continue
+    errs = sorted(errors[name])
+    errorColumns = ['-', '-']
+    if len(errs):
+      errorColumns = ['{0:.1f}'.format(HelperFunctions.percentile(errs, p)) for p in (50, 90)]
+    
+    print "{0:8} {1:7d} {2:7.1f}% {3:9.1f} {4:9.1f} {5:9.1f} {6:>11} {7:>11}".format(name, len(times), 
+      100.0 * len(errs) / len(times), HelperFunctions.percentile(times, 50) * 1000, 
+      HelperFunctions.percentile(times, 90) * 1000, HelperFunctions.percentile(times, 99) * 1000, 
+      errorColumns[0], errorColumns[1])
+  
+
+def tuneDetectionParameters(srcPath, dbPath, configPath, maxDimension=1024, sampleSize=50, targetAccuracy=0.95, processes=None):
+  """Find fastest eye detection parameters that are accurate enough on photos in database, save them to config file"""
+  logger = logging.getLogger('ELIME.tune')
+  
+  if dbPath is None:
+    logger.error("dbPath is not valid")
+    return
+    
+  if srcPath is None:
+    logger.error("srcPath is not valid")
+    return
+  
+  # make sure all tables exist
+  DatabaseFunctions.prepareDataBaseTable(dbPath)
+  
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    dbPhotos = DatabaseFunctions.photosInDB(c, withEyesOnly=True)
+  
+  if sampleSize and sampleSize < len(dbPhotos):
+    dbPhotos = random.sample(dbPhotos, sampleSize)
+  
+  if len(dbPhotos) == 0:
+    logger.error("No photos with eye positions in database %s", dbPath)
+    return
+  
+  result = TuneFunctions.tuneDetection(srcPath, dbPhotos, maxDimension, targetAccuracy, processes)
+  
+  if result is None:
+    logger.error("None of the photos could be read from %s", srcPath)
+    return
+  
+  (parameters, accuracy, seconds) = result
+  
+  logger.info("Best parameters: %s", parameters)
+  logger.info("Accuracy %.1f%%, %.1f ms per photo", accuracy * 100, seconds * 1000)
+  
+  if configPath is None or not os.path.exists(configPath):
+    logger.warning("No config file to save the parameters to. Create one with --createConf.")
+    return
+  
+  HelperFunctions.updateConfigFile(configPath, 'ELIME', parameters)
+  logger.info("Saved parameters to config file %s", configPath)
+  
+
+def exportEyePositions(dbPath, path):
+  """Export eye positions of all photos in database to columnar numpy or csv files at path"""
+  logger = logging.getLogger('ELIME.export')
+  
+  if dbPath is None or not os.path.exists(dbPath):
+    logger.error("dbPath is not valid")
+    return
+  
+  if path is None:
+    logger.error("Export path is not valid")
+    return
+  
+  DatabaseFunctions.prepareDataBaseTable(dbPath)
+  
+  numPhotos = ExportFunctions.exportEyeData(dbPath, path)
+  logger.info("Exported %d photos to %s", numPhotos, path)
+
+
+def importEyePositions(dbPath, path, dryRun=False):
+  """Import eye positions from export at path into database, print what changed"""
+  logger = logging.getLogger('ELIME.import')
+  
+  if dbPath is None:
+    logger.error("dbPath is not valid")
+    return
+  
+  if path is None or not os.path.exists(path):
+    logger.error("Import path %s does not exist", path)
+    return
+  
+  DatabaseFunctions.prepareDataBaseTable(dbPath)
+  
+  (added, changed, unchanged, onlyInDB) = ExportFunctions.importEyeData(dbPath, path, dryRun)
+  
+  for name in added:
+    print "added  ", name
+  for (name, oldEyes, newEyes) in changed:
+    print "changed", name, oldEyes, "->", newEyes
+  
+  print len(added), "added,", len(changed), "changed,", unchanged, "unchanged,", len(onlyInDB), "only in database"
+  if dryRun:
+    print "Dry run, database", dbPath, "not changed."
+  
   
 def main():
 
@@ -701,6 +1418,42 @@ def main():
   # delete - If ELIME should move (and not copy) your photos while renaming
   #  from sourceFolder to photoFolder
   delete = true
+  
+  # normalizeOrientation - If ELIME's pre(process) command should store 
+  #  rotated photos upright (lossless if jpegtran is installed), so they 
+  #  never need to be turned again when loading
+  normalizeOrientation = false
+  
+  # ingestThreads - Number of photos ELIME's pre(process) command reads and 
+  #  transfers at once
+  ingestThreads = 4
+  
+  # ingestHardlinks - If pre(process) may hardlink instead of copying when 
+  #  delete is false. Source and destination then share the same data.
+  ingestHardlinks = false
+  
+  # watchSettleSeconds - Seconds ELIME's watch command waits after a photo 
+  #  in sourceFolder got written, before it gets preprocessed
+  watchSettleSeconds = 2.0
+  
+  # watchDetect - If ELIME's watch command should detect eyes of new photos 
+  #  right away (without windows), so add can start with them
+  watchDetect = false
+  
+  # proxyFolder - Folder where ELIME keeps photos scaled down to maxSize, so 
+  #  add and check show them without decoding the full size photo. Remove 
+  #  the line to do without.
+  proxyFolder = ~/Documents/ELIME Project/Proxies/
+  
+  # proxyThreads - Number of threads creating missing proxies in the background
+  proxyThreads = 2
+  
+  # prefetchPhotos - Number of photos add and check prepare (decode, detect 
+  #  eyes) ahead, while you adjust the one on screen. 0 turns it off.
+  prefetchPhotos = 3
+  
+  # prefetchMegabytes - Memory the photos prepared ahead may take at most
+  prefetchMegabytes = 512
 
   # photoFolder - The folder where all your (preprocessed) daily photos
   #  savely and permanently are stored. The names of the photos in that 
@@ -729,13 +1482,79 @@ def main():
   # openCVHaarcascadesFolder - Path to where your opencv installation's 
   #  haarcascades reside.
   openCVHaarcascadesFolder = /usr/local/opt/opencv/share/OpenCV/haarcascades/
+  
+  # detector - Which detector finds your eyes: haar (haar cascades for face and 
+  #  eyes), lbp (lbp cascade for face, haar cascades for eyes) or dnn (neural 
+  #  network from dnnModelFile)
+  detector = haar
+  
+  # openCVLbpcascadesFolder - Path to where your opencv installation's 
+  #  lbpcascades reside.
+  openCVLbpcascadesFolder = /usr/local/opt/opencv/share/OpenCV/lbpcascades/
+  
+  # dnnModelFile - Local model file for the dnn detector. Either a YuNet 
+  #  face detection .onnx file (finds eyes itself) or a res10 SSD face 
+  #  detection .caffemodel (eyes then get searched with haar cascades).
+  # dnnConfigFile - The .prototxt belonging to a .caffemodel
+  # dnnModelFile = ~/Documents/ELIME Project/face_detection_yunet.onnx
+  # dnnConfigFile = 
+  
+  # refineEyes - Move detected eye positions onto the pupil centers 
+  #  automatically
+  refineEyes = true
+  
+  # skipDetailConfidence - Refined eye positions with a confidence (0 to 1) 
+  #  at least this high, are taken without the zoomed detail adjustment. 
+  #  Set it above 1 to always adjust in detail.
+  skipDetailConfidence = 0.5
+  
+  # autoAcceptScore - add --autoAccept stores detected eyes without asking, 
+  #  if their score (0 to 1: detector support, refinement confidence, eye 
+  #  angle and distance, agreement with the photos taken before) is at 
+  #  least this high. All others are left for you to adjust.
+  autoAcceptScore = 0.7
+  
+  # detectionThreads - Number of threads the cascade passes of one photo run 
+  #  on. Set it to the number of CPU cores to get detection results sooner.
+  detectionThreads = 1
+  
+  # catalogHashes - Store a content hash of every photo in the photo catalog. 
+  #  New photos then get read completely once.
+  catalogHashes = false
+  
+  # walMode - Keep the database in write ahead log mode, so it can be read 
+  #  (render) while another ELIME writes to it (add, check)
+  walMode = true
+  
+  # writeBehindCount, writeBehindSeconds - add and check commit eye positions
+  #  in the background, batched per this many photos or after this many
+  #  seconds, and when ELIME exits. Set writeBehindCount to 1 to commit
+  #  every photo right away.
+  writeBehindCount = 20
+  writeBehindSeconds = 5.0
+  
+  # The following detection parameters get written by the tune command. Without
+  #  them ELIME tries several eye cascades and parameter sets per photo.
+  # detectionMaxSize - Maximum x or y of the image eyes get detected on
+  # eyeCascade - The haar cascade used for eyes
+  # eyeScaleFactor, eyeMinNeighbors, eyeMinSize - parameters of the eye search
   """
 
   defaultConfigPath = os.path.expanduser('~/.ELIME.cfg')
 
   defaultValues = {'delete': 'false', 'maxSize': '1024', 'prefix': 'elime', 
                    'posDebug': 'false', 'detectionDebug': 'false', 
-                   'openCVHaarcascadesFolder': '/usr/local/opt/opencv/share/OpenCV/haarcascades/'}
+                   'openCVHaarcascadesFolder': '/usr/local/opt/opencv/share/OpenCV/haarcascades/',
+                   'detector': 'haar', 
+                   'openCVLbpcascadesFolder': '/usr/local/opt/opencv/share/OpenCV/lbpcascades/',
+                   'dnnModelFile': None, 'dnnConfigFile': None, 
+                   'refineEyes': 'true', 'skipDetailConfidence': '0.5', 'autoAcceptScore': str(ReviewFunctions.AUTOACCEPTSCORE), 
+                   'detectionThreads': '1', 'catalogHashes': 'false', 
+                   'walMode': 'true', 'writeBehindCount': '20', 'writeBehindSeconds': '5.0', 'normalizeOrientation': 'false', 
+                   'ingestThreads': '4', 'ingestHardlinks': 'false', 
+                   'watchSettleSeconds': '2.0', 'watchDetect': 'false', 
+                   'proxyFolder': None, 'proxyThreads': '2', 
+                   'prefetchPhotos': '3', 'prefetchMegabytes': '512'}
 
   conf_parser = argparse.ArgumentParser(add_help=False)
   conf_parser.add_argument("-c", "--conf", help="Use config file not located in '~/.ELIME.cfg' (which is the default path for ELIME's config file)", metavar="FILE")
@@ -743,7 +1562,7 @@ def main():
   args, remainingArgv = conf_parser.parse_known_args()
 
   if args.conf:
-    defaultConfigPath = args.confFile
+    defaultConfigPath = args.conf
 
   if args.createConf:
     if os.path.exists(defaultConfigPath):
@@ -795,9 +1614,91 @@ def main():
     if config.has_option('ELIME', 'openCVHaarcascadesFolder'):
       defaultValues['openCVHaarcascadesFolder'] = config.get('ELIME', 'openCVHaarcascadesFolder')
     
+    if config.has_option('ELIME', 'detector'):
+      defaultValues['detector'] = config.get('ELIME', 'detector')
+    
+    if config.has_option('ELIME', 'openCVLbpcascadesFolder'):
+      defaultValues['openCVLbpcascadesFolder'] = config.get('ELIME', 'openCVLbpcascadesFolder')
+    
+    if config.has_option('ELIME', 'dnnModelFile'):
+      defaultValues['dnnModelFile'] = config.get('ELIME', 'dnnModelFile')
+    
+    if config.has_option('ELIME', 'dnnConfigFile'):
+      defaultValues['dnnConfigFile'] = config.get('ELIME', 'dnnConfigFile')
+    
+    if config.has_option('ELIME', 'refineEyes'):
+      defaultValues['refineEyes'] = config.getboolean('ELIME', 'refineEyes')
+    
+    if config.has_option('ELIME', 'skipDetailConfidence'):
+      defaultValues['skipDetailConfidence'] = config.getfloat('ELIME', 'skipDetailConfidence')
+    
+    if config.has_option('ELIME', 'autoAcceptScore'):
+      defaultValues['autoAcceptScore'] = config.getfloat('ELIME', 'autoAcceptScore')
+    
+    if config.has_option('ELIME', 'detectionThreads'):
+      defaultValues['detectionThreads'] = config.getint('ELIME', 'detectionThreads')
+    
+    if config.has_option('ELIME', 'catalogHashes'):
+      defaultValues['catalogHashes'] = config.getboolean('ELIME', 'catalogHashes')
+    
+    if config.has_option('ELIME', 'walMode'):
+      defaultValues['walMode'] = config.getboolean('ELIME', 'walMode')
+    
+    if config.has_option('ELIME', 'writeBehindCount'):
+      defaultValues['writeBehindCount'] = config.getint('ELIME', 'writeBehindCount')
+    
+    if config.has_option('ELIME', 'writeBehindSeconds'):
+      defaultValues['writeBehindSeconds'] = config.getfloat('ELIME', 'writeBehindSeconds')
+    
+    if config.has_option('ELIME', 'normalizeOrientation'):
+      defaultValues['normalizeOrientation'] = config.getboolean('ELIME', 'normalizeOrientation')
+    
+    if config.has_option('ELIME', 'ingestThreads'):
+      defaultValues['ingestThreads'] = config.getint('ELIME', 'ingestThreads')
+    
+    if config.has_option('ELIME', 'ingestHardlinks'):
+      defaultValues['ingestHardlinks'] = config.getboolean('ELIME', 'ingestHardlinks')
+    
+    if config.has_option('ELIME', 'watchSettleSeconds'):
+      defaultValues['watchSettleSeconds'] = config.getfloat('ELIME', 'watchSettleSeconds')
+    
+    if config.has_option('ELIME', 'watchDetect'):
+      defaultValues['watchDetect'] = config.getboolean('ELIME', 'watchDetect')
+    
+    if config.has_option('ELIME', 'proxyFolder'):
+      defaultValues['proxyFolder'] = config.get('ELIME', 'proxyFolder')
+    
+    if config.has_option('ELIME', 'proxyThreads'):
+      defaultValues['proxyThreads'] = config.getint('ELIME', 'proxyThreads')
+    
+    if config.has_option('ELIME', 'prefetchPhotos'):
+      defaultValues['prefetchPhotos'] = config.getint('ELIME', 'prefetchPhotos')
+    
+    if config.has_option('ELIME', 'prefetchMegabytes'):
+      defaultValues['prefetchMegabytes'] = config.getint('ELIME', 'prefetchMegabytes')
+    
+    if config.has_option('ELIME', 'detectionMaxSize'):
+      defaultValues['detectionMaxSize'] = config.getint('ELIME', 'detectionMaxSize')
+    
+    if config.has_option('ELIME', 'eyeCascade'):
+      defaultValues['eyeCascade'] = config.get('ELIME', 'eyeCascade')
+    
+    if config.has_option('ELIME', 'eyeScaleFactor'):
+      defaultValues['eyeScaleFactor'] = config.getfloat('ELIME', 'eyeScaleFactor')
+    
+    if config.has_option('ELIME', 'eyeMinNeighbors'):
+      defaultValues['eyeMinNeighbors'] = config.getint('ELIME', 'eyeMinNeighbors')
+    
+    if config.has_option('ELIME', 'eyeMinSize'):
+      defaultValues['eyeMinSize'] = config.getint('ELIME', 'eyeMinSize')
+    
     
   #print defaultValues  
 
+  # tuned detection parameters are unset unless the config file has them
+  for key in ['detectionMaxSize', 'eyeCascade', 'eyeScaleFactor', 'eyeMinNeighbors', 'eyeMinSize']:
+    defaultValues.setdefault(key, None)
+
   if not isinstance(defaultValues['delete'], bool):
     defaultValues['delete'] = defaultValues['delete'] in ['true', 'True']
     
@@ -810,6 +1711,54 @@ def main():
   if not isinstance(defaultValues['maxSize'], int):
     defaultValues['maxSize'] = int(defaultValues['maxSize'])
   
+  if not isinstance(defaultValues['refineEyes'], bool):
+    defaultValues['refineEyes'] = defaultValues['refineEyes'] in ['true', 'True']
+  
+  if not isinstance(defaultValues['skipDetailConfidence'], float):
+    defaultValues['skipDetailConfidence'] = float(defaultValues['skipDetailConfidence'])
+  
+  if not isinstance(defaultValues['autoAcceptScore'], float):
+    defaultValues['autoAcceptScore'] = float(defaultValues['autoAcceptScore'])
+  
+  if not isinstance(defaultValues['detectionThreads'], int):
+    defaultValues['detectionThreads'] = int(defaultValues['detectionThreads'])
+  
+  if not isinstance(defaultValues['catalogHashes'], bool):
+    defaultValues['catalogHashes'] = defaultValues['catalogHashes'] in ['true', 'True']
+  
+  if not isinstance(defaultValues['walMode'], bool):
+    defaultValues['walMode'] = defaultValues['walMode'] in ['true', 'True']
+  
+  if not isinstance(defaultValues['writeBehindCount'], int):
+    defaultValues['writeBehindCount'] = int(defaultValues['writeBehindCount'])
+  
+  if not isinstance(defaultValues['writeBehindSeconds'], float):
+    defaultValues['writeBehindSeconds'] = float(defaultValues['writeBehindSeconds'])
+  
+  if not isinstance(defaultValues['normalizeOrientation'], bool):
+    defaultValues['normalizeOrientation'] = defaultValues['normalizeOrientation'] in ['true', 'True']
+  
+  if not isinstance(defaultValues['ingestThreads'], int):
+    defaultValues['ingestThreads'] = int(defaultValues['ingestThreads'])
+  
+  if not isinstance(defaultValues['ingestHardlinks'], bool):
+    defaultValues['ingestHardlinks'] = defaultValues['ingestHardlinks'] in ['true', 'True']
+  
+  if not isinstance(defaultValues['watchSettleSeconds'], float):
+    defaultValues['watchSettleSeconds'] = float(defaultValues['watchSettleSeconds'])
+  
+  if not isinstance(defaultValues['watchDetect'], bool):
+    defaultValues['watchDetect'] = defaultValues['watchDetect'] in ['true', 'True']
+  
+  if not isinstance(defaultValues['proxyThreads'], int):
+    defaultValues['proxyThreads'] = int(defaultValues['proxyThreads'])
+  
+  if not isinstance(defaultValues['prefetchPhotos'], int):
+    defaultValues['prefetchPhotos'] = int(defaultValues['prefetchPhotos'])
+  
+  if not isinstance(defaultValues['prefetchMegabytes'], int):
+    defaultValues['prefetchMegabytes'] = int(defaultValues['prefetchMegabytes'])
+  
   # print defaultValues
 
   parser = argparse.ArgumentParser(parents=[conf_parser], description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter, epilog = "Everyday, look into my eyes!")
@@ -827,10 +1776,28 @@ def main():
   parser_pre.add_argument('-p', '--prefix', help="The prefix ELIME's pre(process) command will prepend to your photo's creation date to create the new filename")
   parser_pre.add_argument('-d', '--delete', action='store_true', help='If ELIME should move (and not copy) your photos while renaming from sourceFolder to photoFolder')
   parser_pre.add_argument('-mS', '--maxSize', type=int, help="The maximum x or y of the image's dimensions on which ELIME will automatically detect eye positions and show in window. Do not go over 1024! The final size of the rendered images is completey independent from this!")
+  parser_pre.add_argument('--normalizeOrientation', action='store_true', help='Store rotated photos upright (lossless with jpegtran), so loading them needs no exif lookup and transpose later on')
+  parser_pre.add_argument('-dF', '--dbFile', help='The file path to where your eye position database will be stored, the new photos get recorded there')
   parser_pre.set_defaults(func=preProcessImageFiles)
   # the lines in the subparsers like the next line was not needed before. Just a quick hack. Might be not the optimal solution for why it suddenly does not work anymore without.
   parser_pre.set_defaults(**defaultValues)
 
+  # create the parser for the "watch" command
+  parser_watch = subparsers.add_parser('watch', help='Keeps running and preprocesses (like pre) every photo written to the sourceFolder right away, Linux only.')
+  parser_watch.add_argument('-sF', '--sourceFolder', help="The folder where ELIME's pre(process) command will find your unrenamed digital cameras photos")
+  parser_watch.add_argument('-pF', '--photoFolder', help='The folder where all your (preprocessed) daily photos savely and permanently are stored. The names of the photos in that folder get stored in the eye position database.')
+  parser_watch.add_argument('-p', '--prefix', help="The prefix ELIME's pre(process) command will prepend to your photo's creation date to create the new filename")
+  parser_watch.add_argument('-d', '--delete', action='store_true', help='If ELIME should move (and not copy) your photos while renaming from sourceFolder to photoFolder')
+  parser_watch.add_argument('-mS', '--maxSize', type=int, help="The maximum x or y of the image's dimensions on which ELIME will automatically detect eye positions and show in window. Do not go over 1024! The final size of the rendered images is completey independent from this!")
+  parser_watch.add_argument('--normalizeOrientation', action='store_true', help='Store rotated photos upright (lossless with jpegtran), so loading them needs no exif lookup and transpose later on')
+  parser_watch.add_argument('-dF', '--dbFile', help='The file path to where your eye position database will be stored, the new photos get recorded there')
+  parser_watch.add_argument('--detect', dest='watchDetect', action='store_true', help='Detect eyes of new photos right away, add then starts with them')
+  parser_watch.add_argument('--settle', dest='watchSettleSeconds', type=float, help='Seconds a photo must stay untouched after being written before it gets preprocessed')
+  parser_watch.add_argument('-oF', '--openCVHaarcascadesFolder', help="Path to where your opencv installation's haarcascades reside.")
+  parser_watch.add_argument('--detector', choices=sorted(DetectorFunctions.DETECTORS), help="Which detector finds your eyes.")
+  parser_watch.set_defaults(func=watchSourceFolder)
+  parser_watch.set_defaults(**defaultValues)
+
   # create the parser for the "add" command
   parser_add = subparsers.add_parser('add', help='"Automagically" detects your eyes in your photos from the photoFolder, lets you do fine adjustments and saves eye locations to database file.')
   parser_add.add_argument('-pF', '--photoFolder', help='The folder where all your (preprocessed) daily photos savely and permanently are stored. The names of the photos in that folder get stored in the eye position database.')
@@ -838,6 +1805,10 @@ def main():
   parser_add.add_argument('-mS', '--maxSize', type=int, help="The maximum x or y of the image's dimensions on which ELIME will automatically detect eye positions and show in window. Do not go over 1024! The final size of the rendered images is completey independent from this!")
   parser_add.add_argument('--detectionDebug', action='store_true', help="Shows all detected eyes and faces before manual fine control.")
   parser_add.add_argument('-oF', '--openCVHaarcascadesFolder', help="Path to where your opencv installation's haarcascades reside.")
+  parser_add.add_argument('--detector', choices=sorted(DetectorFunctions.DETECTORS), help="Which detector finds your eyes.")
+  parser_add.add_argument('--skipDetailConfidence', type=float, help="Take automatically refined eye positions at least this confident (0 to 1) without detail adjustment.")
+  parser_add.add_argument('--autoAccept', action='store_true', help="Store detected eyes scoring at least autoAcceptScore without asking, all in one go. Only the others get shown for manual adjustment afterwards.")
+  parser_add.add_argument('--autoAcceptScore', type=float, help="Score (0 to 1) detected eyes need for --autoAccept.")
   parser_add.set_defaults(func=addMissingEyeData)
   parser_add.set_defaults(**defaultValues)
 
@@ -846,6 +1817,10 @@ def main():
   parser_check.add_argument('-pF', '--photoFolder', help='The folder where all your (preprocessed) daily photos savely and permanently are stored. The names of the photos in that folder get stored in the eye position database.')
   parser_check.add_argument('-dF', '--dbFile', help='The file path to where your eye position database are be stored')
   parser_check.add_argument('-mS', '--maxSize', type=int, help="The maximum x or y of the image's dimensions on which ELIME will automatically detect eye positions and show in window. Do not go over 1024! The final size of the rendered images is completey independent from this!")
+  parser_check.add_argument('--suspicious', type=int, default=0, metavar='N', help='Only check the N photos with the most unlikely eye positions (jumps against the photos before and after, unusual eye distance or angle, disagreement with detection), worst first.')
+  parser_check.add_argument('--detect', action='store_true', help='With --suspicious, detect eyes in photos without cached detection and compare. Detections are kept for later runs.')
+  parser_check.add_argument('--sheet', action='store_true', help='Show the eyes of many photos at once as contact sheet of aligned tiles with crosshairs, click the bad ones to correct them. n or space: next page, p: previous page.')
+  parser_check.add_argument('--detector', choices=sorted(DetectorFunctions.DETECTORS), help="Which detector finds your eyes.")
   parser_check.add_argument('beginWith', nargs='*', help='Filename to begin with checking.')
   parser_check.set_defaults(func=checkEyeData)  
   parser_check.set_defaults(**defaultValues)
@@ -866,6 +1841,42 @@ def main():
   parser_render.set_defaults(func=renderPhotos)
   parser_render.set_defaults(**defaultValues)
   
+  # create the parser for the "benchmark-detectors" command
+  parser_bench = subparsers.add_parser('benchmark-detectors', help='Run eye detectors on photos with eye positions in database and compare their speed and accuracy.')
+  parser_bench.add_argument('-pF', '--photoFolder', help='The folder where all your (preprocessed) daily photos savely and permanently are stored. The names of the photos in that folder get stored in the eye position database.')
+  parser_bench.add_argument('-dF', '--dbFile', help='The file path to where your eye position database are be stored')
+  parser_bench.add_argument('-mS', '--maxSize', type=int, help="The maximum x or y of the image's dimensions on which ELIME will automatically detect eye positions and show in window. Do not go over 1024! The final size of the rendered images is completey independent from this!")
+  parser_bench.add_argument('-n', '--sampleSize', type=int, default=0, help="Benchmark on this many randomly chosen photos only.")
+  parser_bench.add_argument('detectors', nargs='*', help='Detectors to compare, default all that are set up: ' + ', '.join(sorted(DetectorFunctions.DETECTORS)))
+  parser_bench.set_defaults(func=benchmarkDetectors)
+  parser_bench.set_defaults(**defaultValues)
+  
+  # create the parser for the "tune" command
+  parser_tune = subparsers.add_parser('tune', help='Find the fastest eye detection parameters that still find the eye positions stored in database and save them to the config file.')
+  parser_tune.add_argument('-pF', '--photoFolder', help='The folder where all your (preprocessed) daily photos savely and permanently are stored. The names of the photos in that folder get stored in the eye position database.')
+  parser_tune.add_argument('-dF', '--dbFile', help='The file path to where your eye position database are be stored')
+  parser_tune.add_argument('-mS', '--maxSize', type=int, help="The maximum x or y of the image's dimensions on which ELIME will automatically detect eye positions and show in window. Do not go over 1024! The final size of the rendered images is completey independent from this!")
+  parser_tune.add_argument('-n', '--sampleSize', type=int, default=50, help="Tune on this many randomly chosen photos.")
+  parser_tune.add_argument('-a', '--targetAccuracy', type=float, default=0.95, help="Share of photos (0 to 1) whose eyes must be found.")
+  parser_tune.add_argument('--processes', type=int, help="Number of processes to tune with, default: number of cpus.")
+  parser_tune.set_defaults(func=tuneDetectionParameters)
+  parser_tune.set_defaults(**defaultValues)
+  
+  # create the parser for the "export" command
+  parser_export = subparsers.add_parser('export', help='Export eye positions of all photos in database to numpy (.npy folder, .npz) or csv files.')
+  parser_export.add_argument('-dF', '--dbFile', help='The file path to where your eye position database are be stored')
+  parser_export.add_argument('path', help='Export target: a .npz or .csv file, anything else becomes a folder of one memory mappable .npy file per column')
+  parser_export.set_defaults(func=exportEyePositions)
+  parser_export.set_defaults(**defaultValues)
+  
+  # create the parser for the "import" command
+  parser_import = subparsers.add_parser('import', help='Import eye positions written by export (maybe corrected since) into database in one go.')
+  parser_import.add_argument('-dF', '--dbFile', help='The file path to where your eye position database are be stored')
+  parser_import.add_argument('--dryRun', action='store_true', help='Only report what would change')
+  parser_import.add_argument('path', help='The .npz, .csv or .npy folder to import')
+  parser_import.set_defaults(func=importEyePositions)
+  parser_import.set_defaults(**defaultValues)
+  
   #print parser_pre.get_default("sourceFolder")
   
   #print remainingArgv
@@ -877,26 +1888,60 @@ def main():
   
   setupLogging(logFile=args.logFile)
   
+  DatabaseFunctions.CATALOGHASHES = args.catalogHashes
+  DatabaseFunctions.WALMODE = args.walMode
+  DatabaseFunctions.WRITEBEHINDCOUNT = args.writeBehindCount
+  DatabaseFunctions.WRITEBEHINDSECONDS = args.writeBehindSeconds
+  
+  if args.proxyFolder:
+    ProxyFunctions.PROXYFOLDER = os.path.abspath(os.path.expanduser(args.proxyFolder))
+  ProxyFunctions.PROXYTHREADS = args.proxyThreads
+  PrefetchFunctions.PREFETCHPHOTOS = args.prefetchPhotos
+  PrefetchFunctions.PREFETCHMEGABYTES = args.prefetchMegabytes
+  
   if args.func == preProcessImageFiles:
+    IngestFunctions.INGESTTHREADS = args.ingestThreads
+    IngestFunctions.INGESTHARDLINKS = args.ingestHardlinks
+    
     args.sourceFolder = HelperFunctions.checkFolder(args.sourceFolder)
     args.photoFolder = HelperFunctions.checkFolder(args.photoFolder)
-    args.func(args.sourceFolder, args.photoFolder, args.prefix, args.delete)
+    args.dbFile = HelperFunctions.checkFile(args.dbFile)
+    args.func(args.sourceFolder, args.photoFolder, args.prefix, args.delete, 
+              normalizeOrientation=args.normalizeOrientation, dbPath=args.dbFile)
   
-  if args.func == addMissingEyeData:
-    args.openCVHaarcascadesFolder = HelperFunctions.checkFolder(args.openCVHaarcascadesFolder)
-    OpenCvFunctions.PATHTOCASCADES = args.openCVHaarcascadesFolder
+  if args.func in [addMissingEyeData, benchmarkDetectors, tuneDetectionParameters, watchSourceFolder, checkEyeData]:
+    setupDetection(args)
+  
+  if args.func == watchSourceFolder:
+    IngestFunctions.INGESTTHREADS = args.ingestThreads
+    IngestFunctions.INGESTHARDLINKS = args.ingestHardlinks
+    WatchFunctions.WATCHSETTLESECONDS = args.watchSettleSeconds
+    
+    args.sourceFolder = HelperFunctions.checkFolder(args.sourceFolder)
+    args.photoFolder = HelperFunctions.checkFolder(args.photoFolder)
+    args.dbFile = HelperFunctions.checkFile(args.dbFile)
+    args.func(args.sourceFolder, args.photoFolder, args.prefix, args.delete, 
+              normalizeOrientation=args.normalizeOrientation, dbPath=args.dbFile, 
+              detect=args.watchDetect, maxDimension=args.maxSize, detector=args.detector, 
+              detectionMaxDimension=args.detectionMaxSize, refineEyes=args.refineEyes)
     
+  if args.func == addMissingEyeData:
     args.photoFolder = HelperFunctions.checkFolder(args.photoFolder)
     args.dbFile = HelperFunctions.checkFile(args.dbFile)
 
     args.func(args.photoFolder, args.dbFile, args.maxSize, 
-              detectionDebug=args.detectionDebug)
+              detectionDebug=args.detectionDebug, detector=args.detector, 
+              detectionMaxDimension=args.detectionMaxSize, refineEyes=args.refineEyes, 
+              skipDetailConfidence=args.skipDetailConfidence, autoAccept=args.autoAccept, 
+              autoAcceptScore=args.autoAcceptScore)
     
   if args.func == checkEyeData:
     args.photoFolder = HelperFunctions.checkFolder(args.photoFolder)
     args.dbFile = HelperFunctions.checkFile(args.dbFile)
 
-    args.func(args.photoFolder, args.dbFile, args.beginWith, args.maxSize)
+    args.func(args.photoFolder, args.dbFile, args.beginWith, args.maxSize, 
+              suspicious=args.suspicious, detect=args.detect, detector=args.detector, 
+              detectionMaxDimension=args.detectionMaxSize, sheet=args.sheet)
     
   if args.func == tidyDB:
     args.photoFolder = HelperFunctions.checkFolder(args.photoFolder)
@@ -911,6 +1956,34 @@ def main():
 
     args.func(args.photoFolder, args.targetFolder, args.dbFile, 
               posDebug=args.posDebug)
+
+  if args.func == benchmarkDetectors:
+    args.photoFolder = HelperFunctions.checkFolder(args.photoFolder)
+    args.dbFile = HelperFunctions.checkFile(args.dbFile)
+    
+    # benchmark on the image size add detects on
+    maxSize = args.maxSize
+    if args.detectionMaxSize is not None:
+      maxSize = args.detectionMaxSize
+    
+    args.func(args.photoFolder, args.dbFile, args.detectors, maxSize, args.sampleSize)
+
+  if args.func == tuneDetectionParameters:
+    args.photoFolder = HelperFunctions.checkFolder(args.photoFolder)
+    args.dbFile = HelperFunctions.checkFile(args.dbFile)
+    
+    args.func(args.photoFolder, args.dbFile, defaultConfigPath, args.maxSize, args.sampleSize, 
+              args.targetAccuracy, args.processes)
+  
+  if args.func == exportEyePositions:
+    args.dbFile = HelperFunctions.checkFile(args.dbFile)
+    
+    args.func(args.dbFile, os.path.abspath(os.path.expanduser(args.path)))
+  
+  if args.func == importEyePositions:
+    args.dbFile = HelperFunctions.checkFile(args.dbFile)
+    
+    args.func(args.dbFile, os.path.abspath(os.path.expanduser(args.path)), args.dryRun)
       
   sys.exit(0)
  
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import csv
+import logging
+import os
+
+import numpy
+
+# ELIME Project
+import DatabaseFunctions
+
+# exported columns of table eyesInPhotos and their types, photoFileName 
+# becomes fixed width bytes as long as the longest name
+EXPORTCOLUMNS = [('photoFileName', None), 
+                 ('captureEpoch', numpy.int64), 
+                 ('captureDay', numpy.int32), 
+                 ('lEyeX', numpy.int32), 
+                 ('lEyeY', numpy.int32), 
+                 ('rEyeX', numpy.int32), 
+                 ('rEyeY', numpy.int32)]
+
+EYECOLUMNS = ['lEyeX', 'lEyeY', 'rEyeX', 'rEyeY']
+
+# stands for an eye coordinate not set in database
+MISSINGCOORDINATE = -1
+
+
+def eyeDataColumns(dbPhotos):
+  """Returns dict of one numpy array per column in EXPORTCOLUMNS for EyePhotos dbPhotos"""
+  names = [photo.photoFileName.encode('utf-8') for photo in dbPhotos]
+  columns = {'photoFileName': numpy.array(names, dtype='S%d' % max([1] + map(len, names)))}
+  
+  for name, dtype in EXPORTCOLUMNS[1:]:
+    values = [getattr(photo, name) for photo in dbPhotos]
+    columns[name] = numpy.array([MISSINGCOORDINATE if value is None else value for value in values], dtype=dtype)
+  
+  return columns
+
+
+def writeColumns(columns, path):
+  """Write columns to path: .npz archive, .csv file or else a folder of one .npy file per column"""
+  extension = os.path.splitext(path)[1].lower()
+  
+  if extension == '.npz':
+    numpy.savez(path, **columns)
+  
+  elif extension == '.csv':
+    with open(path, 'wb') as csvFile:
+      writer = csv.writer(csvFile)
+      writer.writerow([name for name, dtype in EXPORTCOLUMNS])
+      writer.writerows(zip(*[columns[name].tolist() for name, dtype in EXPORTCOLUMNS]))
+  
+  else:
+    if not os.path.isdir(path):
+      os.makedirs(path)
+    for name, dtype in EXPORTCOLUMNS:
+      numpy.save(os.path.join(path, name + '.npy'), columns[name])
+
+
+def readColumns(path):
+  """Read columns written by writeColumns. Columns of a .npy folder are memory mapped, not read."""
+  extension = os.path.splitext(path)[1].lower()
+  
+  if extension == '.npz':
+    with numpy.load(path) as archive:
+      return dict((name, archive[name]) for name, dtype in EXPORTCOLUMNS)
+  
+  if extension == '.csv':
+    with open(path, 'rb') as csvFile:
+      reader = csv.reader(csvFile)
+      header = next(reader)
+      rows = list(reader)
+    
+    columns = {}
+    for name, dtype in EXPORTCOLUMNS:
+      index = header.index(name)
+      values = [row[index] for row in rows]
+      if dtype is None:
+        columns[name] = numpy.array(values, dtype='S%d' % max([1] + map(len, values)))
+      else:
+        columns[name] = numpy.array(values, dtype=dtype)
+    return columns
+  
+  return dict((name, numpy.load(os.path.join(path, name + '.npy'), mmap_mode='r')) for name, dtype in EXPORTCOLUMNS)
+
+
+def exportEyeData(dbPath, path):
+  """Write all photos of database at dbPath to path (see writeColumns), returns number of photos"""
+  with DatabaseFunctions.readTransaction(dbPath) as c:
+    dbPhotos = DatabaseFunctions.photosInDB(c)
+  
+  writeColumns(eyeDataColumns(dbPhotos), path)
+  
+  return len(dbPhotos)
+
+
+def importEyeData(dbPath, path, dryRun=False):
+  """Apply eye positions read from path (see readColumns) to database at dbPath in one transaction.
+  
+  Photos not in database get added, photos only in database stay untouched. 
+  With dryRun nothing gets written. Returns (added names, [(name, old eyes, new eyes)] 
+  of changed photos, number unchanged, names only in database)."""
+  logger = logging.getLogger('ELIME.importEyeData')
+  
+  columns = readColumns(path)
+  
+  # whole columns to python at once, much faster than element wise
+  names = [name.decode('utf-8') for name in columns['photoFileName'].tolist()]
+  epochs = columns['captureEpoch'].tolist()
+  eyes = zip(*[[None if value == MISSINGCOORDINATE else value for value in columns[name].tolist()] for name in EYECOLUMNS])
+  
+  added = []
+  changed = []
+  unchanged = 0
+  
+  transaction = DatabaseFunctions.readTransaction if dryRun else DatabaseFunctions.writeTransaction
+  
+  with transaction(dbPath) as c:
+    dbPhotosByName = dict((photo.photoFileName, photo) for photo in DatabaseFunctions.photosInDB(c))
+    
+    for name, epoch, newEyes in zip(names, epochs, eyes):
+      dbPhoto = dbPhotosByName.get(name)
+      
+      if dbPhoto is None:
+        added.append(name)
+        if not dryRun:
+          DatabaseFunctions.insertPhoto(c, name, DatabaseFunctions.epochToDateTime(epoch), newEyes[:2], newEyes[2:])
+        continue
+      
+      oldEyes = (dbPhoto.lEyeX, dbPhoto.lEyeY, dbPhoto.rEyeX, dbPhoto.rEyeY)
+      if oldEyes == newEyes:
+        unchanged += 1
+        continue
+      
+      changed.append((name, oldEyes, newEyes))
+      if not dryRun:
+        DatabaseFunctions.updateEyes(c, name, newEyes[:2], newEyes[2:])
+  
+  onlyInDB = sorted(set(dbPhotosByName) - set(names))
+  
+  logger.info("Import of %s: %d added, %d changed, %d unchanged, %d only in database", 
+              path, len(added), len(changed), unchanged, len(onlyInDB))
+  
+  return (added, changed, unchanged, onlyInDB)
@@ -29,7 +29,19 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import fnmatch
+import hashlib
 import os
+import re
+import stat
+
+# directory scanning without one stat call per entry where the OS allows it
+try:
+  from os import scandir
+except ImportError:
+  try:
+    from scandir import scandir
+  except ImportError:
+    scandir = None
 
 def calcRectInRect(innerRect, outerRect):
   """Return innerRect translated relative to outerRect"""
@@ -38,6 +50,12 @@ def calcRectInRect(innerRect, outerRect):
   return (ox + ix, oy + iy, iw, ih)
   
 
+def scaleRect(rect, factor):
+  """Returns int rect with all coordinates multiplied by factor"""
+  (x, y, w, h) = rect
+  return (int(x * factor), int(y * factor), int(w * factor), int(h * factor))
+  
+
 def middleOfRect(rect):
   """Returns int middle point of rectangle""" 
   (x, y, w, h) = rect
@@ -50,6 +68,28 @@ def filefilter(filename):
   return fnmatch.fnmatch(filename, '*.JPG') or fnmatch.fnmatch(filename, '*.jpg') or fnmatch.fnmatch(filename, '*.jpeg') 
   
 
+def scanPhotoFolder(path):
+  """Returns list of (file name, size, mtime) of all photo files (see filefilter) in folder path"""
+  photos = []
+  
+  if scandir is not None:
+    for entry in scandir(path):
+      if filefilter(entry.name) and entry.is_file():
+        fileStat = entry.stat()
+        photos.append((entry.name, fileStat.st_size, fileStat.st_mtime))
+    return photos
+  
+  for name in filter(filefilter, os.listdir(path)):
+    try:
+      fileStat = os.stat(os.path.join(path, name))
+    except OSError:
+      continue
+    if stat.S_ISREG(fileStat.st_mode):
+      photos.append((name, fileStat.st_size, fileStat.st_mtime))
+  
+  return photos
+  
+
 def checkFolder(path):
   """Returns absolute version of path and checks that folder is existent"""
   if path is None:
@@ -73,4 +113,75 @@ def checkFile(path):
     return path
   else:
     return None
-  
\ No newline at end of file
+  
+
+def contentHash():
+  """Returns new hash object for photo file contents, BLAKE2b if hashlib has it (python 3.6+), else md5.
+  
+  Only finds duplicates, nobody forges photos to collide, so the fastest one wins."""
+  if hasattr(hashlib, 'blake2b'):
+    return hashlib.blake2b(digest_size=20)
+  return hashlib.md5()
+
+
+def hashFile(path, blockSize=1024*1024):
+  """Returns hex contentHash of file content at path"""
+  fileHash = contentHash()
+  with open(path, 'rb') as f:
+    for block in iter(lambda: f.read(blockSize), ''):
+      fileHash.update(block)
+  return fileHash.hexdigest()
+
+
+def imageSize(cvImage):
+  """Returns (width, height) of openCV (numpy) image"""
+  return (cvImage.shape[1], cvImage.shape[0])
+
+
+def percentile(sortedValues, percent):
+  """Returns the percent percentile of the ascending sorted, non empty list sortedValues"""
+  index = int(round((len(sortedValues) - 1) * percent / 100.0))
+  return sortedValues[index]
+
+
+def updateConfigFile(path, section, values):
+  """Set options of dict values in section of config file at path, keep all other lines and comments"""
+  with open(path, 'rb') as configfile:
+    lines = configfile.readlines()
+  
+  sectionStart = None
+  sectionEnd = len(lines)
+  for index, line in enumerate(lines):
+    stripped = line.strip()
+    if sectionStart is None and stripped == '[' + section + ']':
+      sectionStart = index
+    elif sectionStart is not None and stripped.startswith('['):
+      sectionEnd = index
+      break
+  
+  if sectionStart is None:
+    lines.append('\n[' + section + ']\n')
+    sectionStart = len(lines) - 1
+    sectionEnd = len(lines)
+  
+  for key, value in sorted(values.items()):
+    newLine = '{0} = {1}\n'.format(key, value)
+    pattern = re.compile(r'^(\s*)' + re.escape(key) + r'\s*[=:]', re.IGNORECASE)
+    
+    for index in range(sectionStart + 1, sectionEnd):
+      match = pattern.match(lines[index])
+      if match:
+        lines[index] = match.group(1) + newLine
+        break
+    else:
+      # append after last non empty line of section
+      insertAt = sectionEnd
+      while insertAt - 1 > sectionStart and not lines[insertAt - 1].strip():
+        insertAt = insertAt - 1
+      lines.insert(insertAt, newLine)
+      sectionEnd = sectionEnd + 1
+  
+  temporaryPath = path + '.tmp'
+  with open(temporaryPath, 'wb') as configfile:
+    configfile.writelines(lines)
+  os.rename(temporaryPath, path)
@@ -28,8 +28,14 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import io
 import os
-import cv
+import cv2
+import numpy
+import shutil
+import struct
+import subprocess
+from distutils.spawn import find_executable
 from datetime import datetime, timedelta, date
 import logging
 
@@ -41,74 +47,288 @@ from PIL import Image, ImageDraw, ImageFont, ExifTags
 # Thanks, Philipp Wagner for sharing!
 import AlignFaceImage
 
-def loadAndTransposePILImage(inputImageFileName):
-  """Load PIL Image and return rotated Image if exif data has rotation"""
+# exif tag ids by name, looked up once instead of scanning ExifTags.TAGS per photo
+EXIFTAGIDS = dict((name, tag) for tag, name in ExifTags.TAGS.items())
+
+# tags read by readJpegHeader, 0x8769 points to the Exif sub IFD
+EXIFTAGORIENTATION = EXIFTAGIDS['Orientation']
+EXIFTAGDATETIMEORIGINAL = EXIFTAGIDS['DateTimeOriginal']
+EXIFTAGEXIFOFFSET = 0x8769
+
+# JPEG markers without length field
+JPEGSTANDALONEMARKERS = set([0x01] + range(0xD0, 0xD8))
+
+# JPEG markers after which no more metadata segments come
+JPEGSTOPMARKERS = set([0xD9, 0xDA])
+
+# JPEG start of frame markers, they hold the pixel dimensions
+JPEGSOFMARKERS = set(range(0xC0, 0xD0)) - set([0xC4, 0xC8, 0xCC])
+
+# PIL transposes turning photos with these exif orientations upright
+ORIENTATIONTRANSPOSES = {3: Image.ROTATE_180, 6: Image.ROTATE_270, 8: Image.ROTATE_90}
+
+# the same as clockwise jpegtran rotations, lossless if the image size fits its blocks
+JPEGTRANROTATIONS = {3: '180', 6: '90', 8: '270'}
+
+JPEGTRAN = find_executable('jpegtran')
+
+def readJpegHeader(path):
+  """Read exif DateTimeOriginal, Orientation and pixel Width, Height of JPEG at path from its header segments only.
+  
+  Returns dict with the names found, empty if there is nothing of interest and 
+  None if the file is no JPEG or can not be parsed. With an orientation there 
+  are also OrientationOffset (in file) and ByteOrder, to change it in place."""
+  logger = logging.getLogger('ELIME.readJpegHeader')
+  
+  header = {}
+  
+  try:
+    with open(path, 'rb', 8192) as f:
+      if f.read(2) != '\xff\xd8':
+        return None
+      
+      while True:
+        marker = f.read(2)
+        if len(marker) != 2 or marker[0] != '\xff':
+          return None
+        
+        markerType = ord(marker[1])
+        
+        # fill bytes
+        if markerType == 0xFF:
+          f.seek(-1, os.SEEK_CUR)
+          continue
+        
+        if markerType in JPEGSTOPMARKERS:
+          return header
+        
+        if markerType in JPEGSTANDALONEMARKERS:
+          continue
+        
+        (length,) = struct.unpack('>H', f.read(2))
+        
+        if markerType == 0xE1:
+          tiffStart = f.tell() + 6
+          segment = f.read(length - 2)
+          if segment[:6] == 'Exif\x00\x00':
+            header.update(parseExifTiff(segment[6:]) or {})
+            if 'OrientationOffset' in header:
+              header['OrientationOffset'] += tiffStart
+        elif markerType in JPEGSOFMARKERS:
+          # precision, then height and width, the image data follows soon
+          (header['Height'], header['Width']) = struct.unpack('>xHH', f.read(5))
+          return header
+        else:
+          f.seek(length - 2, os.SEEK_CUR)
+          
+  except (IOError, struct.error, IndexError) as e:
+    logger.debug("Could not read exif header of %s: %s", path, e)
+    return None
+
+
+def parseExifTiff(tiff):
+  """Parse exif TIFF block, return dict with DateTimeOriginal and Orientation if present"""
+  if tiff[:2] == 'II':
+    byteOrder = '<'
+  elif tiff[:2] == 'MM':
+    byteOrder = '>'
+  else:
+    return None
+  
+  def ifdEntries(offset):
+    """Yields tag, type, count, value and offset of value for entries of IFD at offset"""
+    (count,) = struct.unpack_from(byteOrder + 'H', tiff, offset)
+    for i in range(count):
+      entryOffset = offset + 2 + 12 * i
+      yield struct.unpack_from(byteOrder + 'HHI4s', tiff, entryOffset) + (entryOffset + 8,)
+  
+  exif = {}
+  
+  (ifd0,) = struct.unpack_from(byteOrder + 'I', tiff, 4)
+  exifIfd = None
+  
+  for tag, fieldType, count, value, valueOffset in ifdEntries(ifd0):
+    if tag == EXIFTAGORIENTATION:
+      (exif['Orientation'],) = struct.unpack_from(byteOrder + 'H', value)
+      exif['OrientationOffset'] = valueOffset
+      exif['ByteOrder'] = byteOrder
+    elif tag == EXIFTAGEXIFOFFSET:
+      (exifIfd,) = struct.unpack_from(byteOrder + 'I', value)
+  
+  if exifIfd is not None:
+    for tag, fieldType, count, value, valueOffset in ifdEntries(exifIfd):
+      if tag == EXIFTAGDATETIMEORIGINAL:
+        (offset,) = struct.unpack_from(byteOrder + 'I', value)
+        exif['DateTimeOriginal'] = tiff[offset:offset + count].rstrip('\x00 ')
+        break
+  
+  return exif
+
+
+def loadAndTransposePILImage(inputImageFileName, orientation=None):
+  """Load PIL Image and return rotated Image if exif data has rotation.
+  
+  Give orientation if known (photo catalog) to skip reading the exif data."""
   pilImage = Image.open(inputImageFileName)
 
   #inspired by
   #http://stackoverflow.com/questions/4228530/pil-thumbnail-is-rotating-my-image/11543365#11543365
 
-  if hasattr(pilImage, '_getexif'): # only present in JPEGs
-    for orientation in ExifTags.TAGS.keys(): 
-      if ExifTags.TAGS[orientation]=='Orientation':
-        break
-       
+  if orientation is None and hasattr(pilImage, '_getexif'): # only present in JPEGs
     e = pilImage._getexif()       # returns None if no EXIF data
     if e is not None:
-      exif=dict(e.items())
-      orientation = exif[orientation] 
+      orientation = e.get(EXIFTAGORIENTATION, 1)
 
-      if orientation == 3:   pilImage = pilImage.transpose(Image.ROTATE_180)
-      elif orientation == 6: pilImage = pilImage.transpose(Image.ROTATE_270)
-      elif orientation == 8: pilImage = pilImage.transpose(Image.ROTATE_90)
+  if orientation in ORIENTATIONTRANSPOSES:
+    pilImage = pilImage.transpose(ORIENTATIONTRANSPOSES[orientation])
 
   return pilImage
+
+
+def setJpegOrientation(path, orientation=1):
+  """Overwrite the exif orientation of JPEG at path in place, returns False if it has none"""
+  header = readJpegHeader(path)
+  
+  if not header or 'OrientationOffset' not in header:
+    return False
+  
+  with open(path, 'r+b') as f:
+    f.seek(header['OrientationOffset'])
+    f.write(struct.pack(header['ByteOrder'] + 'H', orientation))
+  
+  return True
+
+
+def writeUprightPhoto(srcPath, dstPath, fileHash=None):
+  """Write photo at srcPath to dstPath with its pixels turned upright as its exif orientation says.
+  
+  Uses lossless jpegtran if installed and the image size allows, else decodes, 
+  turns and encodes again. The orientation tag of the result is reset to 1. 
+  With hash object fileHash given, srcPath gets read once into memory and 
+  hashed on the way. Returns 'copied' (was upright), 'lossless' or 're-encoded'."""
+  logger = logging.getLogger('ELIME.writeUprightPhoto')
+  
+  header = readJpegHeader(srcPath) or {}
+  orientation = header.get('Orientation', 1)
+  
+  data = None
+  if fileHash is not None:
+    with open(srcPath, 'rb') as src:
+      data = src.read()
+    fileHash.update(data)
+  
+  if orientation not in ORIENTATIONTRANSPOSES:
+    if data is None:
+      shutil.copy2(srcPath, dstPath)
+    else:
+      with open(dstPath, 'wb') as dst:
+        dst.write(data)
+      shutil.copystat(srcPath, dstPath)
+    return 'copied'
+  
+  if JPEGTRAN is not None:
+    command = [JPEGTRAN, '-copy', 'all', '-perfect', '-rotate', JPEGTRANROTATIONS[orientation], '-outfile', dstPath]
+    if data is None:
+      returnCode = subprocess.call(command + [srcPath])
+    else:
+      # jpegtran reads standard input without input file
+      process = subprocess.Popen(command, stdin=subprocess.PIPE)
+      process.communicate(data)
+      returnCode = process.returncode
+    
+    if returnCode == 0:
+      setJpegOrientation(dstPath, 1)
+      shutil.copystat(srcPath, dstPath)
+      return 'lossless'
+    
+    logger.info("No lossless rotation possible for %s, encoding again", srcPath)
+    if os.path.exists(dstPath):
+      os.remove(dstPath)
+  
+  pilImage = Image.open(srcPath if data is None else io.BytesIO(data))
+  options = {'quality': 95}
+  for key in ['exif', 'icc_profile']:
+    if pilImage.info.get(key):
+      options[key] = pilImage.info[key]
+  
+  pilImage.transpose(ORIENTATIONTRANSPOSES[orientation]).save(dstPath, 'JPEG', **options)
+  setJpegOrientation(dstPath, 1)
+  shutil.copystat(srcPath, dstPath)
+  return 're-encoded'
   
 
 def convertPIL2CV(PILImage):
-  """Concert PIL Image to openCV Image and return it"""
-  # inspired by
-  # http://opencv.willowgarage.com/wiki/PythonInterface			
-  cvImage = cv.CreateImageHeader(PILImage.size, cv.IPL_DEPTH_8U, 3)
-  cv.SetData(cvImage, PILImage.tobytes(), PILImage.size[0]*3)
-  cv.CvtColor(cvImage, cvImage, cv.CV_RGB2BGR)
+  """Convert PIL Image to openCV (BGR numpy array) Image and return it"""
+  if PILImage.mode != 'RGB':
+    PILImage = PILImage.convert('RGB')
+  
+  # PIL's array interface hands numpy a tobytes() copy of the pixels, cvtColor 
+  # then writes the BGR image from it in one pass
+  return cv2.cvtColor(numpy.asarray(PILImage), cv2.COLOR_RGB2BGR)
 
-  return cvImage
 
+def scaleCVImage(cvImage, maxDimension):
+  """Scale openCV image down to fit into maxDimension, return scaled image and scale factor"""
+  size = (cvImage.shape[1], cvImage.shape[0])
+  
+  maxDimension = float(maxDimension)
+  
+  scale = 1.0
+  if size[0] > maxDimension or size[1] > maxDimension:
+    scale = max(size[0]/maxDimension, size[1]/maxDimension)
+  
+  newSize = ( int(size[0] / scale), int (size[1] / scale) )
+  
+  return (cv2.resize(cvImage, newSize), scale)
 
-def getCreationDateTimeOfPicture(path, customDateFormat=''):
-  """Get Creation date and time of imagefile. Parse filename or (better) use exif data if possible, else return modify time"""
+
+def readPhotoMetadata(path):
+  """Returns (width, height, orientation, exif capture datetime or None) of photo at path.
   
-  fileNameDateTime = None
+  Only the JPEG header gets read, other files are left to PIL, which does not 
+  decode pixels for this either."""
+  logger = logging.getLogger('ELIME.readPhotoMetadata')
   
-  if len(customDateFormat):
-    #parse datetime from filename
-    fileNameDateTime = datetime.strptime(os.path.basename(path), customDateFormat)
-    
-  #check for exif date in file
-  pilImage = Image.open(path)
+  header = readJpegHeader(path)
+  
+  if header is None or 'Width' not in header:
+    # no JPEG we could parse ourselves, let PIL try
+    pilImage = Image.open(path)
+    header = {'Width': pilImage.size[0], 'Height': pilImage.size[1]}
+    if hasattr(pilImage, '_getexif'):
+      exifData = pilImage._getexif()
+      if exifData is not None:
+        header['Orientation'] = exifData.get(EXIFTAGORIENTATION)
+        header['DateTimeOriginal'] = exifData.get(EXIFTAGDATETIMEORIGINAL)
   
   exifDateTime = None
-  if hasattr(pilImage, '_getexif'):
-   
-    exifData = pilImage._getexif()
-    
-    if exifData is not None:
-      for k,v in ExifTags.TAGS.iteritems(): 
-        if v == 'DateTimeOriginal':
-          break
-      
-      if k in exifData:    
-        exifDateTimeString = exifData[k]
+  if header.get('DateTimeOriginal'):
+    #2012:02:03 17:14:43
+    #YYYY:MM:DD HH:MM:SS
+    exifFormat = "%Y:%m:%d %H:%M:%S"
+    try:
+      exifDateTime = datetime.strptime(header['DateTimeOriginal'], exifFormat)
+    except ValueError:
+      logger.warning("Exif date %s of %s is invalid", header['DateTimeOriginal'], path)
+  
+  return (header['Width'], header['Height'], header.get('Orientation') or 1, exifDateTime)
+
 
-        #2012:02:03 17:14:43
-        #YYYY:MM:DD HH:MM:SS
+def creationDateTime(path, exifDateTime, customDateFormat='', mtime=None):
+  """Returns exifDateTime if not None, else date parsed from file name, else modify time.
+  
+  Give mtime (seconds) if known already, so the file does not get touched at all."""
+  
+  fileNameDateTime = None
   
-        exifFormat = "%Y:%m:%d %H:%M:%S"
-        exifDateTime = datetime.strptime(exifDateTimeString, exifFormat)
+  if len(customDateFormat):
+    #parse datetime from filename
+    fileNameDateTime = datetime.strptime(os.path.basename(path), customDateFormat)
   
   #get modified time as fallback
-  mDateTime = datetime.fromtimestamp(os.path.getmtime(path))
+  if mtime is None:
+    mtime = os.path.getmtime(path)
+  mDateTime = datetime.fromtimestamp(mtime)
 
   if exifDateTime is not None:
     return exifDateTime
@@ -121,7 +341,7 @@ def getCreationDateTimeOfPicture(path, customDateFormat=''):
 
 def renderPhoto(srcPath, dbPhoto, font=None, format='%x', 
                 offset_pct=(0.43,0.425), dest_sz=(1920,1080), brightness=1.0, 
-                posDebug=False):
+                posDebug=False, orientation=None):
   """Render db photo to desired values adding text as well and return PIL image"""
   logger = logging.getLogger('ELIME.renderPhoto')
   
@@ -129,19 +349,19 @@ def renderPhoto(srcPath, dbPhoto, font=None, format='%x',
     logger.error("Given source path is not valid %s", srcPath)
     return None
   
-  filePath = os.path.join(srcPath, dbPhoto[1])
+  filePath = os.path.join(srcPath, dbPhoto.photoFileName)
   
-  pilImage = loadAndTransposePILImage(filePath)
+  pilImage = loadAndTransposePILImage(filePath, orientation)
   
   if posDebug:
     draw = ImageDraw.Draw(pilImage)
-    draw.line([(dbPhoto[3], dbPhoto[4] - 1), (dbPhoto[3], dbPhoto[4] + 1)], fill="white")
-    draw.line([(dbPhoto[3] - 1, dbPhoto[4]), (dbPhoto[3] + 1, dbPhoto[4])], fill="white")
+    draw.line([(dbPhoto.lEyeX, dbPhoto.lEyeY - 1), (dbPhoto.lEyeX, dbPhoto.lEyeY + 1)], fill="white")
+    draw.line([(dbPhoto.lEyeX - 1, dbPhoto.lEyeY), (dbPhoto.lEyeX + 1, dbPhoto.lEyeY)], fill="white")
     
-    draw.line([(dbPhoto[5], dbPhoto[6] - 1), (dbPhoto[5], dbPhoto[6] + 1)], fill="white")
-    draw.line([(dbPhoto[5] - 1, dbPhoto[6]), (dbPhoto[5] + 1, dbPhoto[6])], fill="white")
+    draw.line([(dbPhoto.rEyeX, dbPhoto.rEyeY - 1), (dbPhoto.rEyeX, dbPhoto.rEyeY + 1)], fill="white")
+    draw.line([(dbPhoto.rEyeX - 1, dbPhoto.rEyeY), (dbPhoto.rEyeX + 1, dbPhoto.rEyeY)], fill="white")
     del draw
-  pilImage = AlignFaceImage.CropFace(pilImage, (dbPhoto[3],dbPhoto[4]), (dbPhoto[5],dbPhoto[6]), offset_pct, dest_sz)
+  pilImage = AlignFaceImage.CropFace(pilImage, (dbPhoto.lEyeX,dbPhoto.lEyeY), (dbPhoto.rEyeX,dbPhoto.rEyeY), offset_pct, dest_sz)
 
   if not brightness == 1.0:
     pilImage = pilImage.point(lambda x: x * brightness)
@@ -149,7 +369,7 @@ def renderPhoto(srcPath, dbPhoto, font=None, format='%x',
   width, height = pilImage.size
     
   if font:
-    text = dbPhoto[2].strftime(format)
+    text = dbPhoto.date.strftime(format)
     (twidth, theight) = font.getsize(text)
     draw = ImageDraw.Draw(pilImage)
     draw.text((10, height - (10 + theight)), text, font=font)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+# ELIME Project
+import HelperFunctions
+import ImageFunctions
+
+# threads reading photo metadata and transferring files at once
+INGESTTHREADS = 4
+
+# copying may hardlink instead, destination and source then share their data
+INGESTHARDLINKS = False
+
+# buffer of plain copies, when sendfile is not available
+COPYBUFFERSIZE = 16 * 1024 * 1024
+
+# linux ioctl cloning a file's extents (btrfs, xfs, ...), _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# errors telling a rename or link is not possible here, so copy instead
+NOLINKERRORS = set([errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY])
+
+_clonefile = None
+if sys.platform == 'darwin':
+  try:
+    _clonefile = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True).clonefile
+  except (OSError, AttributeError):
+    _clonefile = None
+
+
+def mapOnThreads(function, items):
+  """Returns map(function, items), computed on INGESTTHREADS threads"""
+  pool = ThreadPool(max(1, INGESTTHREADS))
+  try:
+    return pool.map(function, items)
+  finally:
+    pool.close()
+
+
+def photoIngestInfos(paths, customDateFormat=''):
+  """Returns photoIngestInfo for all paths, read in parallel as slow (network) storage is waited for mostly"""
+  return mapOnThreads(lambda path: photoIngestInfo(path, customDateFormat), paths)
+
+
+def photoIngestInfo(path, customDateFormat=''):
+  """Returns (creation datetime, exif orientation, file size) of photo at path"""
+  (width, height, orientation, exifDateTime) = ImageFunctions.readPhotoMetadata(path)
+  fileStat = os.stat(path)
+  
+  return (ImageFunctions.creationDateTime(path, exifDateTime, customDateFormat, fileStat.st_mtime), orientation, fileStat.st_size)
+
+
+def reflinkFile(srcPath, dstPath):
+  """Make dstPath a copy on write clone of srcPath, returns False if the filesystem can not"""
+  if _clonefile is not None:
+    return _clonefile(srcPath, dstPath, 0) == 0
+  
+  try:
+    import fcntl
+  except ImportError:
+    return False
+  
+  with open(srcPath, 'rb') as src:
+    dst = open(dstPath, 'wb')
+    try:
+      fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except IOError as e:
+      dst.close()
+      os.remove(dstPath)
+      if e.errno in NOLINKERRORS:
+        return False
+      raise
+    dst.close()
+  
+  shutil.copystat(srcPath, dstPath)
+  return True
+
+
+def copyFileData(srcPath, dstPath, fileHash=None):
+  """Copy file content and times, in kernel with sendfile if available, else with large buffers.
+  
+  With hash object fileHash given, the copied data also gets hashed on the way."""
+  with open(srcPath, 'rb') as src:
+    with open(dstPath, 'wb') as dst:
+      sendfile = getattr(os, 'sendfile', None)
+      copied = False
+      
+      if fileHash is not None:
+        for block in iter(lambda: src.read(COPYBUFFERSIZE), b''):
+          fileHash.update(block)
+          dst.write(block)
+        copied = True
+      
+      elif sendfile is not None:
+        size = os.fstat(src.fileno()).st_size
+        offset = 0
+        try:
+          while offset < size:
+            sent = sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+            if sent == 0:
+              break
+            offset += sent
+          copied = offset == size
+        except OSError as e:
+          if e.errno not in NOLINKERRORS:
+            raise
+      
+      if not copied:
+        src.seek(0)
+        dst.seek(0)
+        dst.truncate()
+        shutil.copyfileobj(src, dst, COPYBUFFERSIZE)
+  
+  shutil.copystat(srcPath, dstPath)
+
+
+def transferFile(srcPath, dstPath, move=False, orientation=1, hashContent=False, hashUnread=False):
+  """Bring file srcPath to dstPath as cheap as possible, return (how, content hash of srcPath or None).
+  
+  How is renamed, reflinked, hardlinked, copied or one of writeUprightPhoto's. 
+  Moving renames (same filesystem), else copies and removes the source. 
+  Copying clones the data (reflink) or hardlinks (INGESTHARDLINKS) where 
+  possible. Photos with a rotating orientation other than 1 are written 
+  upright instead. With hashContent the data read for copying or turning 
+  upright gets hashed on the way. Renamed, cloned or linked files are not 
+  read at all, only with hashUnread as well they get read once for the hash."""
+  if orientation in ImageFunctions.ORIENTATIONTRANSPOSES:
+    fileHash = HelperFunctions.contentHash() if hashContent else None
+    method = ImageFunctions.writeUprightPhoto(srcPath, dstPath, fileHash)
+    if move:
+      os.remove(srcPath)
+    return (method, fileHash.hexdigest() if fileHash is not None else None)
+  
+  if move:
+    try:
+      os.rename(srcPath, dstPath)
+      return ('renamed', HelperFunctions.hashFile(dstPath) if hashContent and hashUnread else None)
+    except OSError as e:
+      if e.errno not in NOLINKERRORS:
+        raise
+  
+  method = None
+  
+  if reflinkFile(srcPath, dstPath):
+    method = 'reflinked'
+  elif INGESTHARDLINKS and not move:
+    try:
+      os.link(srcPath, dstPath)
+      method = 'hardlinked'
+    except OSError as e:
+      if e.errno not in NOLINKERRORS:
+        raise
+  
+  fileHash = None
+  
+  if method is None:
+    fileHash = HelperFunctions.contentHash() if hashContent else None
+    copyFileData(srcPath, dstPath, fileHash)
+    method = 'copied'
+  
+  if move:
+    os.remove(srcPath)
+  
+  if fileHash is not None:
+    return (method, fileHash.hexdigest())
+  
+  # nothing got read while cloning or linking
+  return (method, HelperFunctions.hashFile(dstPath) if hashContent and hashUnread else None)
+
+
+def ingestPhotos(transfers, move=False, knownHashes=None, knownSizes=()):
+  """Run transferFile for all (srcPath, dstPath, orientation) in transfers on INGESTTHREADS threads.
+  
+  With dict knownHashes (content hash -> photo file name) files get hashed 
+  while transferred, byte identical duplicates of known or just ingested 
+  photos get removed from the destination again. Files renamed, cloned or 
+  linked (not read) only get read for their hash if another file transferred 
+  or one in knownSizes (those of the known photos) has their size, no other 
+  one can have their content.
+  Returns (dict of files per transfer method, bytes, seconds, dict destination 
+  file name -> content hash or None of the photos kept)."""
+  logger = logging.getLogger('ELIME.ingestPhotos')
+  
+  hashLock = threading.Lock()
+  
+  sizes = [os.path.getsize(srcPath) for (srcPath, dstPath, orientation) in transfers]
+  sizeCounts = {}
+  for size in sizes:
+    sizeCounts[size] = sizeCounts.get(size, 0) + 1
+  
+  def transfer(((srcPath, dstPath, orientation), size)):
+    (method, fileHash) = transferFile(srcPath, dstPath, move, orientation, knownHashes is not None, 
+                                      sizeCounts[size] > 1 or size in knownSizes)
+    
+    if fileHash is not None:
+      with hashLock:
+        original = knownHashes.setdefault(fileHash, os.path.basename(dstPath))
+      
+      if original != os.path.basename(dstPath):
+        os.remove(dstPath)
+        logger.info("Duplicate: %s has the same content as %s, not kept", srcPath, original)
+        return ('duplicate', size, dstPath, None)
+    
+    logger.info("%s: %s -> %s", method.capitalize(), srcPath, dstPath)
+    return (method, size, dstPath, fileHash)
+  
+  start = time.time()
+  
+  results = mapOnThreads(transfer, zip(transfers, sizes))
+  
+  methods = {}
+  contentHashes = {}
+  for method, size, dstPath, fileHash in results:
+    methods[method] = methods.get(method, 0) + 1
+    if method != 'duplicate':
+      contentHashes[os.path.basename(dstPath)] = fileHash
+  
+  return (methods, sum(result[1] for result in results), time.time() - start, contentHashes)
@@ -28,11 +28,14 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import cv2.cv as cv
+import cv2
 import math
 import logging
+import numpy
 import os
 import sys
+import threading
+from multiprocessing.pool import ThreadPool
 
 # ELIME Project
 import HelperFunctions
@@ -41,11 +44,162 @@ import UiFunctions
 
 MINFACEPERCENTAGE = 0.1
 PATHTOCASCADES = '/usr/local/opt/opencv/share/OpenCV/haarcascades/'
+if hasattr(cv2, 'data'):
+  # pip's opencv-python ships its haarcascades inside the package
+  PATHTOCASCADES = cv2.data.haarcascades
 
+# smallest side (in pixels of a pyramid level) a pass' min_size may shrink to
+# before the pass is run on the next bigger level instead
+PYRAMIDMINWINDOW = 48
 
-def detectFacesInImage(cvImage, detectionDebug=False): 
+# face cascade of the haar detector
+FACECASCADE = 'haarcascade_frontalface_default.xml'
+
+# eye cascades, tried in this order until one finds exactly two eyes
+EYECASCADES = ['haarcascade_eye_tree_eyeglasses.xml', 'haarcascade_eye.xml']
+
+# passes run per eye cascade: (scale_factor, min_neighbors, flags, min_size)
+EYEDETECTIONARGUMENTS = [(1.1, 3, 0, (20,20)),
+                         (1.01, 3, 0, (10,10)),
+                         (1.05, 3, 0, (15,15)),
+                         (1.025, 3, 0, (10,10)),
+                         (1.075, 3, 0, (10,10)),
+                         (1.125, 3, 0, (10,10)),
+                         (1.15, 3, 0, (15,15)),
+                         (1.1, 2, 0, (30, 30))]
+
+# eye regions get scaled to this width before the pupil center search
+REFINEWIDTH = 48
+
+# number of threads the cascade passes of one photo run on concurrently, 
+# 1 runs them one after another
+DETECTIONTHREADS = 1
+
+# loaded CascadeClassifiers, one dict per thread as classifiers are not shareable
+_cascades = threading.local()
+
+_detectionPool = None
+
+
+def detectionPool():
+  """Returns thread pool for concurrent cascade passes, None if DETECTIONTHREADS is 1"""
+  global _detectionPool
+  
+  if DETECTIONTHREADS <= 1:
+    return None
+  
+  if _detectionPool is None:
+    _detectionPool = ThreadPool(DETECTIONTHREADS)
+  
+  return _detectionPool
+
+
+def runPasses(function, passes, detectionDebug=False):
+  """Yields function(*p) for p in passes, in order of passes.
+  
+  With a detection pool DETECTIONTHREADS passes run at a time, openCV releases 
+  the GIL while detecting, so they really run in parallel. Passes are only 
+  started when the caller asks for their wave, so stopping early saves work."""
+  pool = detectionPool()
+  
+  # debug windows need the passes one after another
+  if pool is None or detectionDebug:
+    for p in passes:
+      yield function(*p)
+    return
+  
+  for start in range(0, len(passes), DETECTIONTHREADS):
+    for result in pool.map(lambda p: function(*p), passes[start:start + DETECTIONTHREADS]):
+      yield result
+
+
+def loadCascade(path):
+  """Returns CascadeClassifier for file path, loading it only once per thread"""
+  logger = logging.getLogger('ELIME.OpenCVFunctions.loadCascade')
+  
+  if not hasattr(_cascades, 'byPath'):
+    _cascades.byPath = {}
+  
+  if path not in _cascades.byPath:
+    checkedPath = HelperFunctions.checkFile(path)
+    
+    if checkedPath is None:
+      logger.critical("Path to cascade is wrong: %s", path)
+      sys.exit(1)
+    
+    cascade = cv2.CascadeClassifier(checkedPath)
+    if cascade.empty():
+      logger.critical("Could not load cascade: %s", checkedPath)
+      sys.exit(1)
+    
+    _cascades.byPath[path] = cascade
+    
+  return _cascades.byPath[path]
+
+
+class DetectionPyramid(object):
+  """Grayscale, histogram equalized version of a BGR image plus cached halved levels.
+  
+  All cascade passes on one photo share one instance, so colour conversion, 
+  equalization and downscaling are done once per photo and not once per pass."""
+  
+  def __init__(self, cvImage):
+    gray = cv2.cvtColor(cvImage, cv2.COLOR_BGR2GRAY)
+    self.levels = [cv2.equalizeHist(gray)]
+    # passes running concurrently must not build the same level twice
+    self.lock = threading.Lock()
+  
+  def level(self, index):
+    """Returns pyramid level index, level 0 being the full size image"""
+    with self.lock:
+      while len(self.levels) <= index:
+        self.levels.append(cv2.pyrDown(self.levels[-1]))
+      return self.levels[index]
+  
+  def levelIndexForMinSize(self, min_size):
+    """Returns the smallest level on which objects of min_size are still PYRAMIDMINWINDOW big"""
+    index = 0
+    side = min(min_size)
+    while side / 2 >= PYRAMIDMINWINDOW:
+      side = side / 2
+      index = index + 1
+    return index
+    
+
+def detectObjectsInPyramid(pyramid, cascadePath, rect, scale_factor, min_neighbors, flags, min_size):
+  """Run one pass of cascade file cascadePath on the fitting pyramid level.
+  
+  Returns list of (rect, neighbors) in full size coordinates, relative to rect if 
+  given."""
+  cascade = loadCascade(cascadePath)
+  
+  index = pyramid.levelIndexForMinSize(min_size)
+  factor = 2 ** index
+  image = pyramid.level(index)
+  
+  (ox, oy) = (0, 0)
+  if rect:
+    (x, y, w, h) = rect
+    (lx, ly) = (x / factor, y / factor)
+    # a view, no pixels get copied
+    image = image[ly:ly + max(1, h / factor), lx:lx + max(1, w / factor)]
+    # offset between level ROI and requested full size ROI
+    (ox, oy) = (lx * factor - x, ly * factor - y)
+    
+  levelMinSize = (max(1, min_size[0] / factor), max(1, min_size[1] / factor))
+  objects, numDetections = cascade.detectMultiScale2(image, scaleFactor=scale_factor, minNeighbors=min_neighbors, 
+                                                     flags=flags, minSize=levelMinSize)
+  
+  detected = []
+  for (dx, dy, dw, dh), n in zip(objects, numDetections):
+    detected.append(((int(dx) * factor + ox, int(dy) * factor + oy, int(dw) * factor, int(dh) * factor), int(n)))
+  
+  return detected
+
+
+def detectFacesInImage(cvImage, detectionDebug=False, pyramid=None, cascadePath=None): 
   logger = logging.getLogger('ELIME.OpenCVFunctions.detectFacesInImage')
-  width, height = cv.GetSize(cvImage)
+  width, height = HelperFunctions.imageSize(cvImage)
   
   minDimension = min(width, height)
   
@@ -61,23 +215,20 @@ def detectFacesInImage(cvImage, detectionDebug=False):
               (1.1, 3, 0, (int(0.1 * minDimension), int(0.1 * minDimension))),
               (1.1, 3, 0, (int(0.01 * minDimension), int(0.01 * minDimension)))]
               
-  path = os.path.join(PATHTOCASCADES, 'haarcascade_frontalface_default.xml')
-  path = HelperFunctions.checkFile(path)
- 
-  if path is None:
-    logger.critical("Path to opencv haarcascades is wrong: %s", PATHTOCASCADES)
-    sys.exit(1)
-
-  print path    
-  faceCascade = cv.Load(path)
+  if cascadePath is None:
+    cascadePath = os.path.join(PATHTOCASCADES, FACECASCADE)
+  # load in this thread, so a wrong path stops ELIME before passes are run
+  loadCascade(cascadePath)
   
-  storage = cv.CreateMemStorage()
+  if pyramid is None:
+    pyramid = DetectionPyramid(cvImage)
   
   returnFaces = set()
   
-  for (scale_factor, min_neighbors, flags, min_size) in arguments:
-    
-    detectedFaces = cv.HaarDetectObjects(cvImage, faceCascade, storage, scale_factor, min_neighbors, flags, min_size)
+  passes = [(pyramid, cascadePath, None) + argument for argument in arguments]
+  
+  for (scale_factor, min_neighbors, flags, min_size), detectedFaces in zip(arguments, runPasses(detectObjectsInPyramid, passes, detectionDebug)):
+      
     debugString = '{0:d} faces found, args: {1} {2} {3} {4}'.format(len(detectedFaces), str(scale_factor), str(min_neighbors), str(flags), str(min_size))
     logger.debug(debugString)
     for face,n in detectedFaces:
@@ -86,64 +237,63 @@ def detectFacesInImage(cvImage, detectionDebug=False):
     if detectionDebug:
       debugFaces = []
       for face,n in detectedFaces:
-        debugFaces.append((face, cv.RGB(0, 0, 255)))
+        debugFaces.append((face, UiFunctions.RGB(0, 0, 255)))
       UiFunctions.displayColoredRects(cvImage, debugString, debugFaces)
       
   logger.debug("returning Faces: %s", returnFaces)     
   return returnFaces
   
    
-def detectEyesInRectInImage(cvImage, rect, detectionDebug=False):
+def detectEyesInRectInImage(cvImage, rect, detectionDebug=False, pyramid=None, haarcascades=None, arguments=None):
 
   logger = logging.getLogger('ELIME.OpenCVFunctions.detectEyesInRectInImage')
   
   EYESWANTED = 2
   
-#   (scale_factor, min_neighbors, flags, min_size)
-  arguments = [(1.1, 3, 0, (20,20)),
-               (1.01, 3, 0, (10,10)),
-               (1.05, 3, 0, (15,15)),
-               (1.025, 3, 0, (10,10)),
-               (1.075, 3, 0, (10,10)),
-               (1.125, 3, 0, (10,10)),
-               (1.15, 3, 0, (15,15)),
-               (1.1, 2, 0, (30, 30))]
+  if haarcascades is None:
+    haarcascades = EYECASCADES
+  
+  if arguments is None:
+    arguments = EYEDETECTIONARGUMENTS
+  
+  if pyramid is None:
+    pyramid = DetectionPyramid(cvImage)
   
+  searchRect = None
+  debugImage = cvImage
   if rect:
     (x, y, w, h) = rect
-    cv.SetImageROI(cvImage, (x, y, w, int(h * 0.6)))
+    searchRect = (x, y, w, int(h * 0.6))
+    debugImage = cvImage[y:y + int(h * 0.6), x:x + w]
   
-  haarcascades = ['haarcascade_eye_tree_eyeglasses.xml', 'haarcascade_eye.xml']
-
-  storage = cv.CreateMemStorage()
-
   returnedEyes = []
-
+  
+  # With a detection pool several passes run at once. Picking the result below 
+  # still walks through them in the very same order as without, so both ways 
+  # return the same eyes.
+  for cascade in haarcascades:
+    # load in this thread, so a wrong path stops ELIME before passes are run
+    loadCascade(os.path.join(PATHTOCASCADES, cascade))
+  
+  passes = [(pyramid, os.path.join(PATHTOCASCADES, cascade), searchRect) + argument for cascade in haarcascades for argument in arguments]
+  passResults = runPasses(detectObjectsInPyramid, passes, detectionDebug)
+  
   for cascade in haarcascades:
     
-    path = os.path.join(PATHTOCASCADES, cascade)
-    path = HelperFunctions.checkFile(path)
- 
     if len(returnedEyes) == 2:
       break
     
-    if path is None:
-      logger.critical("Path to haarcascade is wrong: %s", os.path.join(PATHTOCASCADES, cascade))
-      sys.exit(1)
-      
-    eyeCascade = cv.Load(path)
-    
-    for (scale_factor, min_neighbors, flags, min_size) in arguments:
+    for scale_factor, min_neighbors, flags, min_size in arguments:
       
-      detectedEyes = cv.HaarDetectObjects(cvImage, eyeCascade, storage, scale_factor, min_neighbors, flags, min_size)
+      detectedEyes = next(passResults)
       
       debugString = '{0:d} eyes found, args: {1} {2} {3} {4} {5}'.format(len(detectedEyes), cascade, str(scale_factor), str(min_neighbors), str(flags), str(min_size))
       
       if detectionDebug:
         debugEyes = []
         for eye,n in detectedEyes:
-          debugEyes.append((eye, cv.RGB(255, 255, 0)))
-        UiFunctions.displayColoredRects(cvImage, debugString, debugEyes)
+          debugEyes.append((eye, UiFunctions.RGB(255, 255, 0)))
+        UiFunctions.displayColoredRects(debugImage, debugString, debugEyes)
       
       logger.debug(debugString)
 
@@ -160,19 +310,41 @@ def detectEyesInRectInImage(cvImage, rect, detectionDebug=False):
         logger.debug("%d eyes found. Better than: %d", len(detectedEyes), len(returnedEyes))
         returnedEyes = detectedEyes
     
-  cv.ResetImageROI(cvImage)
-
   logger.debug("Returning Eyes: %s", returnedEyes)     
   return returnedEyes
 
  
-def eyeRectsInImage(cvImage, fileName='', detectionDebug=False):
+def eyeRectsInImage(cvImage, fileName='', detectionDebug=False, faceCascadePath=None):
+  """Detect faces with cascade faceCascadePath (default: haar frontal face), then eyes, return eye rects left to right"""
+  return [eyeRect for (eyeRect, n) in eyesInImage(cvImage, fileName, detectionDebug, faceCascadePath)]
+
+
+def eyesInImage(cvImage, fileName='', detectionDebug=False, faceCascadePath=None):
+  """Like eyeRectsInImage, but returns (eye rect, number of neighbors the cascade found it with) left to right"""
   logger = logging.getLogger('ELIME.OpenCVFunctions.eyeRectsInImage')
-  listOfEyeRects = []
   
   logger.info("Start detecting faces.")
   
-  faces = detectFacesInImage(cvImage, detectionDebug)
+  # grayscale and equalize only once, all face and eye passes share it
+  pyramid = DetectionPyramid(cvImage)
+  
+  faces = detectFacesInImage(cvImage, detectionDebug, pyramid, faceCascadePath)
+  
+  return eyesInFaces(cvImage, faces, fileName, detectionDebug, pyramid)
+
+
+def eyeRectsInFaces(cvImage, faces, fileName='', detectionDebug=False, pyramid=None, haarcascades=None, arguments=None):
+  """Detect eyes in biggest of faces (or whole image if it is too small), return eye rects left to right"""
+  return [eyeRect for (eyeRect, n) in eyesInFaces(cvImage, faces, fileName, detectionDebug, pyramid, haarcascades, arguments)]
+
+
+def eyesInFaces(cvImage, faces, fileName='', detectionDebug=False, pyramid=None, haarcascades=None, arguments=None):
+  """Like eyeRectsInFaces, but returns (eye rect, number of neighbors the cascade found it with) left to right"""
+  logger = logging.getLogger('ELIME.OpenCVFunctions.eyeRectsInFaces')
+  listOfEyes = []
+  
+  if pyramid is None:
+    pyramid = DetectionPyramid(cvImage)
   
   biggestFace = None
   
@@ -190,7 +362,7 @@ def eyeRectsInImage(cvImage, fileName='', detectionDebug=False):
   if biggestFace is not None:
     logger.debug("biggest face is %s", biggestFace)
     (bx, by, bw, bh) = biggestFace
-    width, height = cv.GetSize(cvImage)
+    width, height = HelperFunctions.imageSize(cvImage)
     imArea = width * height
     bfArea = bw * bh
   
@@ -198,42 +370,123 @@ def eyeRectsInImage(cvImage, fileName='', detectionDebug=False):
   
     if division > MINFACEPERCENTAGE:
       logger.info("%f biggest face size of image size - bigger than threshhold %f. Using face region for eye search.", division, MINFACEPERCENTAGE)
-      eyes = detectEyesInRectInImage(cvImage, biggestFace, detectionDebug)
+      eyes = detectEyesInRectInImage(cvImage, biggestFace, detectionDebug, pyramid, haarcascades, arguments)
   
       for (eyeRect, n) in eyes:
-        listOfEyeRects.append(HelperFunctions.calcRectInRect(eyeRect, biggestFace))
+        listOfEyes.append((HelperFunctions.calcRectInRect(eyeRect, biggestFace), n))
         
     else:
       logger.info("%f biggest face size of image size - smaller than threshhold %f. Search everywhere in image for eyes.", division, MINFACEPERCENTAGE)
-      eyes = detectEyesInRectInImage(cvImage, None, detectionDebug)
-      for (eyeRect, n) in eyes:
-        listOfEyeRects.append(eyeRect)
+      listOfEyes = detectEyesInRectInImage(cvImage, None, detectionDebug, pyramid, haarcascades, arguments)
         
   else:
     logger.info("No face found. Search everywhere in image for eyes.")
-    eyes = detectEyesInRectInImage(cvImage, None, detectionDebug)
-    for (eyeRect, n) in eyes:
-      listOfEyeRects.append(eyeRect)
+    listOfEyes = detectEyesInRectInImage(cvImage, None, detectionDebug, pyramid, haarcascades, arguments)
   
   # return new sorted list
-  listOfEyeRects = sorted(listOfEyeRects, key=lambda rect: HelperFunctions.middleOfRect(rect)[0])
+  listOfEyes = sorted(listOfEyes, key=lambda (rect, n): HelperFunctions.middleOfRect(rect)[0])
 
   if detectionDebug:
-    facecolor = cv.RGB(0, 0, 255)
-    biggestfacecolor = cv.RGB(122, 0, 255)
-    eyecolor = cv.RGB(255, 255, 0)
+    facecolor = UiFunctions.RGB(0, 0, 255)
+    biggestfacecolor = UiFunctions.RGB(122, 0, 255)
+    eyecolor = UiFunctions.RGB(255, 255, 0)
     
     rectsAndColor = []
     
     for face in faces:
       rectsAndColor.append((face, facecolor))
-    rectsAndColor.append((biggestFace, biggestfacecolor))
-    for eye in listOfEyeRects:
+    if biggestFace is not None:
+      rectsAndColor.append((biggestFace, biggestfacecolor))
+    for (eye, n) in listOfEyes:
       rectsAndColor.append((eye, eyecolor))
-    windowName = "finally {0:d} faces {1:d} eyes in {2}".format(len(faces), len(listOfEyeRects), fileName)
+    windowName = "finally {0:d} faces {1:d} eyes in {2}".format(len(faces), len(listOfEyes), fileName)
     UiFunctions.displayColoredRects(cvImage, windowName, rectsAndColor)
     
-  logger.debug("Returning Eyes: %s", listOfEyeRects) 
-  return listOfEyeRects
+  logger.debug("Returning Eyes: %s", listOfEyes) 
+  return listOfEyes
+
 
 
+
+def refineEyeCenter(cvImage, eyeRect):
+  """Locate the pupil center in eyeRect of BGR image cvImage by means of gradients.
+  
+  The center is where most image gradients point away from (Timm and Barth, 
+  "Accurate eye centre localisation by means of gradients"), dark centers are 
+  preferred. Returns ((x, y) as sub-pixel floats in image coordinates, confidence) 
+  with confidence between 0 (ambiguous) and 1 (one distinct center)."""
+  (width, height) = HelperFunctions.imageSize(cvImage)
+  (x, y, w, h) = eyeRect
+  x0 = max(0, x)
+  y0 = max(0, y)
+  x1 = min(width, x + w)
+  y1 = min(height, y + h)
+  
+  if x1 - x0 < 4 or y1 - y0 < 4:
+    return (HelperFunctions.middleOfRect(eyeRect), 0.0)
+  
+  gray = cv2.cvtColor(cvImage[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+  factor = REFINEWIDTH / float(x1 - x0)
+  small = cv2.resize(gray, (REFINEWIDTH, max(4, int(round((y1 - y0) * factor)))), interpolation=cv2.INTER_AREA)
+  small = cv2.GaussianBlur(small, (3, 3), 0).astype(numpy.float32)
+  
+  gx = cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=3)
+  gy = cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=3)
+  magnitude = numpy.sqrt(gx * gx + gy * gy)
+  
+  # only strong gradients vote
+  mask = magnitude > magnitude.mean() + 0.3 * magnitude.std()
+  if not mask.any():
+    return (HelperFunctions.middleOfRect(eyeRect), 0.0)
+  
+  gys, gxs = numpy.nonzero(mask)
+  ngx = gx[mask] / magnitude[mask]
+  ngy = gy[mask] / magnitude[mask]
+  
+  # displacement of every gradient position from every candidate center
+  (sh, sw) = small.shape
+  cys, cxs = numpy.mgrid[0:sh, 0:sw]
+  dx = gxs[numpy.newaxis, :] - cxs.reshape(-1, 1)
+  dy = gys[numpy.newaxis, :] - cys.reshape(-1, 1)
+  distance = numpy.sqrt(dx * dx + dy * dy)
+  distance[distance == 0] = 1.0
+  dot = numpy.maximum(0.0, (dx * ngx + dy * ngy) / distance)
+  
+  darkness = 255.0 - small.reshape(-1)
+  objective = ((dot * dot).mean(axis=1) * darkness).reshape(sh, sw)
+  
+  (cy, cx) = numpy.unravel_index(numpy.argmax(objective), objective.shape)
+  peak = objective[cy, cx]
+  
+  if peak <= 0:
+    return (HelperFunctions.middleOfRect(eyeRect), 0.0)
+  
+  # confidence: how much the peak stands out from the best center outside its surroundings
+  radius = max(2, int(0.15 * sw))
+  outside = objective.copy()
+  outside[max(0, cy - radius):cy + radius + 1, max(0, cx - radius):cx + radius + 1] = 0
+  confidence = 1.0 - outside.max() / peak
+  
+  # a center on the border of the eye rect is no reliable pupil
+  if cx in (0, sw - 1) or cy in (0, sh - 1):
+    confidence = 0.0
+  
+  # sub-pixel position by parabola through the peak and its neighbours
+  fx = float(cx)
+  fy = float(cy)
+  if 0 < cx < sw - 1:
+    (left, right) = (objective[cy, cx - 1], objective[cy, cx + 1])
+    denominator = left - 2 * peak + right
+    if denominator < 0:
+      fx = cx + 0.5 * (left - right) / denominator
+  if 0 < cy < sh - 1:
+    (up, down) = (objective[cy - 1, cx], objective[cy + 1, cx])
+    denominator = up - 2 * peak + down
+    if denominator < 0:
+      fy = cy + 0.5 * (up - down) / denominator
+  
+  # back to image coordinates, with pixel centers at integer positions
+  centerX = x0 + (fx + 0.5) / factor - 0.5
+  centerY = y0 + (fy + 0.5) / factor - 0.5
+  
+  return ((centerX, centerY), float(confidence))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+# photos prepared ahead of the one on screen in add and check
+PREFETCHPHOTOS = 3
+
+# upper bound of memory the photos prepared ahead may take
+PREFETCHMEGABYTES = 512
+
+
+class Prefetcher(object):
+  """Computes function(item) for the next items of a list ahead on a thread pool, results get fetched in list order.
+  
+  At most lookahead items are in flight, and only as many as their 
+  estimated itemBytes(item) fit into maxBytes (but always one). Items 
+  asked for out of order are computed right away, everything before 
+  them gets dropped."""
+  
+  def __init__(self, function, items, lookahead=None, maxBytes=None, itemBytes=None):
+    self.function = function
+    self.items = list(items)
+    self.lookahead = PREFETCHPHOTOS if lookahead is None else lookahead
+    self.maxBytes = PREFETCHMEGABYTES * 1024 * 1024 if maxBytes is None else maxBytes
+    self.itemBytes = itemBytes or (lambda item: 0)
+    
+    # position of each item, the next one to submit, the first not asked for yet
+    self.positions = dict((item, index) for index, item in enumerate(self.items))
+    self.next = 0
+    self.first = 0
+    # item -> (AsyncResult, estimated bytes)
+    self.pending = {}
+    self.pendingBytes = 0
+    self.lock = threading.Lock()
+    
+    self.pool = None
+    if self.lookahead > 0:
+      self.pool = ThreadPool(self.lookahead)
+      self.fill()
+  
+  def fill(self):
+    """Submit next items as long as lookahead and memory allow"""
+    with self.lock:
+      while self.pool is not None and self.next < len(self.items) and len(self.pending) < self.lookahead:
+        item = self.items[self.next]
+        size = self.itemBytes(item)
+        
+        if self.pending and self.pendingBytes + size > self.maxBytes:
+          break
+        
+        self.pending[item] = (self.pool.apply_async(self.function, (item,)), size)
+        self.pendingBytes += size
+        self.next += 1
+  
+  def drop(self, item):
+    """Forget prefetched item, returns its AsyncResult or None"""
+    with self.lock:
+      (result, size) = self.pending.pop(item, (None, 0))
+      self.pendingBytes -= size
+      return result
+  
+  def get(self, item):
+    """Returns function(item), waiting for the prefetched result if there is one"""
+    logger = logging.getLogger('ELIME.Prefetcher')
+    
+    position = self.positions.get(item)
+    
+    if position is not None and position >= self.first:
+      # items passed by are not going to be asked for anymore
+      for skipped in self.items[self.first:position]:
+        self.drop(skipped)
+      with self.lock:
+        self.first = position + 1
+        self.next = max(self.next, self.first)
+    
+    result = self.drop(item)
+    
+    if result is None:
+      logger.debug("%s was not prefetched", item)
+      value = self.function(item)
+    elif result.ready():
+      value = result.get()
+    else:
+      logger.debug("Waiting for %s to be prepared", item)
+      value = result.get()
+    
+    # one done, the next one may start
+    self.fill()
+    
+    return value
+  
+  def close(self):
+    """Stop preparing items"""
+    with self.lock:
+      if self.pool is not None:
+        self.pool.terminate()
+        self.pool = None
+      self.pending = {}
+      self.pendingBytes = 0
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import cv2
+import logging
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+# ELIME Project
+import ImageFunctions
+
+# folder keeping downscaled copies of the photos for the add and check windows, None: no proxies
+PROXYFOLDER = None
+
+# threads creating proxies in the background
+PROXYTHREADS = 2
+
+# JPEG quality of proxies
+PROXYQUALITY = 95
+
+
+def proxyScale(catalogPhoto, maxDimension):
+  """Returns factor between photo and its proxy fitting into maxDimension, like ImageFunctions.scaleCVImage"""
+  size = max(catalogPhoto.width, catalogPhoto.height)
+  if size > maxDimension:
+    return size / float(maxDimension)
+  return 1.0
+
+
+def decodedBytes(catalogPhoto, maxDimension):
+  """Returns estimated memory of the full size and scaled openCV images of photo, 0 if its size is unknown"""
+  if None in (catalogPhoto.width, catalogPhoto.height):
+    return 0
+  scale = proxyScale(catalogPhoto, maxDimension)
+  return 3 * catalogPhoto.width * catalogPhoto.height * (1 + 1 / (scale * scale))
+
+
+def proxyFileName(catalogPhoto, maxDimension):
+  """Returns file name of proxy of photo in version (size, mtime) of catalogPhoto, so changed photos get new proxies"""
+  return '%s.%d.%d.%d.jpg' % (catalogPhoto.photoFileName, maxDimension, catalogPhoto.fileSize, int(catalogPhoto.mtime * 1000))
+
+
+def loadFullSizeImage(path, orientation=None):
+  """Returns upright full size openCV image of photo at path"""
+  return ImageFunctions.convertPIL2CV(ImageFunctions.loadAndTransposePILImage(path, orientation))
+
+
+class FullSizeImage(object):
+  """Full size openCV image of a photo, decoded when first asked for"""
+  
+  def __init__(self, path, orientation=None, cvImage=None):
+    self.path = path
+    self.orientation = orientation
+    self.cvImage = cvImage
+  
+  def get(self):
+    if self.cvImage is None:
+      self.cvImage = loadFullSizeImage(self.path, self.orientation)
+    return self.cvImage
+
+
+class ProxyCache(object):
+  """Downscaled photos of srcPath fitting into maxDimension, created ahead on PROXYTHREADS threads.
+  
+  Proxies live as JPEGs in PROXYFOLDER, named by photo file name, size and 
+  mtime. Without PROXYFOLDER photos simply get loaded and scaled."""
+  
+  def __init__(self, srcPath, maxDimension):
+    self.srcPath = srcPath
+    self.maxDimension = maxDimension
+    self.pool = None
+    # photo file name -> AsyncResult of proxy being created
+    self.pending = {}
+    self.lock = threading.Lock()
+    
+    if PROXYFOLDER is not None and not os.path.isdir(PROXYFOLDER):
+      os.makedirs(PROXYFOLDER)
+  
+  def proxyPath(self, catalogPhoto):
+    return os.path.join(PROXYFOLDER, proxyFileName(catalogPhoto, self.maxDimension))
+  
+  def hasProxy(self, catalogPhoto):
+    """Returns True if an up to date proxy of photo exists or needs none (PROXYFOLDER unset, size unknown)"""
+    if PROXYFOLDER is None or None in (catalogPhoto.width, catalogPhoto.height):
+      return True
+    return os.path.isfile(self.proxyPath(catalogPhoto))
+  
+  def createProxy(self, catalogPhoto):
+    """Load and scale photo, store its proxy and return (scaled image, scale, full size cvImage)"""
+    cvImage = loadFullSizeImage(os.path.join(self.srcPath, catalogPhoto.photoFileName), catalogPhoto.orientation)
+    (scaledImage, scale) = ImageFunctions.scaleCVImage(cvImage, self.maxDimension)
+    
+    if PROXYFOLDER is not None:
+      path = self.proxyPath(catalogPhoto)
+      # written under another name first, a proxy file is always complete
+      tmpPath = '%s.%d.tmp.jpg' % (path, threading.current_thread().ident)
+      cv2.imwrite(tmpPath, scaledImage, [cv2.IMWRITE_JPEG_QUALITY, PROXYQUALITY])
+      os.rename(tmpPath, path)
+    
+    return (scaledImage, scale, cvImage)
+  
+  def prefetch(self, catalogPhotos):
+    """Start creating missing proxies of catalogPhotos in the background, in the given order"""
+    logger = logging.getLogger('ELIME.ProxyCache')
+    
+    missingPhotos = [photo for photo in catalogPhotos if not self.hasProxy(photo)]
+    if not missingPhotos:
+      return
+    
+    logger.info("Creating %d missing proxies in the background", len(missingPhotos))
+    
+    if self.pool is None:
+      self.pool = ThreadPool(max(1, PROXYTHREADS))
+    
+    with self.lock:
+      for photo in missingPhotos:
+        # only the proxy gets kept, not the full size image
+        self.pending[photo.photoFileName] = self.pool.apply_async(lambda photo: self.createProxy(photo)[:2], (photo,))
+  
+  def load(self, catalogPhoto):
+    """Returns (scaled image, scale, FullSizeImage) of photo, full size only gets decoded if needed"""
+    path = os.path.join(self.srcPath, catalogPhoto.photoFileName)
+    
+    with self.lock:
+      pending = self.pending.pop(catalogPhoto.photoFileName, None)
+    
+    if pending is not None:
+      # being created right now (or soon), wait for it instead of doing it twice
+      try:
+        (scaledImage, scale) = pending.get()
+        return (scaledImage, scale, FullSizeImage(path, catalogPhoto.orientation))
+      except Exception:
+        logging.getLogger('ELIME.ProxyCache').exception("Creating proxy of %s failed", catalogPhoto.photoFileName)
+    
+    if PROXYFOLDER is not None and None not in (catalogPhoto.width, catalogPhoto.height):
+      scaledImage = cv2.imread(self.proxyPath(catalogPhoto))
+      if scaledImage is not None:
+        return (scaledImage, proxyScale(catalogPhoto, self.maxDimension), FullSizeImage(path, catalogPhoto.orientation))
+    
+    (scaledImage, scale, cvImage) = self.createProxy(catalogPhoto)
+    return (scaledImage, scale, FullSizeImage(path, catalogPhoto.orientation, cvImage))
+  
+  def close(self):
+    """Stop creating proxies, the ones not done get created next time"""
+    if self.pool is not None:
+      self.pool.terminate()
+      self.pool = None
+    self.pending = {}
+
+
+def removeStaleProxies(catalog):
+  """Delete proxies of photos not in catalog (dict file name -> CatalogPhoto) or changed since, returns their number"""
+  if PROXYFOLDER is None or not os.path.isdir(PROXYFOLDER):
+    return 0
+  
+  removed = 0
+  for name in os.listdir(PROXYFOLDER):
+    # photo file name, maxDimension, size, mtime, jpg
+    parts = name.rsplit('.', 4)
+    photo = None
+    if len(parts) == 5 and parts[1].isdigit():
+      photo = catalog.get(parts[0])
+    if photo is None or name != proxyFileName(photo, int(parts[1])):
+      os.remove(os.path.join(PROXYFOLDER, name))
+      removed += 1
+  
+  return removed
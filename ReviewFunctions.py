@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import cv2
+import math
+import numpy
+import threading
+from multiprocessing.pool import ThreadPool
+
+# the signals suspicionScores rates stored eye positions by, in column order
+SIGNALS = ['jump', 'distance', 'angle', 'detection']
+
+# a detected eye agrees with a stored one if it is at most this fraction of 
+# the distance between both eyes away (like TuneFunctions.TUNEMAXERROR)
+REVIEWMAXERROR = 0.1
+
+# size of the contact sheet tiles, both eyes get moved onto its middle line at 
+# TILEEYEPOSITIONS of its width
+TILESIZE = (240, 80)
+TILEEYEPOSITIONS = (0.25, 0.75)
+
+# tiles per contact sheet page
+SHEETCOLUMNS = 6
+SHEETROWS = 8
+
+# threads creating tiles
+TILETHREADS = 2
+
+# add --autoAccept stores detected eyes without asking from this acceptanceScore on
+AUTOACCEPTSCORE = 0.7
+
+# eyes tilted this much (radians) or more are no plausible pair
+MAXEYEANGLE = math.radians(30)
+
+# plausible eye distances as fraction of the photo's width
+EYEDISTANCERANGE = (0.03, 0.6)
+
+# the temporal prior are the eyes of up to this many photos taken before 
+# (and at least PRIORMINPHOTOS), eyes this many eye distances away from it 
+# are not plausible at all
+PRIORPHOTOS = 7
+PRIORMINPHOTOS = 3
+PRIORTOLERANCE = 1.0
+
+# exif orientations ImageFunctions turns by 90 degrees
+QUARTERTURNS = (6, 8)
+
+# smallest spread robustZScores assumes, so a series of nearly identical 
+# photos (tripod) does not turn tiny differences into huge scores: jumps 
+# in eye distances, log of eye distance, angle in radians
+MINSPREADS = {'jump': 0.02, 'distance': 0.01, 'angle': 0.01}
+
+
+def robustZScores(values, minSpread):
+  """Returns (values - median) / spread with the spread estimated by the median absolute deviation"""
+  median = numpy.median(values)
+  spread = max(1.4826 * numpy.median(numpy.abs(values - median)), minSpread)
+  return (values - median) / spread
+
+
+def detectionErrors(photos, eyeDistances, detectedEyes):
+  """Returns array of how far (in eye distances) the stored eyes are from the nearest detected eye, 
+  0 for photos without detection"""
+  errors = numpy.zeros(len(photos))
+  for index, photo in enumerate(photos):
+    eyes = detectedEyes.get(photo.photoFileName)
+    if not eyes:
+      continue
+    misses = [min(math.hypot(dx - x, dy - y) for (dx, dy) in eyes) 
+              for (x, y) in [(photo.lEyeX, photo.lEyeY), (photo.rEyeX, photo.rEyeY)]]
+    errors[index] = max(misses) / eyeDistances[index]
+  return errors
+
+
+def suspicionScores(photos, detectedEyes=None):
+  """Returns array (photo, SIGNALS) of how unusual the stored eyes of each photo are, 0 is ordinary.
+  
+  photos are EyePhotos with eyes ordered by date, detectedEyes maps file 
+  names to lists of (x, y) found by a detector, if any. All photos get 
+  rated in one pass over numpy arrays."""
+  scores = numpy.zeros((len(photos), len(SIGNALS)))
+  if len(photos) == 0:
+    return scores
+  
+  # (photo, eye, x/y)
+  eyes = numpy.array([(p.lEyeX, p.lEyeY, p.rEyeX, p.rEyeY) for p in photos], dtype=numpy.float64).reshape(-1, 2, 2)
+  
+  deltas = eyes[:, 1] - eyes[:, 0]
+  eyeDistances = numpy.maximum(numpy.hypot(deltas[:, 0], deltas[:, 1]), 1.0)
+  
+  # a single misplaced photo moved away from the photo before and after it, 
+  # its neighbours only from one of them
+  if len(photos) > 1:
+    steps = numpy.sqrt(((eyes[1:] - eyes[:-1]) ** 2).sum(axis=2)).max(axis=1) / numpy.median(eyeDistances)
+    jumps = numpy.minimum(numpy.append(steps, numpy.inf), numpy.insert(steps, 0, numpy.inf))
+    scores[:, 0] = robustZScores(jumps, MINSPREADS['jump'])
+  
+  scores[:, 1] = numpy.abs(robustZScores(numpy.log(eyeDistances), MINSPREADS['distance']))
+  scores[:, 2] = numpy.abs(robustZScores(numpy.arctan2(deltas[:, 1], deltas[:, 0]), MINSPREADS['angle']))
+  if detectedEyes:
+    scores[:, 3] = detectionErrors(photos, eyeDistances, detectedEyes) / REVIEWMAXERROR
+  
+  return numpy.maximum(scores, 0.0)
+
+
+def suspiciousPhotos(photos, number, detectedEyes=None):
+  """Returns list of (EyePhoto, score, scores by signal) of the number most suspicious photos, most suspicious first"""
+  scores = suspicionScores(photos, detectedEyes)
+  totals = numpy.sqrt((scores ** 2).sum(axis=1))
+  
+  ranking = numpy.argsort(-totals, kind='mergesort')[:number]
+  return [(photos[index], totals[index], dict(zip(SIGNALS, scores[index]))) for index in ranking]
+
+
+def uprightSize(catalogPhoto):
+  """Returns (width, height) of photo as shown, after applying its exif orientation"""
+  if catalogPhoto.orientation in QUARTERTURNS:
+    return (catalogPhoto.height, catalogPhoto.width)
+  return (catalogPhoto.width, catalogPhoto.height)
+
+
+def relativeEyes(leftEye, rightEye, width):
+  """Returns eye positions as numpy array (eye, x/y) in units of the photo's width, photos of different cameras compare"""
+  return numpy.array([leftEye, rightEye], dtype=numpy.float64) / float(width)
+
+
+def temporalPrior(recentEyes):
+  """Returns expected relative eyes from relativeEyes of photos taken before, None with too few of them"""
+  if len(recentEyes) < PRIORMINPHOTOS:
+    return None
+  return numpy.median(numpy.array(recentEyes[-PRIORPHOTOS:]), axis=0)
+
+
+def acceptanceScore(eyes, width, prior=None):
+  """Returns (score, parts) of how likely detected eyes ((x, y), confidence, support) are right, both 0 to 1.
+  
+  The score is the geometric mean of the parts: detector support, refinement 
+  confidence, geometry (angle and distance of the eyes in a photo width pixels 
+  wide) and agreement with the temporal prior (see temporalPrior). Parts the 
+  detection has no values for are left out, anything but two eyes scores 0."""
+  if len(eyes) != 2:
+    return (0.0, {})
+  
+  ((leftEye, leftConfidence, leftSupport), (rightEye, rightConfidence, rightSupport)) = sorted(eyes, key=lambda eye: eye[0][0])
+  parts = {}
+  
+  if None not in (leftSupport, rightSupport):
+    parts['support'] = math.sqrt(leftSupport * rightSupport)
+  
+  # an unsure refinement means a blurry pupil more often than a wrong eye, it counts half
+  if None not in (leftConfidence, rightConfidence):
+    parts['refinement'] = 0.5 + 0.5 * min(leftConfidence, rightConfidence)
+  
+  relative = relativeEyes(leftEye, rightEye, width)
+  (dx, dy) = relative[1] - relative[0]
+  distance = math.hypot(dx, dy)
+  geometry = max(0.0, 1.0 - abs(math.atan2(dy, dx)) / MAXEYEANGLE)
+  if not EYEDISTANCERANGE[0] <= distance <= EYEDISTANCERANGE[1]:
+    geometry = 0.0
+  parts['geometry'] = geometry
+  
+  if prior is not None:
+    priorDistance = max(numpy.hypot(*(prior[1] - prior[0])), 1e-6)
+    deviation = numpy.sqrt(((relative - prior) ** 2).sum(axis=1)).max() / priorDistance
+    parts['prior'] = max(0.0, 1.0 - deviation / PRIORTOLERANCE)
+  
+  score = math.exp(sum(math.log(max(part, 1e-9)) for part in parts.values()) / len(parts))
+  return (score, parts)
+
+
+def eyeTileTransform(leftEye, rightEye, tileSize=TILESIZE):
+  """Returns 2x3 matrix of the rotation, scale and shift moving leftEye and rightEye onto their places in a tile"""
+  (width, height) = tileSize
+  source = complex(*leftEye)
+  target = complex(TILEEYEPOSITIONS[0] * width, height / 2.0)
+  
+  # as complex numbers the similarity transform is z -> k * z + t
+  k = (TILEEYEPOSITIONS[1] - TILEEYEPOSITIONS[0]) * width / ((complex(*rightEye) - source) or 1.0)
+  t = target - k * source
+  
+  return numpy.array([[k.real, -k.imag, t.real], [k.imag, k.real, t.imag]])
+
+
+def eyeTile(cvImage, leftEye, rightEye, label='', tileSize=TILESIZE):
+  """Returns tile of cvImage with leftEye and rightEye (pixel coordinates) aligned to the tile's crosshairs"""
+  (width, height) = tileSize
+  tile = cv2.warpAffine(cvImage, eyeTileTransform(leftEye, rightEye, tileSize), tileSize, 
+                        flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+  
+  # crosshairs with a gap, so the pupil under them stays visible, colors as in the detail view
+  arm = height // 8
+  for share, color in zip(TILEEYEPOSITIONS, [(125, 255, 125), (125, 125, 255)]):
+    (x, y) = (int(share * width), height // 2)
+    for (dx, dy) in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+      cv2.line(tile, (x + 3 * dx, y + 3 * dy), (x + arm * dx, y + arm * dy), color, 1, cv2.LINE_AA)
+  
+  if label:
+    cv2.putText(tile, label, (3, height - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.35, (0, 0, 0), 2, cv2.LINE_AA)
+    cv2.putText(tile, label, (3, height - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.35, (255, 255, 255), 1, cv2.LINE_AA)
+  
+  return tile
+
+
+class TileCache(object):
+  """Contact sheet tiles of EyePhotos, made from proxies on TILETHREADS threads and kept in memory.
+  
+  Tiles are keyed by file name and eye positions, so a corrected photo 
+  gets a new tile."""
+  
+  def __init__(self, proxies, catalog):
+    self.proxies = proxies
+    self.catalog = catalog
+    self.pool = ThreadPool(max(1, TILETHREADS))
+    # key -> tile or AsyncResult of tile being made
+    self.tiles = {}
+    self.lock = threading.Lock()
+  
+  @staticmethod
+  def key(photo):
+    return (photo.photoFileName, photo.lEyeX, photo.lEyeY, photo.rEyeX, photo.rEyeY)
+  
+  def makeTile(self, photo):
+    (scaledImage, scale, fullImage) = self.proxies.load(self.catalog[photo.photoFileName])
+    return eyeTile(scaledImage, (photo.lEyeX / scale, photo.lEyeY / scale), (photo.rEyeX / scale, photo.rEyeY / scale), 
+                   photo.photoFileName.rsplit('.', 1)[0])
+  
+  def prefetch(self, photos):
+    """Start making the tiles of photos not made yet"""
+    with self.lock:
+      for photo in photos:
+        key = self.key(photo)
+        if key not in self.tiles:
+          self.tiles[key] = self.pool.apply_async(self.makeTile, (photo,))
+  
+  def get(self, photos):
+    """Returns list of tiles of photos, made in parallel if needed"""
+    self.prefetch(photos)
+    with self.lock:
+      pending = [(self.key(photo), self.tiles[self.key(photo)]) for photo in photos]
+    
+    tiles = []
+    for key, tile in pending:
+      if not isinstance(tile, numpy.ndarray):
+        tile = tile.get()
+        with self.lock:
+          self.tiles[key] = tile
+      tiles.append(tile)
+    return tiles
+  
+  def retain(self, photos):
+    """Forget all tiles but those of photos (e.g. the pages around the one shown)"""
+    keys = set(self.key(photo) for photo in photos)
+    with self.lock:
+      for key in self.tiles.keys():
+        if key not in keys:
+          del self.tiles[key]
+  
+  def close(self):
+    self.pool.terminate()
+    self.tiles = {}
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import time
+
+# ELIME Project
+import HelperFunctions
+import ImageFunctions
+import OpenCvFunctions
+
+
+# the search space of the tuner
+TUNECASCADES = ['haarcascade_eye_tree_eyeglasses.xml', 'haarcascade_eye.xml']
+TUNESCALEFACTORS = [1.05, 1.1, 1.2, 1.3]
+TUNEMINNEIGHBORS = [2, 3, 5]
+TUNEMINSIZES = [10, 20, 30]
+TUNEMAXSIZES = [512, 768, 1024]
+
+# a detected eye counts as hit if it is at most this fraction of the distance 
+# between both (stored) eyes away from its stored position
+TUNEMAXERROR = 0.1
+
+# parameter sets accurate enough get timed afterwards, one at a time, on this 
+# many photos, taking the median of this many runs
+TUNETIMINGPHOTOS = 5
+TUNETIMINGRUNS = 3
+
+
+def eyeParameterSets():
+  """Returns list of all (cascade, scale_factor, min_neighbors, min_size) to try"""
+  return list(itertools.product(TUNECASCADES, TUNESCALEFACTORS, TUNEMINNEIGHBORS, TUNEMINSIZES))
+
+
+def isHit(eyeRects, scaledLeftEye, scaledRightEye):
+  """True if there are exactly two eyeRects, each close enough to the stored eye"""
+  if len(eyeRects) != 2:
+    return False
+  
+  maxError = TUNEMAXERROR * math.hypot(scaledRightEye[0] - scaledLeftEye[0], scaledRightEye[1] - scaledLeftEye[1])
+  
+  for eyeRect, (ex, ey) in zip(eyeRects, [scaledLeftEye, scaledRightEye]):
+    (mx, my) = HelperFunctions.middleOfRect(eyeRect)
+    if math.hypot(mx - ex, my - ey) > maxError:
+      return False
+  
+  return True
+  
+
+def loadPhoto(photoPath):
+  """Returns photo at photoPath as upright openCV image, None if it does not exist"""
+  if not os.path.exists(photoPath):
+    return None
+  
+  return ImageFunctions.convertPIL2CV(ImageFunctions.loadAndTransposePILImage(photoPath))
+
+
+def medianSeconds(function, runs):
+  """Returns median wall clock seconds of runs calls of function"""
+  times = []
+  for run in range(runs):
+    start = time.time()
+    function()
+    times.append(time.time() - start)
+  return sorted(times)[len(times) / 2]
+
+
+def eyeRectsWithParameters(scaledImage, faces, pyramid, (cascade, scale_factor, min_neighbors, min_size)):
+  """Returns eye rects found in faces of scaledImage with one eye parameter set"""
+  return OpenCvFunctions.eyeRectsInFaces(scaledImage, faces, pyramid=pyramid, haarcascades=[cascade], 
+                                         arguments=[(scale_factor, min_neighbors, 0, (min_size, min_size))])
+
+
+def tunePhoto((photoPath, leftEye, rightEye, maxSizes)):
+  """Try all parameter sets on one photo. 
+  
+  Returns {(maxSize, cascade, scale_factor, min_neighbors, min_size): hit} 
+  or None if the photo cannot be read. Runs in a worker process, timings 
+  here would depend on what the other workers do, timeParameterSets takes 
+  them afterwards."""
+  cvImage = loadPhoto(photoPath)
+  if cvImage is None:
+    return None
+  
+  results = {}
+  
+  for maxSize in maxSizes:
+    (scaledImage, scale) = ImageFunctions.scaleCVImage(cvImage, maxSize)
+    scaledLeftEye = (leftEye[0] / scale, leftEye[1] / scale)
+    scaledRightEye = (rightEye[0] / scale, rightEye[1] / scale)
+    
+    # face search is the same for all eye parameters
+    pyramid = OpenCvFunctions.DetectionPyramid(scaledImage)
+    faces = OpenCvFunctions.detectFacesInImage(scaledImage, False, pyramid)
+    
+    for eyeParameters in eyeParameterSets():
+      eyeRects = eyeRectsWithParameters(scaledImage, faces, pyramid, eyeParameters)
+      results[(maxSize,) + eyeParameters] = isHit(eyeRects, scaledLeftEye, scaledRightEye)
+    
+  return results
+
+
+def timeParameterSets(photoPaths, keys, runs=None):
+  """Returns {key: mean seconds per photo} of detection with parameter sets keys (maxSize, cascade, ...) on photoPaths.
+  
+  Runs serially in this process with no workers left, each time is the 
+  median of runs (TUNETIMINGRUNS) runs."""
+  runs = TUNETIMINGRUNS if runs is None else runs
+  seconds = dict((key, 0.0) for key in keys)
+  count = 0
+  
+  for photoPath in photoPaths:
+    cvImage = loadPhoto(photoPath)
+    if cvImage is None:
+      continue
+    count += 1
+    
+    for maxSize in sorted(set(key[0] for key in keys)):
+      (scaledImage, scale) = ImageFunctions.scaleCVImage(cvImage, maxSize)
+      
+      # face search is the same for all eye parameters, time it once per size
+      faceSeconds = medianSeconds(lambda: OpenCvFunctions.detectFacesInImage(scaledImage, False, OpenCvFunctions.DetectionPyramid(scaledImage)), runs)
+      pyramid = OpenCvFunctions.DetectionPyramid(scaledImage)
+      faces = OpenCvFunctions.detectFacesInImage(scaledImage, False, pyramid)
+      
+      for key in keys:
+        if key[0] == maxSize:
+          seconds[key] += faceSeconds + medianSeconds(lambda: eyeRectsWithParameters(scaledImage, faces, pyramid, key[1:]), runs)
+  
+  return dict((key, total / max(count, 1)) for (key, total) in seconds.items())
+
+
+def tuneDetection(srcPath, dbPhotos, maxDimension=1024, targetAccuracy=0.95, processes=None):
+  """Search detection parameters on dbPhotos (EyePhotos with stored eye positions).
+  
+  Returns the fastest parameter set reaching targetAccuracy (or the most accurate 
+  one, if none does) as dict, plus its accuracy and mean seconds per photo."""
+  logger = logging.getLogger('ELIME.TuneFunctions.tuneDetection')
+  
+  maxSizes = [size for size in TUNEMAXSIZES if size <= maxDimension]
+  if len(maxSizes) == 0:
+    maxSizes = [maxDimension]
+  
+  jobs = [(os.path.join(srcPath, photo.photoFileName), (photo.lEyeX, photo.lEyeY), (photo.rEyeX, photo.rEyeY), maxSizes) for photo in dbPhotos]
+  
+  logger.info("Trying %d parameter sets on %d photos", len(maxSizes) * len(eyeParameterSets()), len(jobs))
+  
+  pool = multiprocessing.Pool(processes)
+  try:
+    photoResults = []
+    for index, result in enumerate(pool.imap_unordered(tunePhoto, jobs)):
+      if result is None:
+        logger.warning("Could not read a photo, skipped")
+        continue
+      photoResults.append(result)
+      logger.info("Tuned on %d of %d photos", index + 1, len(jobs))
+  finally:
+    pool.close()
+    pool.join()
+  
+  if len(photoResults) == 0:
+    return None
+  
+  accuracies = {}
+  for key in photoResults[0]:
+    accuracies[key] = sum(1 for result in photoResults if result[key]) / float(len(photoResults))
+  
+  good = [key for key in accuracies if accuracies[key] >= targetAccuracy]
+  
+  if len(good) == 0:
+    logger.warning("No parameter set reaches accuracy %.2f, taking the fastest most accurate one", targetAccuracy)
+    good = [key for key in accuracies if accuracies[key] == max(accuracies.values())]
+  
+  # an even sample of the photos
+  timingPaths = [job[0] for job in jobs[::max(1, len(jobs) / TUNETIMINGPHOTOS)]][:TUNETIMINGPHOTOS]
+  logger.info("Timing %d parameter sets on %d photos, one at a time", len(good), len(timingPaths))
+  timings = timeParameterSets(timingPaths, good)
+  
+  key = min(good, key=lambda key: (timings[key], key))
+  (accuracy, seconds) = (accuracies[key], timings[key])
+  
+  (maxSize, cascade, scale_factor, min_neighbors, min_size) = key
+  
+  parameters = {'detectionMaxSize': maxSize, 'eyeCascade': cascade, 'eyeScaleFactor': scale_factor, 
+                'eyeMinNeighbors': min_neighbors, 'eyeMinSize': min_size}
+  
+  return (parameters, accuracy, seconds)
@@ -29,13 +29,39 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import sys
-import cv
+import time
+import cv2
 import logging
+import numpy
 
 # ELIME Project
 import HelperFunctions
 
 
+# seconds key presses queued up while drawing (held arrow keys) get handled for, before drawing again
+KEYREPEATCOALESCE = 0.05
+
+# window name -> (image, its copy shown with eye markers, rectangles of the markers)
+_overlays = {}
+
+# arrow keys as waitKey returns them
+UPKEY = 63232
+DOWNKEY = 63233
+LEFTKEY = 63234
+RIGHTKEY = 63235
+
+# full key codes of cv2.waitKeyEx for the arrow keys: Cocoa, GTK, Windows
+ARROWKEYS = {63232: UPKEY, 65362: UPKEY, 2490368: UPKEY, 
+             63233: DOWNKEY, 65364: DOWNKEY, 2621440: DOWNKEY, 
+             63234: LEFTKEY, 65361: LEFTKEY, 2424832: LEFTKEY, 
+             63235: RIGHTKEY, 65363: RIGHTKEY, 2555904: RIGHTKEY}
+
+
+def RGB(r, g, b):
+  """Returns openCV's BGR color tuple for r, g, b"""
+  return (b, g, r)
+
+
 def onMouseAllEyes(event,x,y,i,(fileName, cvImage, eyeCoordinates, selectedEye)):
   """Mouse callback for manually adjust all eyes"""
   
@@ -95,45 +121,76 @@ def onMouseAllEyes(event,x,y,i,(fileName, cvImage, eyeCoordinates, selectedEye))
     showEyesInImageFile(fileName, eyeCoordinates, cvImage, selectedEye)
     
 
-def showEyesInImageFile(fileName, eyeCoordinates, cvImage, selectedEye = []):
-  """Take opencvimage and eye positions and draw colored rectangles around eyes and present in window"""
-  copyImage = cv.CloneImage(cvImage)
+def waitKey(delay):
+  """Waits delay ms (0 forever) for a key, returns its code, UPKEY, DOWNKEY, LEFTKEY, RIGHTKEY or -1 if none.
+  
+  cv2.waitKey only returns the low byte of the key code, which no arrow key 
+  can be told by, hence cv2.waitKeyEx. GTK puts the modifier state above the 
+  lower 16 bits, these get dropped."""
+  key = cv2.waitKeyEx(delay)
+  
+  if key == -1:
+    return -1
+  
+  return ARROWKEYS.get(key, ARROWKEYS.get(key & 0xFFFF, key & 0xFFFF))
 
+
+def showEyesInImageFile(fileName, eyeCoordinates, cvImage, selectedEye = []):
+  """Take opencvimage and eye positions and draw colored rectangles around eyes and present in window.
+  
+  The window's image is kept, only the areas of the markers drawn last time 
+  get restored from cvImage before drawing the markers anew."""
+  (base, displayImage, dirtyRects) = _overlays.get(fileName, (None, None, []))
+  
+  if base is not cvImage:
+    displayImage = cvImage.copy()
+  else:
+    for (x0, y0, x1, y1) in dirtyRects:
+      displayImage[y0:y1, x0:x1] = cvImage[y0:y1, x0:x1]
+  
+  dirtyRects = []
+  
   if len(selectedEye):
     highlightIndex = selectedEye[0]
   else:
     highlightIndex = None
   
-  isize = cv.GetSize(cvImage)
+  isize = HelperFunctions.imageSize(cvImage)
   radius = int(max(10, 0.05 * max(isize[0], isize[1])))
   
-  for eye in eyeCoordinates:
+  for index, eye in enumerate(eyeCoordinates):
       (x, y) = eye
       
       #in the end:
       #natural right eye - index 0 - green
       #natural left eye - index 1 - red
       
-      color = cv.RGB(255, 0, 255) # bad magenta :-P
+      color = RGB(255, 0, 255) # bad magenta :-P
       
-      index = eyeCoordinates.index(eye)
       if index == highlightIndex:
-        color = cv.RGB(255, 200, 255) #highlight magenta
+        color = RGB(255, 200, 255) #highlight magenta
       
       if index == 0:
-        color = cv.RGB(0, 255, 0)
+        color = RGB(0, 255, 0)
         if highlightIndex == 0:
-          color = cv.RGB(200, 255, 200)
+          color = RGB(200, 255, 200)
       
       if index == 1:
-        color = cv.RGB(255, 0, 0)
+        color = RGB(255, 0, 0)
         if highlightIndex == 1:
-          color = cv.RGB(255, 200, 200)
+          color = RGB(255, 200, 200)
                      
-      cv.Circle(copyImage, (x, y), radius, color, 2)
-      cv.Line(copyImage, (x - 1, y), (x + 1, y), color, 1)
-      cv.Line(copyImage, (x, y - 1), (x, y + 1), color, 1)  
-  cv.ShowImage(fileName, copyImage)
+      cv2.circle(displayImage, (x, y), radius, color, 2)
+      cv2.line(displayImage, (x - 1, y), (x + 1, y), color, 1)
+      cv2.line(displayImage, (x, y - 1), (x, y + 1), color, 1)  
+      
+      # circle of thickness 2 reaches 1 pixel further, plus one for rounding
+      reach = radius + 2
+      dirtyRects.append((max(0, x - reach), max(0, y - reach), 
+                         max(0, min(isize[0], x + reach + 1)), max(0, min(isize[1], y + reach + 1))))
+  
+  _overlays[fileName] = (cvImage, displayImage, dirtyRects)
+  cv2.imshow(fileName, displayImage)
    
 
 def manuallyAdjustEyePositions(cvImage, fileName, eyeCoordinates):
@@ -147,8 +204,8 @@ def manuallyAdjustEyePositions(cvImage, fileName, eyeCoordinates):
   
   speed = 1
   
-  cv.NamedWindow(fileName, cv.CV_WINDOW_AUTOSIZE)
-  cv.SetMouseCallback(fileName, onMouseAllEyes, param=(fileName, cvImage, eyeCoordinates, selectedEye))
+  cv2.namedWindow(fileName, cv2.WINDOW_AUTOSIZE)
+  cv2.setMouseCallback(fileName, onMouseAllEyes, (fileName, cvImage, eyeCoordinates, selectedEye))
   
   while not exit:
     highEye = None
@@ -161,89 +218,95 @@ def manuallyAdjustEyePositions(cvImage, fileName, eyeCoordinates):
        selectedEye[0] = eyeCoordinates.index(highEye)
         
     showEyesInImageFile(fileName, eyeCoordinates, cvImage, selectedEye)
-    key = cv.WaitKey()
-        
-    if key == 63232: # up arrow
-      if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
-        eyeCoordinates[selectedEye[0]] = (eyeCoordinates[selectedEye[0]][0], eyeCoordinates[selectedEye[0]][1] - speed)
-    elif key == 63233: # down arrow
-      if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
-        eyeCoordinates[selectedEye[0]] = (eyeCoordinates[selectedEye[0]][0], eyeCoordinates[selectedEye[0]][1] + speed)
-    elif key == 63234: # left arrow
-      if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
-        eyeCoordinates[selectedEye[0]] = (eyeCoordinates[selectedEye[0]][0] - speed, eyeCoordinates[selectedEye[0]][1])
-    elif key == 63235: # right arrow
-      if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
-        eyeCoordinates[selectedEye[0]] = (eyeCoordinates[selectedEye[0]][0] + speed, eyeCoordinates[selectedEye[0]][1])
-  
-    elif key == 9: # 'TAB' - toggle selected eye 
-      if len(eyeCoordinates) > 0:
-        if len(selectedEye) == 0:
-          selectedEye.append(0)
-        elif (selectedEye[0] + 1) % len(eyeCoordinates) == 0:
-          selectedEye.pop()
+    key = waitKey(0)
+    
+    # handle key repeats queued up meanwhile (held arrow key) as well, then draw once
+    redrawTime = time.time() + KEYREPEATCOALESCE
+    while key != -1 and not exit:
+      if key == UPKEY: # up arrow
+        if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
+          eyeCoordinates[selectedEye[0]] = (eyeCoordinates[selectedEye[0]][0], eyeCoordinates[selectedEye[0]][1] - speed)
+      elif key == DOWNKEY: # down arrow
+        if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
+          eyeCoordinates[selectedEye[0]] = (eyeCoordinates[selectedEye[0]][0], eyeCoordinates[selectedEye[0]][1] + speed)
+      elif key == LEFTKEY: # left arrow
+        if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
+          eyeCoordinates[selectedEye[0]] = (eyeCoordinates[selectedEye[0]][0] - speed, eyeCoordinates[selectedEye[0]][1])
+      elif key == RIGHTKEY: # right arrow
+        if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
+          eyeCoordinates[selectedEye[0]] = (eyeCoordinates[selectedEye[0]][0] + speed, eyeCoordinates[selectedEye[0]][1])
+  
+      elif key == 9: # 'TAB' - toggle selected eye 
+        if len(eyeCoordinates) > 0:
+          if len(selectedEye) == 0:
+            selectedEye.append(0)
+          elif (selectedEye[0] + 1) % len(eyeCoordinates) == 0:
+            selectedEye.pop()
+          else:
+            selectedEye[0] = selectedEye[0] + 1
         else:
-          selectedEye[0] = selectedEye[0] + 1
-      else:
-        selectedEye = []
+          selectedEye = []
       
-      if len(selectedEye) == 0:
-        print "No eye selected"
-      else:
-        print "Selected Eye Index:", selectedEye[0]
+        if len(selectedEye) == 0:
+          print "No eye selected"
+        else:
+          print "Selected Eye Index:", selectedEye[0]
     
-    elif key == ord('c'): # create new eye
-      if len(eyeCoordinates) < 2:
-        width, height = cv.GetSize(cvImage)
+      elif key == ord('c'): # create new eye
+        if len(eyeCoordinates) < 2:
+          width, height = HelperFunctions.imageSize(cvImage)
         
-        y = int(height * 0.35)
+          y = int(height * 0.35)
         
-        if len(eyeCoordinates) == 1:
-          mx, my = eyeCoordinates[0]
+          if len(eyeCoordinates) == 1:
+            mx, my = eyeCoordinates[0]
           
-          x = int(width - mx)
-          y = my
+            x = int(width - mx)
+            y = my
           
-          if mx < width / 2:
-            # left eye is already here
-            insertIndex = 1
-          else:  
-            # right eye is already here
+            if mx < width / 2:
+              # left eye is already here
+              insertIndex = 1
+            else:  
+              # right eye is already here
+              insertIndex = 0
+          else:
+            x = int((width / 2.0) - (0.1 * width))
             insertIndex = 0
-        else:
-          x = int((width / 2.0) - (0.1 * width))
-          insertIndex = 0
         
-        eyeCoordinates.insert(insertIndex, (x, y))
-        if len(selectedEye):
-          selectedEye[0] = insertIndex
-        else:
-          selectedEye.append(insertIndex)
+          eyeCoordinates.insert(insertIndex, (x, y))
+          if len(selectedEye):
+            selectedEye[0] = insertIndex
+          else:
+            selectedEye.append(insertIndex)
         
-    elif key == ord('n') or key == 32: # or 'SPACE' - next picture
-      if len(eyeCoordinates) == 2:
-        exit = True
-      else:
-        print "You need exactly two eyes to continue"
+      elif key == ord('n') or key == 32: # or 'SPACE' - next picture
+        if len(eyeCoordinates) == 2:
+          exit = True
+        else:
+          print "You need exactly two eyes to continue"
         
-    elif key == 27: # 'ESC' - deselect eye
-      selectedEye = []
+      elif key == 27: # 'ESC' - deselect eye
+        selectedEye = []
       
-    elif key == ord('d') or key == ord('x'): # delete selected eye
-      if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
-        eyeCoordinates.pop(selectedEye[0])
-        selectedEye.pop()
+      elif key == ord('d') or key == ord('x'): # delete selected eye
+        if len(selectedEye) and selectedEye[0] < len(eyeCoordinates):
+          eyeCoordinates.pop(selectedEye[0])
+          selectedEye.pop()
         
-    elif key == ord('q'): # quit
-      sys.exit(0)
+      elif key == ord('q'): # quit
+        sys.exit(0)
       
-    elif key == ord('f'): # "fastness", speed
-      speed = (speed + 10) % 30
+      elif key == ord('f'): # "fastness", speed
+        speed = (speed + 10) % 30
        
-    else:
-      print key
+      else:
+        print key
+      
+      key = waitKey(1) if time.time() < redrawTime else -1
 
-  cv.DestroyWindow(fileName)
+  cv2.destroyWindow(fileName)
+  _overlays.pop(fileName, None)
   eyeCoordinates = sorted(eyeCoordinates, key=lambda pos: pos[0])
         
   return eyeCoordinates
@@ -262,102 +325,100 @@ def onMouseDetailEye(event,x,y,i,(windowName, cvImage, eyeIndex, eyePos, zoomSiz
     showDetailEyeInImageFile(windowName, eyePos[0], eyePos[1], manuallyDetailAdjustEyePosition.eyeSize, cvImage, eyeIndex, zoomSize, manuallyDetailAdjustEyePosition.crosshairStyle)
 
 
-def showDetailEyeInImageFile(windowName, eyecenterX, eyecenterY, eyeSize, cvImage, eyeIndex, zoomSize, crosshairstyle=0):
+# Crosshair styles of the detail view, 's' steps through them: (half length 
+# of cross lines in eye pixels, or as share of eyeSize, frame the eye pixel, 
+# circle radius as share of eyeSize), None for nothing
+CROSSHAIRSTYLES = [(1, None, False, None),
+                   (None, None, True, None),
+                   (None, 1 / 3.0, False, None)] + \
+                  [(None, None, True, share) for share in (0.05, 0.1, 0.15, 0.2, 0.25)] + \
+                  [(None, 1 / 3.0, False, share) for share in (0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35)] + \
+                  [(None, None, False, None)]
 
-  copyImage = cv.CloneImage(cvImage)
-  
+# fractional bits of coordinates when drawing, crosshairs sit between zoomed pixels
+DRAWSHIFT = 4
+
+# zoomed detail images by (zoomSize, channels, dtype), drawn into again and again
+_zoomBuffers = {}
+
+
+def subPixel(value):
+  """Returns value as fixed point int for drawing with shift DRAWSHIFT"""
+  return int(round(value * (1 << DRAWSHIFT)))
+
+
+def zoomedRegion(cvImage, x0, y0, size, zoomSize):
+  """Returns the size x size region at x0, y0 of cvImage (black outside) resized to zoomSize x zoomSize.
+  
+  Only the region gets read, the result is a buffer reused by the next call."""
+  (height, width) = cvImage.shape[:2]
+  region = cvImage[max(0, y0):max(0, min(height, y0 + size)), max(0, x0):max(0, min(width, x0 + size))]
+  
+  key = (zoomSize, cvImage.shape[2:], cvImage.dtype.str)
+  zoomed = _zoomBuffers.get(key)
+  if zoomed is None:
+    zoomed = _zoomBuffers[key] = numpy.zeros((zoomSize, zoomSize) + cvImage.shape[2:], cvImage.dtype)
+  
+  if region.size == 0:
+    zoomed[:] = 0
+    return zoomed
+  
+  if region.shape[:2] != (size, size):
+    # eye near the border
+    top = max(0, -y0)
+    left = max(0, -x0)
+    region = cv2.copyMakeBorder(region, top, size - top - region.shape[0], left, size - left - region.shape[1], 
+                                cv2.BORDER_CONSTANT, value=0)
+  
+  cv2.resize(region, (zoomSize, zoomSize), dst=zoomed)
+  return zoomed
+
+
+def showDetailEyeInImageFile(windowName, eyecenterX, eyecenterY, eyeSize, cvImage, eyeIndex, zoomSize, crosshairstyle=0):
+  """Show eyeSize pixels around the eye center zoomed to zoomSize with crosshair drawn onto the zoomed pixels"""
   #natural right eye - index 0 - green
   #natural left eye - index 1 - red
   
   if eyeIndex == 0:
-    color = cv.RGB(125, 255, 125)  
+    color = RGB(125, 255, 125)  
   else:
-    color = cv.RGB(255, 125, 125)
+    color = RGB(255, 125, 125)
   
-  if crosshairstyle == 0:
-    cv.Line(copyImage, (eyecenterX - 1, eyecenterY), (eyecenterX + 1, eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - 1), (eyecenterX, eyecenterY + 1), color, 1)
+  x0 = int(eyecenterX - eyeSize/2.0)
+  y0 = int(eyecenterY - eyeSize/2.0)
+  zoomedImage = zoomedRegion(cvImage, x0, y0, eyeSize, zoomSize)
   
-  elif crosshairstyle == 1:
-    cv.Line(copyImage, (eyecenterX, eyecenterY), (eyecenterX, eyecenterY), color, 1)
-    
-  elif crosshairstyle == 2:
-    cv.Line(copyImage, (eyecenterX - int(eyeSize / 3.0), eyecenterY), (eyecenterX + int(eyeSize / 3.0), eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - int(eyeSize / 3.0)), (eyecenterX, eyecenterY + int(eyeSize / 3.0)), color, 1)
-    
-  elif crosshairstyle == 3:
-    cv.Line(copyImage, (eyecenterX, eyecenterY), (eyecenterX, eyecenterY), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.05), color, 1)
-  
-  elif crosshairstyle == 4:
-    cv.Line(copyImage, (eyecenterX, eyecenterY), (eyecenterX, eyecenterY), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.1), color, 1)
-  
-  elif crosshairstyle == 5:
-    cv.Line(copyImage, (eyecenterX, eyecenterY), (eyecenterX, eyecenterY), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.15), color, 1)
-  
-  elif crosshairstyle == 6:
-    cv.Line(copyImage, (eyecenterX, eyecenterY), (eyecenterX, eyecenterY), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.2), color, 1)
-  
-  elif crosshairstyle == 7:
-    cv.Line(copyImage, (eyecenterX, eyecenterY), (eyecenterX, eyecenterY), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.25), color, 1)
-  
-  elif crosshairstyle == 8:
-    cv.Line(copyImage, (eyecenterX - int(eyeSize / 3.0), eyecenterY), (eyecenterX + int(eyeSize / 3.0), eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - int(eyeSize / 3.0)), (eyecenterX, eyecenterY + int(eyeSize / 3.0)), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.05), color, 1)
-    
-  elif crosshairstyle == 9:
-    cv.Line(copyImage, (eyecenterX - int(eyeSize / 3.0), eyecenterY), (eyecenterX + int(eyeSize / 3.0), eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - int(eyeSize / 3.0)), (eyecenterX, eyecenterY + int(eyeSize / 3.0)), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.1), color, 1)
-    
-  elif crosshairstyle == 10:
-    cv.Line(copyImage, (eyecenterX - int(eyeSize / 3.0), eyecenterY), (eyecenterX + int(eyeSize / 3.0), eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - int(eyeSize / 3.0)), (eyecenterX, eyecenterY + int(eyeSize / 3.0)), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.15), color, 1)
-  
-  elif crosshairstyle == 11:
-    cv.Line(copyImage, (eyecenterX - int(eyeSize / 3.0), eyecenterY), (eyecenterX + int(eyeSize / 3.0), eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - int(eyeSize / 3.0)), (eyecenterX, eyecenterY + int(eyeSize / 3.0)), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.2), color, 1)
-    
-  elif crosshairstyle == 12:
-    cv.Line(copyImage, (eyecenterX - int(eyeSize / 3.0), eyecenterY), (eyecenterX + int(eyeSize / 3.0), eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - int(eyeSize / 3.0)), (eyecenterX, eyecenterY + int(eyeSize / 3.0)), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.25), color, 1)
-    
-  elif crosshairstyle == 13:
-    cv.Line(copyImage, (eyecenterX - int(eyeSize / 3.0), eyecenterY), (eyecenterX + int(eyeSize / 3.0), eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - int(eyeSize / 3.0)), (eyecenterX, eyecenterY + int(eyeSize / 3.0)), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.3), color, 1)
-    
-  elif crosshairstyle == 14:
-    cv.Line(copyImage, (eyecenterX - int(eyeSize / 3.0), eyecenterY), (eyecenterX + int(eyeSize / 3.0), eyecenterY), color, 1)
-    cv.Line(copyImage, (eyecenterX, eyecenterY - int(eyeSize / 3.0)), (eyecenterX, eyecenterY + int(eyeSize / 3.0)), color, 1)
-    cv.Circle(copyImage, (eyecenterX, eyecenterY), int(eyeSize * 0.35), color, 1)
-    
-  elif crosshairstyle == 15:
-    pass
-     
-  croppedImage = cv.CreateImage((eyeSize, eyeSize), cvImage.depth, cvImage.nChannels)
-  src_region = cv.GetSubRect(copyImage, (int(eyecenterX - eyeSize/2.0), int(eyecenterY - eyeSize/2.0), eyeSize, eyeSize))
-  cv.Copy(src_region, croppedImage)
-  
-  zommedImage = cv.CreateImage((zoomSize, zoomSize), cvImage.depth, cvImage.nChannels)
-  cv.Resize(croppedImage, zommedImage)
-   
-  cv.ShowImage(windowName, zommedImage) 
+  # one eye pixel becomes zoom x zoom pixels, (cx, cy) is the eye pixel's center
+  zoom = zoomSize / float(eyeSize)
+  (cx, cy) = ((eyecenterX - x0 + 0.5) * zoom, (eyecenterY - y0 + 0.5) * zoom)
+  
+  (crossPixels, crossShare, framePixel, circleShare) = CROSSHAIRSTYLES[crosshairstyle]
+  
+  if crossShare is not None:
+    crossPixels = int(eyeSize * crossShare)
+  
+  if crossPixels:
+    cv2.line(zoomedImage, (subPixel(cx - crossPixels * zoom), subPixel(cy)), (subPixel(cx + crossPixels * zoom), subPixel(cy)), 
+             color, 1, cv2.LINE_AA, DRAWSHIFT)
+    cv2.line(zoomedImage, (subPixel(cx), subPixel(cy - crossPixels * zoom)), (subPixel(cx), subPixel(cy + crossPixels * zoom)), 
+             color, 1, cv2.LINE_AA, DRAWSHIFT)
+  
+  if framePixel:
+    cv2.rectangle(zoomedImage, (subPixel(cx - zoom / 2.0), subPixel(cy - zoom / 2.0)), (subPixel(cx + zoom / 2.0), subPixel(cy + zoom / 2.0)), 
+                  color, 1, cv2.LINE_AA, DRAWSHIFT)
+  
+  if circleShare is not None:
+    cv2.circle(zoomedImage, (subPixel(cx), subPixel(cy)), subPixel(int(eyeSize * circleShare) * zoom), 
+               color, 1, cv2.LINE_AA, DRAWSHIFT)
+  
+  cv2.imshow(windowName, zoomedImage) 
   
  
 def manuallyDetailAdjustEyePosition(inputImageFileName, eyeIndex, cvImage, eyecenterX, eyecenterY, zoomSize):
   if not hasattr(manuallyDetailAdjustEyePosition, "crosshairStyle"):
     manuallyDetailAdjustEyePosition.crosshairStyle = 0
   if not hasattr(manuallyDetailAdjustEyePosition, "eyeSize"):
-    isize = cv.GetSize(cvImage)
+    isize = HelperFunctions.imageSize(cvImage)
     esize = int(max(20, 0.10 * max(isize[0], isize[1])))
     manuallyDetailAdjustEyePosition.eyeSize = esize
     
@@ -369,27 +430,27 @@ def manuallyDetailAdjustEyePosition(inputImageFileName, eyeIndex, cvImage, eyece
   speed = 1
   exit = False
   
-  width, height = cv.GetSize(cvImage)
+  width, height = HelperFunctions.imageSize(cvImage)
   
   eyePos = [eyecenterX, eyecenterY]
     
-  cv.NamedWindow(windowName, cv.CV_WINDOW_AUTOSIZE)
-  cv.SetMouseCallback(windowName, onMouseDetailEye, param=(windowName, cvImage, eyeIndex, eyePos, zoomSize))
+  cv2.namedWindow(windowName, cv2.WINDOW_AUTOSIZE)
+  cv2.setMouseCallback(windowName, onMouseDetailEye, (windowName, cvImage, eyeIndex, eyePos, zoomSize))
   
   while not exit:
     showDetailEyeInImageFile(windowName, eyePos[0], eyePos[1], manuallyDetailAdjustEyePosition.eyeSize, cvImage, eyeIndex, zoomSize, manuallyDetailAdjustEyePosition.crosshairStyle)
-    key = cv.WaitKey()
+    key = waitKey(0)
         
-    if key == 63232: # up arrow
+    if key == UPKEY: # up arrow
       if eyePos[1] - int(manuallyDetailAdjustEyePosition.eyeSize/2.0) >= speed:
         eyePos[1] = eyePos[1] - speed
-    elif key == 63233: # down arrow
+    elif key == DOWNKEY: # down arrow
       if eyePos[1] + int(manuallyDetailAdjustEyePosition.eyeSize/2.0) <= height - speed:
         eyePos[1] = eyePos[1] + speed
-    elif key == 63234: # left arrow
+    elif key == LEFTKEY: # left arrow
       if eyePos[0] - int(manuallyDetailAdjustEyePosition.eyeSize/2.0) >= speed:
         eyePos[0] = eyePos[0] - speed
-    elif key == 63235: # right arrow
+    elif key == RIGHTKEY: # right arrow
       if eyePos[0] + int(manuallyDetailAdjustEyePosition.eyeSize/2.0) <= width - speed:
         eyePos[0] = eyePos[0] + speed
       
@@ -403,8 +464,7 @@ def manuallyDetailAdjustEyePosition(inputImageFileName, eyeIndex, cvImage, eyece
       speed = (speed + 5) % 10
   
     elif key == ord('s'): # change crosshair style
-      NUMBEROFSTYLESAVAILABLE = 16
-      manuallyDetailAdjustEyePosition.crosshairStyle = (manuallyDetailAdjustEyePosition.crosshairStyle + 1) % NUMBEROFSTYLESAVAILABLE
+      manuallyDetailAdjustEyePosition.crosshairStyle = (manuallyDetailAdjustEyePosition.crosshairStyle + 1) % len(CROSSHAIRSTYLES)
       
     elif key == ord('+'):
       if manuallyDetailAdjustEyePosition.eyeSize > 5:
@@ -421,20 +481,73 @@ def manuallyDetailAdjustEyePosition(inputImageFileName, eyeIndex, cvImage, eyece
     else:
       print key
   
-  cv.DestroyWindow(windowName)
+  cv2.destroyWindow(windowName)
   return (eyePos[0], eyePos[1]) 
   
   
+def onMouseContactSheet(event,x,y,i,(tileSize, columns, numberOfTiles, clicked)):
+  """Mouse callback of contact sheet, remembers index of the tile clicked"""
+  if event == 4:
+    index = (y // tileSize[1]) * columns + x // tileSize[0]
+    if x < columns * tileSize[0] and index < numberOfTiles:
+      clicked.append(index)
+
+
+def contactSheet(tiles, tileSize, columns):
+  """Returns image of tiles laid out in rows of columns, one pixel apart"""
+  (width, height) = tileSize
+  rows = max(1, (len(tiles) + columns - 1) // columns)
+  sheet = numpy.full((rows * (height + 1) - 1, columns * (width + 1) - 1, 3), 64, numpy.uint8)
+  
+  for index, tile in enumerate(tiles):
+    (row, column) = divmod(index, columns)
+    sheet[row * (height + 1):row * (height + 1) + height, column * (width + 1):column * (width + 1) + width] = tile
+  
+  return sheet
+
+
+def chooseContactSheetTile(windowName, tiles, tileSize, columns):
+  """UI showing tiles as contact sheet, returns ('open', tile index) if a tile got clicked, 
+  ('next', None) or ('previous', None) to page"""
+  sheet = contactSheet(tiles, tileSize, columns)
+  # tiles are one pixel apart
+  cellSize = (tileSize[0] + 1, tileSize[1] + 1)
+  clicked = []
+  
+  cv2.namedWindow(windowName, cv2.WINDOW_AUTOSIZE)
+  cv2.setMouseCallback(windowName, onMouseContactSheet, (cellSize, columns, len(tiles), clicked))
+  cv2.imshow(windowName, sheet)
+  
+  while True:
+    # clicks only show up in the callback, look for them now and then
+    key = waitKey(50)
+    
+    if clicked:
+      return ('open', clicked[0])
+    
+    if key == ord('n') or key == 32 or key == RIGHTKEY: # or 'SPACE' or right arrow - next page
+      return ('next', None)
+    
+    elif key == ord('p') or key == LEFTKEY: # or left arrow - previous page
+      return ('previous', None)
+    
+    elif key == ord('q'): # quit
+      sys.exit(0)
+    
+    elif key != -1:
+      print key
+
+
 def displayColoredRects(cvImage, fileName, rectsAndColor):
   """Draws supplied colored rectangles on supplied cvImage"""
-  cv.NamedWindow(fileName, cv.CV_WINDOW_AUTOSIZE)
+  cv2.namedWindow(fileName, cv2.WINDOW_AUTOSIZE)
 
-  copyImage = cv.CloneImage(cvImage)
+  copyImage = cvImage.copy()
 
   for rect, color in rectsAndColor:
     (x, y, w, h) = rect
-    cv.Rectangle(copyImage, (x, y) , (x + w, y + h), color, 2)
+    cv2.rectangle(copyImage, (x, y) , (x + w, y + h), color, 2)
   
-  cv.ShowImage(fileName, copyImage)
-  key = cv.WaitKey()
-  cv.DestroyWindow(fileName)
\ No newline at end of file
+  cv2.imshow(fileName, copyImage)
+  key = waitKey(0)
+  cv2.destroyWindow(fileName)
\ No newline at end of file
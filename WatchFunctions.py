@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014, Christoph Stahl
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+# ELIME Project
+import HelperFunctions
+
+# seconds a photo file must stay untouched after being written before it gets ingested
+WATCHSETTLESECONDS = 2.0
+
+# inotify event bits, see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+# a write finished (or a file got moved in), the photo might be complete now
+INREADYEVENTS = IN_CLOSE_WRITE | IN_MOVED_TO
+# the photo is written to (again), wait longer
+INBUSYEVENTS = IN_MODIFY | IN_OPEN
+# the photo is gone
+INGONEEVENTS = IN_MOVED_FROM | IN_DELETE
+
+# struct inotify_event without its name: wd, mask, cookie, len
+INOTIFYEVENT = struct.Struct('iIII')
+
+_libc = None
+
+
+def libc():
+  """Returns the C library with inotify functions, None if there is none (not Linux)"""
+  global _libc
+  if _libc is None:
+    try:
+      lib = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+      lib.inotify_init1
+    except (OSError, AttributeError):
+      lib = False
+    _libc = lib
+  return _libc or None
+
+
+def inotifyAvailable():
+  """Returns True if folders can be watched here"""
+  return libc() is not None
+
+
+class FolderWatcher(object):
+  """Watches one folder with inotify and hands out photo file names once they are written completely.
+  
+  A photo counts as complete WATCHSETTLESECONDS after its last close 
+  after writing (or move into the folder), if it was not written to 
+  since and its size did not change. Waiting blocks in select, there 
+  is no polling while nothing happens."""
+  
+  def __init__(self, path):
+    lib = libc()
+    if lib is None:
+      raise OSError(errno.ENOSYS, 'inotify is not available on this system')
+    
+    self.path = path
+    self.fd = lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self.fd < 0:
+      e = ctypes.get_errno()
+      raise OSError(e, os.strerror(e))
+    
+    mask = INREADYEVENTS | INBUSYEVENTS | INGONEEVENTS | IN_DELETE_SELF
+    if lib.inotify_add_watch(self.fd, path.encode('utf-8') if isinstance(path, unicode) else path, mask) < 0:
+      e = ctypes.get_errno()
+      os.close(self.fd)
+      raise OSError(e, os.strerror(e), path)
+    
+    # photo file name -> (time it settles, size when last seen)
+    self.pending = {}
+    self.overflowed = False
+  
+  def close(self):
+    """Stop watching"""
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
+  
+  def __enter__(self):
+    return self
+  
+  def __exit__(self, *excInfo):
+    self.close()
+  
+  def readEvents(self):
+    """Returns list of (mask, name) of all queued events"""
+    events = []
+    while True:
+      try:
+        data = os.read(self.fd, 64 * 1024)
+      except OSError as e:
+        if e.errno == errno.EAGAIN:
+          return events
+        raise
+      
+      offset = 0
+      while offset < len(data):
+        (wd, mask, cookie, length) = INOTIFYEVENT.unpack_from(data, offset)
+        offset += INOTIFYEVENT.size
+        name = data[offset:offset + length].rstrip('\0')
+        offset += length
+        events.append((mask, name))
+  
+  def handleEvent(self, mask, name, now):
+    """Update pending photos with one event"""
+    logger = logging.getLogger('ELIME.FolderWatcher')
+    
+    if mask & IN_Q_OVERFLOW:
+      # events got lost, look at the whole folder again
+      logger.warning("Too many events in %s, rescanning", self.path)
+      self.overflowed = True
+      return
+    
+    if mask & (IN_DELETE_SELF | IN_IGNORED):
+      raise OSError(errno.ENOENT, 'Watched folder is gone', self.path)
+    
+    if not name or not HelperFunctions.filefilter(name):
+      return
+    
+    if mask & INGONEEVENTS:
+      self.pending.pop(name, None)
+    elif mask & INREADYEVENTS:
+      self.pending[name] = (now + WATCHSETTLESECONDS, self.fileSize(name))
+    elif mask & INBUSYEVENTS and name in self.pending:
+      self.pending[name] = (now + WATCHSETTLESECONDS, self.pending[name][1])
+  
+  def fileSize(self, name):
+    """Returns size of file name in watched folder, None if it is gone"""
+    try:
+      return os.path.getsize(os.path.join(self.path, name))
+    except OSError:
+      return None
+  
+  def settledPhotos(self, now):
+    """Returns names of pending photos that settled at time now, rearms those still growing"""
+    settled = []
+    
+    for name, (settleTime, size) in self.pending.items():
+      if settleTime > now:
+        continue
+      
+      currentSize = self.fileSize(name)
+      if currentSize is None:
+        del self.pending[name]
+        continue
+      
+      if currentSize != size:
+        # still changing, e.g. written without closing in between
+        self.pending[name] = (now + WATCHSETTLESECONDS, currentSize)
+      else:
+        del self.pending[name]
+        settled.append(name)
+    
+    return sorted(settled)
+  
+  def waitForPhotos(self):
+    """Blocks until photos are complete and returns their names, all photos of the folder after lost events"""
+    while True:
+      now = time.time()
+      
+      if self.overflowed:
+        self.overflowed = False
+        for (name, size, mtime) in HelperFunctions.scanPhotoFolder(self.path):
+          self.pending.setdefault(name, (now + WATCHSETTLESECONDS, size))
+      
+      settled = self.settledPhotos(now)
+      if settled:
+        return settled
+      
+      timeout = None
+      if self.pending:
+        timeout = max(0.0, min(settleTime for (settleTime, size) in self.pending.values()) - now)
+      
+      try:
+        select.select([self.fd], [], [], timeout)
+      except select.error as e:
+        if e.args[0] != errno.EINTR:
+          raise
+      
+      now = time.time()
+      for (mask, name) in self.readEvents():
+        self.handleEvent(mask, name, now)